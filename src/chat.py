@@ -1,13 +1,278 @@
 import os
-import yaml
-import base64
-import requests
+import json
+import time
+import random
+import functools
+import threading
+import importlib.util
+import weakref
 from pathlib import Path
 from abc import ABC, abstractmethod
 
-# 설정 로드
-with open(Path(__file__).parent.parent / ".config.yaml") as f:
-    config = yaml.safe_load(f)
+# requests / httpx / asyncio / yaml은 첫 사용 때 import한다. 이 모듈을 import만 하는 스크립트
+# (term.py, write_term.py, CLI --help 등)의 콜드 스타트를 줄이기 위해서다.
+HAS_HTTPX = importlib.util.find_spec("httpx") is not None
+HAS_H2 = importlib.util.find_spec("h2") is not None  # httpx의 HTTP/2 지원에 필요
+
+CONFIG_PATH = Path(os.environ.get("LLM_CONFIG_PATH") or Path(__file__).parent.parent / ".config.yaml")
+
+
+@functools.lru_cache(maxsize=1)
+def load_config() -> dict:
+    """.config.yaml을 처음 필요할 때 한 번만 읽어 캐시한다.
+
+    파일이 없으면 빈 설정을 돌려준다. 키가 필요한 프로바이더는 import가 아니라 생성 시점에 실패한다.
+    LLM_CONFIG_PATH 환경 변수로 다른 파일을 쓸 수 있다.
+    """
+    try:
+        with open(CONFIG_PATH) as f:
+            text = f.read()
+    except FileNotFoundError:
+        print(f"[config] {CONFIG_PATH} 없음: 빈 설정으로 진행합니다.")
+        return {}
+    import yaml
+
+    return yaml.safe_load(text) or {}
+
+
+def config_value(*keys, default=None):
+    """중첩 설정값을 꺼낸다. 예: config_value("api", "aistudio", "key")"""
+    node = load_config()
+    for key in keys:
+        if not isinstance(node, dict) or key not in node:
+            return default
+        node = node[key]
+    return node
+
+
+def __getattr__(name):
+    # 예전 코드의 chat.config 접근을 지연 로딩으로 유지한다
+    if name == "config":
+        return load_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _HTTPSettings(dict):
+    """처음 조회할 때 .config.yaml의 http 섹션을 기본값 위에 덮어쓰는 설정 dict"""
+
+    def __init__(self, defaults: dict):
+        super().__init__(defaults)
+        self._loaded = False
+
+    def _load(self):
+        if not self._loaded:
+            self._loaded = True
+            super().update(config_value("http", default=None) or {})
+
+    def __getitem__(self, key):
+        self._load()
+        return super().__getitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._load()  # configure_http()로 준 값이 나중에 파일 값으로 덮이지 않게 먼저 읽는다
+        super().update(*args, **kwargs)
+
+
+# HTTP 커넥션 풀 설정 (.config.yaml의 http 섹션으로 덮어쓸 수 있다)
+HTTP_SETTINGS = _HTTPSettings({
+    "pool_connections": 10,   # 호스트별로 유지할 커넥션 풀 개수
+    "pool_maxsize": 64,       # 풀 하나당 최대 커넥션 수 (= 동시 요청 상한)
+    "timeout": 60.0,          # 요청 타임아웃(초)
+})
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()  # 이벤트 루프별 httpx.AsyncClient
+
+
+def _close_async_client(loop, client) -> None:
+    """AsyncClient는 자기 이벤트 루프에서만 닫을 수 있다. 이미 닫힌 루프의 클라이언트는 닫을 방법이 없어 버린다."""
+    import asyncio
+
+    if loop.is_closed():
+        return
+    if loop.is_running():
+        # 호출한 곳이 그 루프 안이든 다른 스레드든 루프에 예약만 하고 기다리지 않는다
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    else:
+        try:
+            loop.run_until_complete(client.aclose())
+        except RuntimeError:
+            pass  # 이 스레드에서 다른 루프가 돌고 있으면 멈춰 있는 루프를 돌릴 수 없다
+
+
+def configure_http(**settings) -> None:
+    """커넥션 풀 크기·타임아웃을 바꾼다. 이미 만든 세션/클라이언트는 닫고 다음 요청부터 새로 만든다.
+
+    비동기 클라이언트는 각자의 이벤트 루프에서 닫히므로 그 루프에서 진행 중인 요청은 실패할 수 있다.
+
+    Args:
+        pool_connections: 호스트별 커넥션 풀 개수
+        pool_maxsize: 풀 하나당 최대 커넥션 수
+        timeout: 요청 타임아웃(초)
+    """
+    global _SESSION
+    HTTP_SETTINGS.update(settings)
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            _SESSION.close()
+        _SESSION = None
+    clients = list(_ASYNC_CLIENTS.items())
+    _ASYNC_CLIENTS.clear()
+    for loop, client in clients:
+        _close_async_client(loop, client)
+
+
+def get_session() -> "requests.Session":
+    """모든 프로바이더가 공유하는 keep-alive requests.Session을 반환한다.
+
+    요청마다 TCP+TLS 핸드셰이크를 새로 하지 않도록 커넥션 풀을 재사용한다.
+    """
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_SETTINGS["pool_connections"],
+                    pool_maxsize=HTTP_SETTINGS["pool_maxsize"],
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSION = session
+    return _SESSION
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """현재 이벤트 루프에서 공유할 httpx.AsyncClient를 반환한다.
+
+    h2 패키지가 있으면 HTTP/2로 커넥션 하나에 요청을 다중화한다.
+    비동기 커넥션은 이벤트 루프에 묶이므로 루프마다 클라이언트를 따로 둔다.
+    """
+    if not HAS_HTTPX:
+        raise ImportError("achat()에는 httpx가 필요합니다: pip install httpx[http2]")
+    import asyncio
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            http2=HAS_H2,
+            timeout=HTTP_SETTINGS["timeout"],
+            limits=httpx.Limits(
+                max_connections=HTTP_SETTINGS["pool_maxsize"],
+                max_keepalive_connections=HTTP_SETTINGS["pool_maxsize"],
+            ),
+        )
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+async def aclose_http() -> None:
+    """현재 이벤트 루프의 비동기 클라이언트를 닫는다. asyncio.run() 끝에서 호출한다."""
+    import asyncio
+
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# 재시도할 HTTP 상태 코드 (레이트 리밋 + 일시적 서버 오류)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class ChatHTTPError(Exception):
+    """프로바이더가 429/5xx를 돌려준 경우. retry_after는 Retry-After 헤더(초)"""
+
+    def __init__(self, status: int, body: str = "", retry_after: float | None = None):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _raise_for_retryable(status: int, headers, text: str) -> None:
+    if status in RETRYABLE_STATUS:
+        retry_after = headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        raise ChatHTTPError(status, text, retry_after)
+
+
+def _json_request(payload: dict, headers: dict | None = None, asynchronous: bool = False) -> tuple:
+    """payload를 (요청 본문, 헤더)로 만든다.
+
+    vision 이미지(llm_vision.Base64Blob)가 들어 있으면 본문은 보내는 동안 base64를 인코딩하는
+    StreamingJSONBody가 되고 Content-Length를 미리 단다. httpx AsyncClient에는 async iterator를 넘긴다.
+    """
+    from src.llm_vision import json_body
+
+    body = json_body(payload)
+    headers = {"Content-Type": "application/json", **(headers or {})}
+    if not isinstance(body, bytes):
+        headers["Content-Length"] = str(len(body))
+        if asynchronous:
+            body = body.aiter()
+    return body, headers
+
+
+def _parse_sse_line(line: str):
+    """SSE 한 줄에서 data JSON을 꺼낸다. 주석·빈 줄·[DONE]은 None."""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if not data or data == "[DONE]":
+        return None
+    return json.loads(data)
+
+
+class StreamStats:
+    """스트리밍 응답 지표: 첫 토큰까지 걸린 시간(TTFT)과 초당 토큰 수"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished = None
+        self.chunks = 0
+        self.completion_tokens = None  # 프로바이더가 usage를 알려주면 채운다
+
+    def on_delta(self, delta: str, tokens: int | None = None) -> None:
+        if delta and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if delta:
+            self.chunks += 1
+        if tokens is not None:
+            self.completion_tokens = tokens
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    @property
+    def ttft(self) -> float | None:
+        """요청 시작부터 첫 델타까지 걸린 시간(초)"""
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+    @property
+    def tokens_per_s(self) -> float | None:
+        """첫 델타 이후 생성 속도. usage가 없으면 델타 개수로 근사한다."""
+        if self.first_token_at is None or self.finished is None:
+            return None
+        elapsed = self.finished - self.first_token_at
+        tokens = self.completion_tokens or self.chunks
+        return tokens / elapsed if elapsed > 0 else None
+
+    def __repr__(self):
+        ttft = f"{self.ttft:.3f}s" if self.ttft is not None else "-"
+        tps = f"{self.tokens_per_s:.1f}" if self.tokens_per_s is not None else "-"
+        return f"StreamStats(ttft={ttft}, tokens/s={tps}, chunks={self.chunks})"
+
+
+_USAGE_LOCK = threading.Lock()
 
 
 class BaseChatAPI(ABC):
@@ -29,6 +294,13 @@ class BaseChatAPI(ABC):
         """사용 가능한 모델 목록 반환"""
         pass
 
+    def models_if_changed(self, etag: str | None = None) -> tuple[list | None, str | None]:
+        """모델 목록이 etag 이후 바뀌었을 때만 (목록, 새 ETag)를, 그대로면 (None, etag)를 돌려준다.
+
+        조건부 요청을 지원하지 않는 provider는 매번 전체 목록을 받는다.
+        """
+        return self.models(), None
+
     def model_price(self, model: str) -> str:
         """특정 모델의 가격 정보 반환"""
         return self.MODEL_PRICES.get(model, "모델 가격 정보가 없습니다.")
@@ -45,26 +317,225 @@ class BaseChatAPI(ABC):
         """
         pass
 
-    def vision(self, model: str, prompt: str, images: list) -> str:
-        """이미지 + 텍스트 채팅 (표준 OpenAI 호환 형식)"""
-        def to_b64(path_or_bytes):
-            if isinstance(path_or_bytes, (str, Path)):
-                with open(path_or_bytes, "rb") as f:
-                    data = f.read()
-            else:
-                data = path_or_bytes
-            return base64.b64encode(data).decode()
+    @property
+    def session(self) -> "requests.Session":
+        """프로바이더 공통 커넥션 풀 세션"""
+        return get_session()
+
+    def _get_json(self, url: str, **kwargs) -> dict:
+        kwargs.setdefault("timeout", HTTP_SETTINGS["timeout"])
+        return self.session.get(url, **kwargs).json()
+
+    def _get_json_if_changed(self, url: str, etag: str | None = None, **kwargs) -> tuple[dict | None, str | None]:
+        """If-None-Match 조건부 GET. 304면 (None, etag), 아니면 (본문, 새 ETag)를 돌려준다."""
+        kwargs.setdefault("timeout", HTTP_SETTINGS["timeout"])
+        headers = dict(kwargs.pop("headers", None) or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        r = self.session.get(url, headers=headers, **kwargs)
+        if r.status_code == 304:
+            return None, etag
+        _raise_for_retryable(r.status_code, r.headers, r.text)
+        return r.json(), r.headers.get("ETag")
+
+    def _post_json(self, url: str, payload: dict, headers: dict | None = None) -> dict:
+        body, headers = _json_request(payload, headers)
+        r = self.session.post(url, data=body, headers=headers, timeout=HTTP_SETTINGS["timeout"])
+        _raise_for_retryable(r.status_code, r.headers, r.text)
+        return r.json()
+
+    async def _apost_json(self, url: str, payload: dict, headers: dict | None = None) -> dict:
+        body, headers = _json_request(payload, headers, asynchronous=True)
+        r = await get_async_client().post(url, content=body, headers=headers)
+        _raise_for_retryable(r.status_code, r.headers, r.text)
+        return r.json()
+
+    def _chat_request(self, model: str, messages: list | str, temperature: float):
+        """chat 요청을 (url, payload, headers)로 만든다. 구현하지 않은 프로바이더는 None."""
+        return None
+
+    def _parse_chat(self, response: dict) -> str:
+        """chat 응답 JSON에서 텍스트를 꺼낸다."""
+        return str(response)
+
+    def _usage_local(self) -> threading.local:
+        # 하위 클래스가 super().__init__()을 부르지 않으므로 처음 쓸 때 만든다 (dict.setdefault는 원자적)
+        local = self.__dict__.get("_usage_tls")
+        if local is None:
+            local = self.__dict__.setdefault("_usage_tls", threading.local())
+        return local
+
+    @property
+    def last_usage(self) -> dict | None:
+        """이 스레드에서 한 마지막 호출의 사용량. 여러 스레드가 클라이언트 하나를 같이 써도 섞이지 않는다."""
+        return getattr(self._usage_local(), "value", None)
+
+    @last_usage.setter
+    def last_usage(self, value: dict | None) -> None:
+        self._usage_local().value = value
+
+    def _record_usage(self, input_tokens: int | None, cached_tokens: int | None) -> None:
+        """마지막 호출의 입력 토큰 수와 그중 프로바이더 캐시에서 읽은 토큰 수를 남긴다.
+
+        self.last_usage는 호출한 스레드의 마지막 호출 값, self.cached_tokens_total은 누적 절감량이다.
+        """
+        cached_tokens = cached_tokens or 0
+        self.last_usage = {"input_tokens": input_tokens, "cached_tokens": cached_tokens}
+        with _USAGE_LOCK:
+            self.cached_tokens_total = getattr(self, "cached_tokens_total", 0) + cached_tokens
+
+    def chat_with_prefix(self, model: str, prefix: str, messages: list | str, temperature: float = 0.7) -> str:
+        """매 호출 똑같이 반복되는 prefix(긴 지시문, 시스템 프롬프트)를 붙여 채팅한다.
+
+        프로바이더 컨텍스트 캐시를 지원하면 prefix를 한 번만 올리고 이후에는 참조만 보낸다.
+        기본 구현은 캐시 없이 그대로 붙인다.
+        - messages가 문자열: prefix + messages를 하나의 user 메시지로 보낸다
+        - messages가 리스트: prefix를 system 메시지로 앞에 둔다
+        """
+        return self.chat(model, self._prefixed(prefix, messages), temperature)
+
+    def _prefixed(self, prefix: str, messages: list | str) -> list | str:
+        """chat_with_prefix 기본 구현의 메시지 배치. 프로바이더가 캐시 표시를 붙이려면 재정의한다."""
+        if isinstance(messages, str):
+            return prefix + messages
+        return [{"role": "system", "content": prefix}, *messages]
+
+    def stream_chat_with_prefix(
+        self, model: str, prefix: str, messages: list | str, temperature: float = 0.7, stats: StreamStats = None
+    ):
+        """chat_with_prefix()의 스트리밍 버전. 기본 구현은 prefix를 _prefixed()로 붙여 stream_chat()으로 보낸다."""
+        yield from self.stream_chat(model, self._prefixed(prefix, messages), temperature, stats)
+
+    async def astream_chat_with_prefix(
+        self, model: str, prefix: str, messages: list | str, temperature: float = 0.7, stats: StreamStats = None
+    ):
+        """stream_chat_with_prefix()의 async iterator 버전"""
+        async for delta in self.astream_chat(model, self._prefixed(prefix, messages), temperature, stats):
+            yield delta
+
+    async def achat(self, model: str, messages: list | str, temperature: float = 0.7) -> str:
+        """chat()의 asyncio 버전
+
+        _chat_request()를 제공하는 프로바이더는 공유 httpx.AsyncClient로 보내고,
+        그렇지 않으면 동기 chat()을 스레드에서 실행한다.
+        """
+        request = self._chat_request(model, messages, temperature)
+        if request is None or not HAS_HTTPX:
+            import asyncio
+
+            def call():
+                # 작업 스레드에 남은 last_usage를 결과와 함께 가져와 호출한 스레드에 옮긴다
+                return self.chat(model, messages, temperature), self.last_usage
+
+            text, self.last_usage = await asyncio.to_thread(call)
+            return text
+        url, payload, headers = request
+        return self._parse_chat(await self._apost_json(url, payload, headers))
+
+    def _stream_request(self, model: str, messages: list | str, temperature: float):
+        """스트리밍 요청을 (url, payload, headers)로 만든다. 지원하지 않는 프로바이더는 None."""
+        return None
+
+    def _parse_stream_event(self, event: dict) -> tuple[str, int | None]:
+        """SSE 이벤트 하나에서 (텍스트 델타, 누적 출력 토큰 수 또는 None)을 꺼낸다."""
+        return "", None
+
+    def stream_chat(self, model: str, messages: list | str, temperature: float = 0.7, stats: StreamStats = None):
+        """응답 델타를 도착하는 대로 내보내는 제너레이터
+
+        지표는 stats(없으면 새로 만든다)와 self.last_stream_stats에 기록된다.
+        스트리밍을 지원하지 않는 프로바이더는 chat() 결과를 한 번에 내보낸다.
+        """
+        request = self._stream_request(model, messages, temperature)
+        if request is None:
+            stats = stats or StreamStats()
+            self.last_stream_stats = stats
+            text = self.chat(model, messages, temperature)
+            stats.on_delta(text)
+            stats.finish()
+            yield text
+            return
+        yield from self._stream_events(request, stats)
+
+    def _stream_events(self, request: tuple, stats: StreamStats = None):
+        """(url, payload, headers) 스트리밍 요청을 보내고 SSE 델타를 내보낸다."""
+        stats = stats or StreamStats()
+        self.last_stream_stats = stats
+        url, payload, headers = request
+        body, headers = _json_request(payload, headers)
+        with self.session.post(url, data=body, headers=headers, stream=True, timeout=HTTP_SETTINGS["timeout"]) as r:
+            r.raise_for_status()
+            for line in r.iter_lines(decode_unicode=True):
+                event = _parse_sse_line(line or "")
+                if event is None:
+                    continue
+                delta, tokens = self._parse_stream_event(event)
+                stats.on_delta(delta, tokens)
+                if delta:
+                    yield delta
+        stats.finish()
+
+    async def astream_chat(self, model: str, messages: list | str, temperature: float = 0.7, stats: StreamStats = None):
+        """stream_chat()의 async iterator 버전"""
+        request = self._stream_request(model, messages, temperature)
+        if request is None or not HAS_HTTPX:
+            stats = stats or StreamStats()
+            self.last_stream_stats = stats
+            text = await self.achat(model, messages, temperature)
+            stats.on_delta(text)
+            stats.finish()
+            yield text
+            return
+        async for delta in self._astream_events(request, stats):
+            yield delta
+
+    async def _astream_events(self, request: tuple, stats: StreamStats = None):
+        """_stream_events()의 async 버전. 공유 httpx.AsyncClient로 보낸다."""
+        stats = stats or StreamStats()
+        self.last_stream_stats = stats
+        url, payload, headers = request
+        body, headers = _json_request(payload, headers, asynchronous=True)
+        async with get_async_client().stream("POST", url, content=body, headers=headers) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                event = _parse_sse_line(line)
+                if event is None:
+                    continue
+                delta, tokens = self._parse_stream_event(event)
+                stats.on_delta(delta, tokens)
+                if delta:
+                    yield delta
+        stats.finish()
+
+    # vision 이미지 해상도 상한. 기본값은 OpenAI high detail 기준(2048 정사각형 안, 짧은 변 768)
+    VISION_MAX_SIDE = 2048
+    VISION_MAX_SHORT_SIDE = 768
+
+    def _image_part(self, image) -> dict:
+        """준비된 이미지(llm_vision.PreparedImage)를 content 항목으로 만든다.
+
+        기본 구현은 data URL 인라인이다. base64는 요청을 보내는 동안 인코딩된다.
+        파일 업로드 API가 있는 프로바이더는 큰 이미지를 올리고 참조만 넣도록 재정의한다.
+        """
+        from src.llm_vision import Base64Blob
+
+        return {"type": "image_url", "image_url": {"url": Base64Blob(image, prefix=f"data:{image.mime};base64,")}}
+
+    def vision(self, model: str, prompt: str, images: list, temperature: float = 0.7) -> str:
+        """이미지 + 텍스트 채팅 (표준 OpenAI 호환 형식)
+
+        images: 파일 경로, bytes 또는 llm_vision.PreparedImage. MIME은 파일 내용으로 판별하고,
+        VISION_MAX_SIDE / VISION_MAX_SHORT_SIDE보다 큰 이미지는 줄여서 보낸다 (Pillow가 있을 때).
+        """
+        from src.llm_vision import prepare_image
 
         content = [{"type": "text", "text": prompt}]
         for img in images:
-            b64 = to_b64(img)
-            content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{b64}"}
-            })
+            image = prepare_image(img, self.VISION_MAX_SIDE, self.VISION_MAX_SHORT_SIDE)
+            content.append(self._image_part(image))
 
         messages = [{"role": "user", "content": content}]
-        return self.chat(model, messages)
+        return self.chat(model, messages, temperature)
 
 
 # 지원하는 프로바이더
@@ -83,28 +554,27 @@ def validate_provider(provider: str) -> None:
         raise ValueError(f"지원되지 않는 프로바이더: {provider}. 지원: {SUPPORTED_PROVIDERS}")
 
 
-# 클라이언트 초기화
-def _init_clients():
-    """클라이언트들을 지연 로딩으로 초기화"""
+# 클라이언트 초기화: 프로바이더별로 처음 요청될 때 만든다
+def _make_gemini() -> BaseChatAPI:
     from src.gemini import Gemini
+
+    return Gemini(api_key=config_value("api", "aistudio", "key"))
+
+
+def _make_openrouter() -> BaseChatAPI:
     from src.openrouter import OpenRouter
-    
-    clients = {}
-    try:
-        clients['gemini'] = Gemini(api_key=config["api"]["aistudio"]["key"])
-    except Exception as e:
-        print(f"Gemini 초기화 실패: {e}")
-    
-    try:
-        clients['openrouter'] = OpenRouter(api_key=config["api"]["openrouter"]["key"])
-    except Exception as e:
-        print(f"OpenRouter 초기화 실패: {e}")
-    
-    return clients
+
+    return OpenRouter(api_key=config_value("api", "openrouter", "key"))
 
 
-# 전역 클라이언트 캐시
-_CLIENTS_CACHE = None
+_CLIENT_FACTORIES = {
+    "gemini": _make_gemini,
+    "openrouter": _make_openrouter,
+}
+
+# 전역 클라이언트 캐시 (실패한 생성은 캐시하지 않고 다음 호출 때 다시 시도한다)
+_CLIENTS_CACHE: dict = {}
+_CLIENTS_LOCK = threading.Lock()
 
 
 def get_client(provider: str, model: str) -> BaseChatAPI:
@@ -115,25 +585,27 @@ def get_client(provider: str, model: str) -> BaseChatAPI:
         model: 모델명 (예: 'gemini-2.5-flash-lite', 'xiaomi/mimo-v2-flash:free')
     
     Returns:
-        BaseChatAPI 인스턴스 (Gemini 또는 OpenRouter)
+        BaseChatAPI 인스턴스 (Gemini 또는 OpenRouter). 생성에 실패하면 None
     
     Raises:
         ValueError: 지원되지 않는 프로바이더인 경우
     """
     validate_provider(provider)
     
-    global _CLIENTS_CACHE
-    if _CLIENTS_CACHE is None:
-        _CLIENTS_CACHE = _init_clients()
-    
     print(f"[get_client] provider={provider}, model={model}")
     
-    if provider == "gemini":
-        return _CLIENTS_CACHE.get('gemini')
-    elif provider == "openrouter":
-        return _CLIENTS_CACHE.get('openrouter')
-    else:
-        raise ValueError(f"지원되지 않는 프로바이더: {provider}")
+    client = _CLIENTS_CACHE.get(provider)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS_CACHE.get(provider)
+            if client is None:
+                try:
+                    client = _CLIENT_FACTORIES[provider]()
+                except Exception as e:
+                    print(f"{provider} 초기화 실패: {e}")
+                    return None
+                _CLIENTS_CACHE[provider] = client
+    return client
 
 
 def chat(model: str, provider: str, messages: list | str = None, temperature: float = 0.7) -> str:
@@ -163,6 +635,180 @@ def chat(model: str, provider: str, messages: list | str = None, temperature: fl
     return client.chat(model, messages, temperature)
 
 
+class TokenBucket:
+    """분당 허용량(rate_per_min)만큼 채워지는 스레드 안전 토큰 버킷"""
+
+    def __init__(self, rate_per_min: float, capacity: float = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity or rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """amount만큼 토큰이 찰 때까지 기다렸다가 꺼낸다."""
+        amount = min(amount, self.capacity)  # 버킷보다 큰 요청이 영원히 막히지 않도록
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def tighten(self, rate_per_min: float) -> None:
+        """한도를 rate_per_min으로 낮춘다. 이미 더 낮으면 그대로 둔다(남은 토큰도 새 용량으로 자른다)."""
+        with self.lock:
+            if rate_per_min >= self.capacity:
+                return
+            self.rate = rate_per_min / 60.0
+            self.capacity = rate_per_min
+            self.tokens = min(self.tokens, self.capacity)
+
+
+# (provider, model, "rpm"|"tpm")별 버킷. chat_many 호출 간에도 공유해 한도를 지킨다.
+_BUCKETS = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def _bucket(provider: str, model: str, kind: str, limit) -> TokenBucket | None:
+    """키당 버킷은 하나뿐이다. 호출마다 한도가 다르면 새로 만들지 않고 더 낮은 쪽(min)으로 맞춘다."""
+    if isinstance(limit, dict):
+        limit = limit.get(model, limit.get(provider))
+    if not limit:
+        return None
+    key = (provider, model, kind)
+    with _BUCKETS_LOCK:
+        bucket = _BUCKETS.get(key)
+        if bucket is None:
+            bucket = _BUCKETS[key] = TokenBucket(limit)
+        else:
+            bucket.tighten(limit)
+    return bucket
+
+
+def _estimate_tokens(messages: list | str) -> int:
+    """TPM 예산용 입력 토큰 추정치 (한국어 기준 3글자≈1토큰으로 보수적으로 잡는다)"""
+    if isinstance(messages, str):
+        return max(1, len(messages) // 3)
+    return max(1, sum(len(json.dumps(m.get("content", ""), ensure_ascii=False)) for m in messages) // 3)
+
+
+def call_with_limits(
+    provider: str,
+    model: str,
+    call,
+    rpm: int | dict = None,
+    tpm: int | dict = None,
+    tokens: int = 1,
+    max_retries: int = 5,
+    backoff_base: float = 1.0,
+    backoff_max: float = 60.0,
+    label: str = "chat",
+):
+    """(provider, model) 공유 RPM/TPM 버킷을 거쳐 call()을 호출하고, 실패하면 백오프 후 다시 시도한다.
+
+    chat_many와 write_term처럼 같은 모델을 부르는 호출자는 모두 이 함수를 지나므로
+    프로세스 안에서는 하나의 한도를 나눠 쓴다.
+
+    Args:
+        call: 인자 없이 호출할 함수. 보통 client.chat(...)을 감싼 lambda
+        rpm, tpm: chat_many와 같은 형식의 분당 요청/입력 토큰 한도
+        tokens: 시도 한 번이 TPM 버킷에서 꺼낼 토큰 수 (추정치)
+        max_retries: 429/5xx·네트워크 오류 재시도 횟수
+        backoff_base, backoff_max: 지수 백오프 기준/상한(초). full jitter를 적용하고 Retry-After가 더 길면 따른다
+        label: 재시도 로그 앞에 붙일 호출자 이름
+
+    Returns:
+        call()의 반환값. 재시도를 모두 소진하면 마지막 예외를 그대로 올린다.
+    """
+    import requests
+
+    rpm_bucket = _bucket(provider, model, "rpm", rpm)
+    tpm_bucket = _bucket(provider, model, "tpm", tpm)
+    for attempt in range(max_retries + 1):
+        if rpm_bucket:
+            rpm_bucket.acquire()
+        if tpm_bucket:
+            tpm_bucket.acquire(tokens)
+        try:
+            return call()
+        except (ChatHTTPError, requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+            if getattr(e, "retry_after", None):
+                delay = max(delay, e.retry_after)
+            print(f"[{label}] {provider}/{model} 재시도 {attempt + 1}/{max_retries} ({delay:.1f}s 후): {e}")
+            time.sleep(delay)
+
+
+def chat_many(
+    requests_list: list,
+    concurrency: int = 8,
+    rpm: int | dict = None,
+    tpm: int | dict = None,
+    on_result=None,
+    max_retries: int = 5,
+    backoff_base: float = 1.0,
+    backoff_max: float = 60.0,
+) -> list:
+    """여러 프롬프트를 동시에 보내되 프로바이더·모델별 RPM/TPM 한도를 지킨다.
+
+    Args:
+        requests_list: [{"model", "provider", "messages", "temperature"(선택)}, ...]
+        concurrency: 동시에 진행할 요청 수
+        rpm: 분당 요청 한도. 숫자면 모든 (provider, model)에, dict면 모델명/프로바이더명별로 적용
+        tpm: 분당 입력 토큰 한도 (추정치 기준). rpm과 같은 형식
+        on_result: 요청 하나가 끝날 때마다 호출되는 콜백 (index, 결과). 호출 스레드에서 실행된다
+        max_retries: 429/5xx·네트워크 오류 재시도 횟수
+        backoff_base, backoff_max: 지수 백오프 기준/상한(초). full jitter를 적용한다
+
+    Returns:
+        입력 순서와 같은 결과 리스트. 재시도를 모두 소진한 항목에는 예외 객체가 들어간다.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    clients = {}
+    for req in requests_list:
+        key = (req["provider"], req["model"])
+        if key not in clients:
+            clients[key] = get_client(*key)
+            if not clients[key]:
+                raise ValueError(f"클라이언트 초기화 실패: {req['provider']}")
+
+    def run(req: dict):
+        provider, model, messages = req["provider"], req["model"], req["messages"]
+        return call_with_limits(
+            provider,
+            model,
+            lambda: clients[(provider, model)].chat(model, messages, req.get("temperature", 0.7)),
+            rpm=rpm,
+            tpm=tpm,
+            tokens=_estimate_tokens(messages),
+            max_retries=max_retries,
+            backoff_base=backoff_base,
+            backoff_max=backoff_max,
+            label="chat_many",
+        )
+
+    results = [None] * len(requests_list)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run, req): i for i, req in enumerate(requests_list)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = e
+            if on_result:
+                on_result(i, results[i])
+    return results
+
+
 if __name__ == "__main__":
     result = chat('gemini-2.5-flash-lite', 'gemini', '안녕하세요')
     print(result)
@@ -0,0 +1,143 @@
+"""BaseChatAPI 프로바이더의 HTTP 커넥션 재사용 효과를 로컬 스텁 서버로 재는 벤치마크.
+
+OpenAI 호환 /chat/completions 응답을 흉내내는 스텁 서버를 띄우고, 같은 요청을
+세 가지 방식으로 동시성 1/16/64에서 보내 처리량(req/s)을 비교한다.
+
+- 단발 requests.post: 요청마다 커넥션을 새로 연다(기존 방식)
+- 공유 세션 chat(): chat.get_session() 커넥션 풀 + 스레드 풀
+- achat(): 공유 httpx.AsyncClient + asyncio.gather
+
+실제 API 키나 네트워크는 쓰지 않는다. 스텁 지연(--delay-ms)은 모델 응답 시간을 흉내낸 값이다.
+공유 세션과 achat은 동시성만큼 먼저 요청을 보내 커넥션 풀을 채운 뒤 잰다.
+스텁 서버도 같은 머신에서 돌기 때문에 코어가 적으면 높은 동시성에서 수치가 눌린다.
+
+독립 실행 (저장소 루트에서):
+    python3 -m src.chat_http_bench
+    python3 -m src.chat_http_bench --requests 512 --delay-ms 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from src.chat import aclose_http, configure_http
+from src.openrouter import OpenRouter
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+logger = logging.getLogger("chat_http_bench")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+CONCURRENCY_LEVELS = (1, 16, 64)
+STUB_RESPONSE = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}]}).encode()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 헤더와 본문을 따로 쓰므로 Nagle이 켜져 있으면 keep-alive 연결에서 delayed ACK(~40ms)에 걸린다.
+    disable_nagle_algorithm = True
+    delay_ms = 0.0
+
+    def do_POST(self) -> None:  # noqa: N802
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay_ms / 1000)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # 동시성 64에서 accept 백로그가 넘치지 않도록
+
+
+def _serve(delay_ms: float, port_queue: mp.Queue) -> None:
+    _StubHandler.delay_ms = delay_ms
+    server = _StubServer(("127.0.0.1", 0), _StubHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_stub_server(delay_ms: float) -> tuple[mp.Process, str]:
+    """keep-alive를 지원하는(HTTP/1.1) 스텁 서버를 별도 프로세스로 띄우고 base_url을 돌려준다.
+
+    같은 프로세스에 두면 서버 스레드가 클라이언트와 GIL을 다퉈 측정이 왜곡된다.
+    """
+    port_queue: mp.Queue = mp.Queue()
+    proc = mp.Process(target=_serve, args=(delay_ms, port_queue), daemon=True)
+    proc.start()
+    return proc, f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+
+def bench_oneshot(base_url: str, n_requests: int, concurrency: int) -> float:
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "hi"}]}
+
+    def call(_: int) -> None:
+        requests.post(f"{base_url}/chat/completions", json=payload, timeout=30).json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(n_requests)))
+    return n_requests / (time.perf_counter() - start)
+
+
+def bench_session(client: OpenRouter, n_requests: int, concurrency: int) -> float:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: client.chat("stub", "hi"), range(concurrency)))  # 풀 워밍업
+        start = time.perf_counter()
+        list(pool.map(lambda _: client.chat("stub", "hi"), range(n_requests)))
+        return n_requests / (time.perf_counter() - start)
+
+
+async def _bench_async(client: OpenRouter, n_requests: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def call() -> None:
+        async with sem:
+            await client.achat("stub", "hi")
+
+    await asyncio.gather(*(call() for _ in range(concurrency)))  # 풀 워밍업
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    await aclose_http()
+    return n_requests / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="프로바이더 HTTP 커넥션 풀 처리량 벤치마크")
+    parser.add_argument("--requests", type=int, default=256, help="방식·동시성마다 보낼 요청 수")
+    parser.add_argument("--delay-ms", type=float, default=5.0, help="스텁 서버 응답 지연(ms)")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.delay_ms)
+    configure_http(pool_maxsize=max(CONCURRENCY_LEVELS))
+    client = OpenRouter(api_key="stub", base_url=base_url)
+
+    logger.info("스텁 서버 %s, 요청 %d건, 지연 %.0fms", base_url, args.requests, args.delay_ms)
+    for concurrency in CONCURRENCY_LEVELS:
+        oneshot = bench_oneshot(base_url, args.requests, concurrency)
+        pooled = bench_session(client, args.requests, concurrency)
+        async_rps = asyncio.run(_bench_async(client, args.requests, concurrency))
+        logger.info(
+            "동시성 %2d | 단발 requests %7.1f req/s | 공유 세션 %7.1f req/s | achat %7.1f req/s",
+            concurrency, oneshot, pooled, async_rps,
+        )
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,10 @@
 # gemini.py
 import os
-import yaml
-import base64
-import requests
-from pathlib import Path
-from src.chat import BaseChatAPI
+import time
+import hashlib
+import threading
+from src.chat import HAS_HTTPX, HTTP_SETTINGS, BaseChatAPI, StreamStats, _raise_for_retryable, config_value
 
-# 설정 로드
-with open(Path(__file__).parent.parent / ".config.yaml") as f:
-    config = yaml.safe_load(f)
-
-API_KEY = config["api"]["aistudio"]["key"]
 BASE = "https://generativelanguage.googleapis.com/v1beta"
 
 
@@ -31,10 +25,32 @@ class Gemini(BaseChatAPI):
         "gemma-3n": "무료 입력/출력/캐싱 | 유료: 없음"
     }
 
-    def __init__(self, api_key=API_KEY):
+    # cachedContents 수명(초). 만료 1분 전부터는 새로 만든다
+    CONTEXT_CACHE_TTL = 3600
+
+    # 768x768 타일 하나가 258토큰이라 긴 변 1536(타일 4개 이내)까지만 보낸다. 짧은 변은 제한하지 않는다
+    VISION_MAX_SIDE = 1536
+    VISION_MAX_SHORT_SIDE = None
+    # 이보다 큰 이미지는 Files API로 올리고 file_uri로 참조한다 (인라인은 요청 전체 20MB 한도)
+    VISION_INLINE_MAX = 1 << 20
+    # Files API 파일은 48시간 뒤 지워지므로 그 전에 다시 올린다
+    UPLOAD_TTL = 47 * 3600
+
+    def __init__(self, api_key=None, base_url=BASE):
+        # 키는 import가 아니라 클라이언트를 만들 때 .config.yaml에서 읽는다
+        api_key = api_key or config_value("api", "aistudio", "key")
         if not api_key:
             raise ValueError("Gemini API 키가 설정되지 않았습니다. .config.yaml에 설정하세요.")
         self.key = api_key
+        self.base_url = base_url.rstrip("/")
+        # (model, prefix 해시) -> (cachedContents 이름 또는 None, 만료 시각). None은 생성 실패를 기억한다
+        self._context_caches = {}
+        self._context_lock = threading.Lock()
+        # 생성 중인 (model, prefix 해시) -> 끝나면 set되는 Event
+        self._context_inflight = {}
+        # 이미지 sha256 -> (file_uri, 만료 시각)
+        self._uploads = {}
+        self._upload_lock = threading.Lock()
 
     @property
     def MODEL_PRICES(self) -> dict:
@@ -42,17 +58,21 @@ class Gemini(BaseChatAPI):
 
     # 모든 모델 목록 가져오기
     def models(self):
-        url = f"{BASE}/models"
-        params = {"key": self.key}
-        models = []
-        while True:
-            r = requests.get(url, params=params).json()
-            models.extend(r.get("models", []))
-            token = r.get("nextPageToken")
-            if not token:
-                break
+        return self.models_if_changed()[0]
+
+    def models_if_changed(self, etag=None):
+        """첫 페이지의 ETag가 그대로면 (None, etag). 페이지 크기를 최대로 잡아 왕복 수를 줄인다."""
+        url = f"{self.base_url}/models"
+        params = {"key": self.key, "pageSize": 1000}
+        r, new_etag = self._get_json_if_changed(url, etag, params=params)
+        if r is None:
+            return None, etag
+        models = list(r.get("models", []))
+        while token := r.get("nextPageToken"):
             params["pageToken"] = token
-        return [m["name"].split("/")[-1] for m in models]
+            r = self._get_json(url, params=params)
+            models.extend(r.get("models", []))
+        return [m["name"].split("/")[-1] for m in models], new_etag
 
     def _convert_to_gemini_format(self, messages: list) -> list:
         """
@@ -74,15 +94,9 @@ class Gemini(BaseChatAPI):
                             parts.append({"text": item.get("text", "")})
                         elif item.get("type") == "image_url":
                             # 이미지 처리 - Gemini format으로 변환
-                            image_url = item.get("image_url", {}).get("url", "")
-                            if image_url.startswith("data:image"):
-                                # base64 이미지
-                                parts.append({
-                                    "inline_data": {
-                                        "mime_type": "image/jpeg",
-                                        "data": image_url.split(",")[1]
-                                    }
-                                })
+                            part = self._convert_image_url(item.get("image_url", {}))
+                            if part:
+                                parts.append(part)
                 gemini_contents.append({"role": role, "parts": parts if parts else [{"text": ""}]})
             else:
                 # 텍스트만
@@ -92,28 +106,201 @@ class Gemini(BaseChatAPI):
                 })
         return gemini_contents
 
-    # 표준 형식의 메시지로 채팅 수행
-    def chat(self, model: str, messages: list | str, temperature=0.7):
-        """
-        표준 OpenAI 호환 형식의 메시지를 받아 Gemini API로 전송
-        """
+    @staticmethod
+    def _convert_image_url(image_url: dict) -> dict | None:
+        """OpenAI image_url 항목을 Gemini part로 바꾼다."""
+        from src.llm_vision import Base64Blob
+
+        url = image_url.get("url", "")
+        if isinstance(url, Base64Blob):
+            # vision()이 만든 스트리밍 이미지: data URL 머리 없이 base64만 흘려보낸다
+            return {"inline_data": {"mime_type": url.image.mime, "data": Base64Blob(url.image)}}
+        if url.startswith("data:"):
+            header, _, data = url.partition(",")
+            return {"inline_data": {"mime_type": header[5:].split(";")[0], "data": data}}
+        if url.startswith(("https://", "http://")):
+            # Files API URI (_image_part가 mime_type을 함께 넣는다)
+            return {"file_data": {"mime_type": image_url.get("mime_type", "image/jpeg"), "file_uri": url}}
+        return None
+
+    def _upload_file(self, image) -> str:
+        """이미지를 Files API(resumable 업로드)로 올리고 file_uri를 돌려준다. 같은 이미지는 다시 올리지 않는다."""
+        key = image.sha256()
+        with self._upload_lock:
+            uri, expires_at = self._uploads.get(key, (None, 0.0))
+            if expires_at > time.time():
+                return uri
+
+            upload_base = self.base_url.replace("/v1beta", "/upload/v1beta")
+            start = self.session.post(
+                f"{upload_base}/files?key={self.key}",
+                json={"file": {"display_name": key[:16]}},
+                headers={
+                    "X-Goog-Upload-Protocol": "resumable",
+                    "X-Goog-Upload-Command": "start",
+                    "X-Goog-Upload-Header-Content-Length": str(image.size),
+                    "X-Goog-Upload-Header-Content-Type": image.mime,
+                },
+                timeout=HTTP_SETTINGS["timeout"],
+            )
+            _raise_for_retryable(start.status_code, start.headers, start.text)
+            start.raise_for_status()
+            # 본문은 PreparedImage를 그대로 넘겨 청크 단위로 보낸다
+            r = self.session.post(
+                start.headers["X-Goog-Upload-URL"],
+                data=image,
+                headers={"X-Goog-Upload-Offset": "0", "X-Goog-Upload-Command": "upload, finalize"},
+                timeout=HTTP_SETTINGS["timeout"],
+            )
+            _raise_for_retryable(r.status_code, r.headers, r.text)
+            r.raise_for_status()
+            uri = r.json()["file"]["uri"]
+            self._uploads[key] = (uri, time.time() + self.UPLOAD_TTL)
+            return uri
+
+    def _image_part(self, image) -> dict:
+        """VISION_INLINE_MAX보다 큰 이미지는 Files API로 올려 요청에는 URI만 넣는다. 업로드가 실패하면 인라인으로 보낸다."""
+        if image.size <= self.VISION_INLINE_MAX:
+            return super()._image_part(image)
+        try:
+            uri = self._upload_file(image)
+        except Exception as e:
+            print(f"[Gemini] 이미지 업로드 실패, 인라인으로 보냅니다: {e}")
+            return super()._image_part(image)
+        return {"type": "image_url", "image_url": {"url": uri, "mime_type": image.mime}}
+
+    def _chat_request(self, model: str, messages: list | str, temperature: float):
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
 
         # 표준 형식을 Gemini 형식으로 변환
         gemini_contents = self._convert_to_gemini_format(messages)
-        
-        url = f"{BASE}/models/{model}:generateContent?key={self.key}"
+
+        url = f"{self.base_url}/models/{model}:generateContent?key={self.key}"
         payload = {
             "contents": gemini_contents,
             # "generationConfig": {"temperature": temperature}
         }
-        r = requests.post(url, json=payload).json()
+        return url, payload, None
+
+    def _parse_chat(self, r: dict) -> str:
+        usage = r.get("usageMetadata", {}) if isinstance(r, dict) else {}
+        self._record_usage(usage.get("promptTokenCount"), usage.get("cachedContentTokenCount"))
         try:
             return r["candidates"][0]["content"]["parts"][0]["text"]
         except Exception as e:
             return str(r)
 
+    def _stream_request(self, model: str, messages: list | str, temperature: float):
+        url, payload, headers = self._chat_request(model, messages, temperature)
+        url = f"{self.base_url}/models/{model}:streamGenerateContent?alt=sse&key={self.key}"
+        return url, payload, headers
+
+    def _parse_stream_event(self, event: dict) -> tuple[str, int | None]:
+        # streamGenerateContent는 이벤트마다 새로 생성된 부분만 담아 보낸다
+        parts = (event.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+        delta = "".join(p.get("text", "") for p in parts)
+        return delta, event.get("usageMetadata", {}).get("candidatesTokenCount")
+
+    def _context_cache(self, model: str, prefix: str) -> str | None:
+        """prefix를 담은 cachedContents를 만들거나 재사용하고 이름을 돌려준다.
+
+        모델별 최소 토큰 수보다 짧은 prefix 등으로 생성이 4xx로 거절되면 None을 돌려주고,
+        같은 prefix로는 TTL 동안 다시 시도하지 않는다. 429/5xx·네트워크 오류는 일시적이므로
+        기억하지 않고 이번 호출만 캐시 없이 보낸다.
+        """
+        import requests
+
+        key = (model, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        # 같은 prefix 생성은 한 스레드만 하고 나머지는 기다린다. HTTP 요청 동안 잠금은 잡지 않는다
+        with self._context_lock:
+            name, expires_at = self._context_caches.get(key, (None, 0.0))
+            if expires_at - 60 > time.time():
+                return name
+            creating = self._context_inflight.get(key)
+            if creating is None:
+                self._context_inflight[key] = threading.Event()
+        if creating is not None:
+            creating.wait(HTTP_SETTINGS["timeout"])
+            with self._context_lock:
+                name, expires_at = self._context_caches.get(key, (None, 0.0))
+            return name if expires_at > time.time() else None
+
+        name, remember = None, False
+        try:
+            payload = {
+                "model": f"models/{model}",
+                "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+                "ttl": f"{self.CONTEXT_CACHE_TTL}s",
+            }
+            r = self.session.post(
+                f"{self.base_url}/cachedContents?key={self.key}", json=payload, timeout=HTTP_SETTINGS["timeout"]
+            )
+            if r.status_code == 200:
+                name = r.json().get("name")
+                remember = name is not None
+            else:
+                remember = 400 <= r.status_code < 500 and r.status_code != 429
+                print(f"[Gemini] 컨텍스트 캐시 생성 실패({r.status_code}), prefix를 그대로 전송합니다: {r.text[:200]}")
+        except (requests.RequestException, ValueError) as e:
+            print(f"[Gemini] 컨텍스트 캐시 생성 실패, prefix를 그대로 전송합니다: {e}")
+        finally:
+            with self._context_lock:
+                if remember:
+                    self._context_caches[key] = (name, time.time() + self.CONTEXT_CACHE_TTL)
+                self._context_inflight.pop(key).set()
+        return name
+
+    def chat_with_prefix(self, model: str, prefix: str, messages: list | str, temperature: float = 0.7) -> str:
+        """prefix는 cachedContents로 한 번만 올리고 이후 호출은 이름만 참조한다.
+
+        캐시를 만들 수 없으면 기본 구현처럼 prefix를 앞에 붙여 보낸다.
+        이때도 prefix가 요청 맨 앞에 있어 Gemini 암묵적 캐시에 걸릴 수 있다.
+        """
+        cache_name = self._context_cache(model, prefix)
+        if cache_name is None:
+            return super().chat_with_prefix(model, prefix, messages, temperature)
+
+        url, payload, headers = self._chat_request(model, messages, temperature)
+        payload["cachedContent"] = cache_name
+        return self._parse_chat(self._post_json(url, payload, headers))
+
+    def stream_chat_with_prefix(
+        self, model: str, prefix: str, messages: list | str, temperature: float = 0.7, stats: StreamStats = None
+    ):
+        """chat_with_prefix()처럼 cachedContents를 참조해 스트리밍한다. 캐시를 만들 수 없으면 prefix를 붙여 보낸다."""
+        cache_name = self._context_cache(model, prefix)
+        if cache_name is None:
+            yield from super().stream_chat_with_prefix(model, prefix, messages, temperature, stats)
+            return
+        url, payload, headers = self._stream_request(model, messages, temperature)
+        payload["cachedContent"] = cache_name
+        yield from self._stream_events((url, payload, headers), stats)
+
+    async def astream_chat_with_prefix(
+        self, model: str, prefix: str, messages: list | str, temperature: float = 0.7, stats: StreamStats = None
+    ):
+        """stream_chat_with_prefix()의 async 버전. 캐시 생성(동기 HTTP)은 스레드에서 한다."""
+        import asyncio
+
+        cache_name = await asyncio.to_thread(self._context_cache, model, prefix) if HAS_HTTPX else None
+        if cache_name is None:
+            async for delta in super().astream_chat_with_prefix(model, prefix, messages, temperature, stats):
+                yield delta
+            return
+        url, payload, headers = self._stream_request(model, messages, temperature)
+        payload["cachedContent"] = cache_name
+        async for delta in self._astream_events((url, payload, headers), stats):
+            yield delta
+
+    # 표준 형식의 메시지로 채팅 수행
+    def chat(self, model: str, messages: list | str, temperature=0.7):
+        """
+        표준 OpenAI 호환 형식의 메시지를 받아 Gemini API로 전송
+        """
+        url, payload, headers = self._chat_request(model, messages, temperature)
+        return self._parse_chat(self._post_json(url, payload, headers))
+
 
 # ============ 사용 예시 ============
 if __name__ == "__main__":
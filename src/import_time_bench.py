@@ -0,0 +1,90 @@
+"""CLI 진입점 모듈의 콜드 스타트(import) 시간을 python -X importtime으로 잰다.
+
+모듈마다 새 인터프리터를 --runs번 띄워 import하고, 그 모듈의 누적 import 시간 중앙값과
+가장 무거운 하위 import 상위 몇 개를 보여준다. --no-config는 LLM_CONFIG_PATH를 없는 파일로
+돌려 .config.yaml이 없어도 import가 성공하는지 확인한다.
+
+독립 실행 (저장소 루트에서):
+    python3 -m src.import_time_bench
+    python3 -m src.import_time_bench --runs 9 --top 8 --no-config
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+logger = logging.getLogger("import_time_bench")
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "src"
+
+# (모듈, import할 때의 작업 디렉터리). term/write_term은 src 안에서 직접 실행하는 스크립트다
+ENTRY_POINTS = (
+    ("src.chat", ROOT),
+    ("src.gemini", ROOT),
+    ("src.openrouter", ROOT),
+    ("src.subagent", ROOT),
+    ("term", SRC),
+    ("write_term", SRC),
+)
+
+
+def measure(module: str, cwd: Path, env: dict[str, str]) -> tuple[int, list[tuple[int, str]]] | None:
+    """새 인터프리터에서 module을 import해 (누적 µs, [(누적 µs, 하위 모듈)...])을 돌려준다. 실패하면 None."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        logger.warning("%s import 실패: %s", module, proc.stderr.strip().splitlines()[-1])
+        return None
+    # 하위 모듈이 먼저 한 단계 더 들여써서 찍히고, 그 모듈 자신의 줄이 마지막에 온다
+    children: list[tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                return int(cumulative), sorted(children, reverse=True)
+            children = []
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI 진입점 import 시간 벤치마크")
+    parser.add_argument("--runs", type=int, default=5, help="모듈마다 새 인터프리터를 띄우는 횟수")
+    parser.add_argument("--top", type=int, default=5, help="보여줄 무거운 하위 import 수")
+    parser.add_argument("--no-config", action="store_true", help=".config.yaml 없이 import되는지 확인")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), str(SRC)])}
+    if args.no_config:
+        env["LLM_CONFIG_PATH"] = str(ROOT / ".config.missing.yaml")
+
+    for module, cwd in ENTRY_POINTS:
+        samples = []
+        for _ in range(args.runs):
+            sample = measure(module, cwd, env)
+            if sample is None:
+                break
+            samples.append(sample)
+        else:
+            median = statistics.median(total for total, _ in samples)
+            _, direct = min(samples)
+            heavy = ", ".join(f"{name} {us / 1000:.1f}" for us, name in direct[: args.top])
+            logger.info("%-15s %7.1fms | 무거운 import(ms): %s", module, median / 1000, heavy)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
 """공급자별 CircuitBreaker + 우선순위 리스트 기반 자동 폴백.
 
-연속 실패가 threshold를 넘으면 OPEN으로 전환해 요청 자체를 건너뛰고,
-recovery_timeout 후 HALF_OPEN에서 프로브 1건만 통과시켜 복구 여부를 확인한다.
+최근 window_seconds 동안의 실패율이 failure_rate 이상이고 실패가 failure_threshold건 이상이면
+OPEN으로 전환해 요청 자체를 건너뛴다. recovery_timeout 후 HALF_OPEN에서는 프로브를 정확히
+half_open_probes건만 통과시키고, 그 프로브가 모두 성공해야 CLOSED로 돌아간다.
+
+상태 전이와 프로브 슬롯은 락 하나로 보호되어 스레드와 asyncio 태스크가 동시에 불러도
+HALF_OPEN에서 프로브가 K건을 넘지 않는다.
+
+acall_with_fallback은 상위 provider 두 곳에 요청을 경주(hedge)시키고, 먼저 성공한 응답을 쓰며
+나머지는 취소한다. 느린 꼬리 지연을 줄이는 대신 요청을 최대 두 배 쓴다.
+
+독립 실행:
+    python llm_circuit_breaker.py
 """
 from __future__ import annotations
 
+import asyncio
 import logging
+import threading
 import time
-from typing import Callable
+from collections import deque
+from typing import Awaitable, Callable
 
 logger = logging.getLogger(__name__)
 
@@ -15,44 +28,100 @@ logger = logging.getLogger(__name__)
 class CircuitBreaker:
     """provider 1개에 대응하는 CLOSED/OPEN/HALF_OPEN 상태 머신."""
 
-    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0) -> None:
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 60.0,
+        failure_rate: float = 0.5,
+        window_seconds: float = 60.0,
+        half_open_probes: int = 1,
+    ) -> None:
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
-        self.failure_count = 0
+        self.failure_rate = failure_rate
+        self.window_seconds = window_seconds
+        self.half_open_probes = half_open_probes
         self.last_failure_time = 0.0
         self.state = "CLOSED"
+        self._lock = threading.Lock()
+        self._window: deque[tuple[float, bool]] = deque()  # (시각, 성공 여부)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_admitted = 0
+        self._probe_successes = 0
+
+    @property
+    def failure_count(self) -> int:
+        """슬라이딩 윈도 안의 실패 수"""
+        return self._failures
+
+    def _record(self, ok: bool, now: float) -> None:
+        self._window.append((now, ok))
+        if not ok:
+            self._failures += 1
+        while self._window and self._window[0][0] <= now - self.window_seconds:
+            if not self._window.popleft()[1]:
+                self._failures -= 1
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = "OPEN"
+        self._opened_at = now
+        logger.warning("circuit -> OPEN (%s)", reason)
 
     def is_available(self, now: float | None = None) -> bool:
-        """요청을 보내도 되는지 판단한다. OPEN -> HALF_OPEN 전이도 여기서 처리한다."""
+        """요청을 보내도 되는지 판단한다. OPEN -> HALF_OPEN 전이와 프로브 슬롯 배정도 여기서 한다.
+
+        True를 받은 호출자는 반드시 report_success / report_failure / report_cancelled 중 하나로 결과를 알려야 한다.
+        HALF_OPEN에서는 그래야 프로브 슬롯이 정리된다.
+        """
         now = time.time() if now is None else now
-        if self.state == "CLOSED":
-            return True
-        if self.state == "OPEN":
-            if now - self.last_failure_time > self.recovery_timeout:
-                self.state = "HALF_OPEN"
-                logger.info("circuit -> HALF_OPEN (probe 허용)")
+        with self._lock:
+            if self.state == "CLOSED":
                 return True
-            return False
-        # HALF_OPEN: 프로브 1건만 허용한다는 전제로, 호출 측이 결과를 바로 report한다고 가정.
-        return True
+            if self.state == "OPEN":
+                if now - self._opened_at <= self.recovery_timeout:
+                    return False
+                self.state = "HALF_OPEN"
+                self._probes_admitted = 0
+                self._probe_successes = 0
+                logger.info("circuit -> HALF_OPEN (probe %d건 허용)", self.half_open_probes)
+            if self._probes_admitted >= self.half_open_probes:
+                return False
+            self._probes_admitted += 1
+            return True
 
-    def report_success(self) -> None:
-        if self.state != "CLOSED":
-            logger.info("circuit -> CLOSED (복구 확인)")
-        self.state = "CLOSED"
-        self.failure_count = 0
+    def report_success(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.state == "HALF_OPEN":
+                self._probe_successes += 1
+                if self._probe_successes < self.half_open_probes:
+                    return
+                logger.info("circuit -> CLOSED (프로브 %d건 성공)", self._probe_successes)
+                self.state = "CLOSED"
+                self._window.clear()
+                self._failures = 0
+                return
+            self._record(True, now)
 
     def report_failure(self, now: float | None = None) -> None:
         now = time.time() if now is None else now
-        self.last_failure_time = now
-        if self.state == "HALF_OPEN":
-            self.state = "OPEN"
-            logger.warning("circuit HALF_OPEN 프로브 실패 -> OPEN 재개방")
-            return
-        self.failure_count += 1
-        if self.failure_count >= self.failure_threshold:
-            self.state = "OPEN"
-            logger.warning("circuit -> OPEN (연속 실패 %d회)", self.failure_count)
+        with self._lock:
+            self.last_failure_time = now
+            if self.state == "HALF_OPEN":
+                self._open(now, "HALF_OPEN 프로브 실패, 재개방")
+                return
+            self._record(False, now)
+            if self.state == "CLOSED" and self._failures >= self.failure_threshold:
+                rate = self._failures / len(self._window)
+                if rate >= self.failure_rate:
+                    self._open(now, f"최근 {self.window_seconds:.0f}초 실패율 {rate:.0%}, 실패 {self._failures}건")
+
+    def report_cancelled(self) -> None:
+        """결과 없이 끝난 호출(경주에서 진 요청 등). HALF_OPEN이면 프로브 슬롯만 돌려준다."""
+        with self._lock:
+            if self.state == "HALF_OPEN" and self._probes_admitted > self._probe_successes:
+                self._probes_admitted -= 1
 
 
 def call_with_fallback(
@@ -82,6 +151,63 @@ def call_with_fallback(
     raise RuntimeError(f"all providers unavailable, last_error={last_error}")
 
 
+async def acall_with_fallback(
+    providers_in_priority: list[str],
+    breakers: dict[str, CircuitBreaker],
+    call_fn: Callable[[str], Awaitable[str]],
+    race: int = 2,
+    hedge_delay_s: float | None = 0.0,
+) -> tuple[str, str]:
+    """call_with_fallback의 async 버전. 사용 가능한 상위 provider 최대 race곳에 동시에 요청한다.
+
+    첫 요청 후 hedge_delay_s가 지나도 응답이 없으면 다음 provider를 추가로 띄운다 (0이면 즉시,
+    None이면 경주 없이 실패할 때만 다음으로 넘어간다). 먼저 성공한 응답을 돌려주고 나머지 요청은
+    취소한다. 실패하면 남은 provider로 계속 폴백한다. 호출자가 이 코루틴을 취소해도 진행 중인 요청은 모두 취소된다.
+    """
+    remaining = iter(providers_in_priority)
+    running: dict[asyncio.Task, str] = {}
+    exhausted = False
+    last_error: Exception | None = None
+
+    def launch_next() -> None:
+        nonlocal exhausted
+        for name in remaining:
+            if breakers[name].is_available():
+                running[asyncio.create_task(call_fn(name))] = name
+                return
+            logger.info("skip provider=%s (circuit OPEN)", name)
+        exhausted = True
+
+    try:
+        launch_next()
+        while running:
+            can_hedge = not exhausted and hedge_delay_s is not None and len(running) < race
+            done, _ = await asyncio.wait(
+                running, timeout=hedge_delay_s if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                launch_next()  # 헤지: 응답이 늦으니 다음 provider도 같이 띄운다
+                continue
+            for task in done:
+                name = running.pop(task)
+                error = task.exception()
+                if error is None:
+                    breakers[name].report_success()
+                    return name, task.result()
+                breakers[name].report_failure()
+                last_error = error
+                logger.warning("provider=%s failed: %s", name, error)
+            if not running and not exhausted:
+                launch_next()
+    finally:
+        for task, name in running.items():
+            task.cancel()
+            breakers[name].report_cancelled()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    raise RuntimeError(f"all providers unavailable, last_error={last_error}")
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
@@ -106,10 +232,46 @@ if __name__ == "__main__":
     print(f"post-open round: used={provider}, resp={text}")
 
     # recovery_timeout 경과 후 HALF_OPEN 프로브가 성공하면 CLOSED로 복귀한다.
-    def now_recovered(name: str) -> str:
-        return f"{name} 복구됨"
-
     future_breaker = breakers["gemini"]
     assert future_breaker.is_available(now=time.time() + 6) is True  # HALF_OPEN 전이 확인
     future_breaker.report_success()
     print("gemini breaker state after recovery probe:", future_breaker.state)
+
+    # 실패율 기반: 성공 사이사이의 산발적 실패로는 열리지 않는다 (실패 3건 / 호출 10건 = 30%).
+    sporadic = CircuitBreaker(failure_threshold=3, failure_rate=0.5, window_seconds=30)
+    for i in range(10):
+        sporadic.report_failure() if i % 3 == 0 and i < 9 else sporadic.report_success()
+    print(f"sporadic failures: count={sporadic.failure_count}, state={sporadic.state}")
+
+    # HALF_OPEN에서 스레드 32개가 동시에 물어도 프로브는 정확히 2건만 통과한다.
+    probed = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05, half_open_probes=2)
+    probed.report_failure()
+    time.sleep(0.1)
+    admitted: list[bool] = []
+    barrier = threading.Barrier(32)
+
+    def ask() -> None:
+        barrier.wait()
+        admitted.append(probed.is_available())
+
+    threads = [threading.Thread(target=ask) for _ in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"half-open probes admitted: {sum(admitted)}/32, state={probed.state}")
+
+    # 경주: gemini는 가끔 1초 넘게 걸리고 groq는 0.1초. 둘을 같이 띄워 먼저 온 응답을 쓴다.
+    async def slow_tail_call(name: str) -> str:
+        await asyncio.sleep({"gemini": 1.2, "groq": 0.1, "cerebras": 0.2}[name])
+        return f"{name} 응답"
+
+    async def race_demo() -> None:
+        race_breakers = {name: CircuitBreaker() for name in priority}
+        for hedge in (None, 0.0):
+            start = time.perf_counter()
+            provider, text = await acall_with_fallback(priority, race_breakers, slow_tail_call, hedge_delay_s=hedge)
+            label = "sequential" if hedge is None else "race top-2"
+            print(f"{label}: used={provider}, {time.perf_counter() - start:.2f}s")
+
+    asyncio.run(race_demo())
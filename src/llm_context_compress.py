@@ -6,23 +6,230 @@ LLMLingua-2 같은 압축 모델이 없는 환경(오프라인·모델 다운로
 중요도 점수를 매기고, 점수 높은 문장부터 목표 토큰 수(단어 수로 근사)에
 맞을 때까지 원문 순서를 지켜 채워 넣는다.
 
-requirements: 표준 라이브러리만 사용
+수 MB짜리 RAG 입력도 다룰 수 있게 문장 분리·토큰 계산·키워드 집계를 한 번의
+순회로 끝내고(compress_stream은 청크 이터러블을 그대로 받고 예산에 비례하는 후보만
+메모리에 둔다), 문장별 토큰 수는 그때 계산한 값을 끝까지 재사용한다. 선택은 전체 정렬
+대신 크기 제한 힙으로 점수 높은 문장을 필요한 만큼만 뽑고, 검색된 청크 여러 개는
+compress_many로 프로세스 병렬 압축한다.
+
+단어 수 근사는 한국어(어절 하나가 토큰 여러 개)와 코드(기호가 전부 토큰)에서
+크게 어긋나므로, set_tokenizer()로 로컬 BPE 어휘 파일(tiktoken 형식,
+예: cl100k_base.tiktoken, o200k_base.tiktoken)을 꽂으면 실제 토큰 수로 예산을 잡는다.
+사전 분할 규칙은 어휘마다 달라 파일 이름(또는 어휘 크기)으로 고르고, 모르는 어휘는 거절한다. 네트워크는
+쓰지 않는다. --report는 _posts 코퍼스에서 근사치와 실제 토큰 수를 비교한다.
+
+requirements: 표준 라이브러리만 사용 (tiktoken이 있으면 BPE 계산에, regex가 있으면 정확한 사전 분할에 사용)
+
+독립 실행:
+    python3 llm_context_compress.py
+    python3 llm_context_compress.py --vocab cl100k_base.tiktoken --report
 """
 from __future__ import annotations
 
+import argparse
+import base64
+import heapq
 import logging
+import os
+import pickle
 import re
-from collections import Counter
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Protocol, Sequence
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+try:
+    import tiktoken  # type: ignore
+
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+try:
+    import regex  # type: ignore
+
+    HAS_REGEX = True
+except ImportError:
+    HAS_REGEX = False
+
 SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?다요])\s+")
 WORD_RE = re.compile(r"[\w가-힣]+")
 
 # 문장 중요도 판단에서 제외할 흔한 조사·어미 성격의 짧은 토큰
 STOPWORDS = {"이", "가", "은", "는", "을", "를", "그리고", "그러나", "하지만"}
 
+# cl100k_base 사전 분할 규칙. tiktoken은 그대로 쓴다. 순수 파이썬 경로는 regex 모듈(tiktoken의
+# 의존성)이 있으면 같은 패턴을 써서 tiktoken과 분할·토큰 수가 같다. 없으면 \p{L}/\p{N}을 표준 re로
+# 옮긴 근사 패턴을 쓴다. \w와 \p{L}\p{N}의 차이(결합 문자 등)와 소유 수량자가 없다는 점 때문에
+# 드물게 분할이 달라 토큰 수가 어긋날 수 있다.
+CL100K_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*"""
+    r"""|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+APPROX_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?(?:[^\s\w]|_)+[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+PRETOKENIZE_RE = regex.compile(CL100K_PATTERN) if HAS_REGEX else re.compile(APPROX_PATTERN)
+# o200k_base(GPT-4o 계열) 사전 분할 규칙. 표준 re로 옮긴 근사가 없어 순수 파이썬 경로는 regex 모듈이 있어야 한다
+O200K_PATTERN = "|".join(
+    [
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""\p{N}{1,3}""",
+        r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+        r"""\s*[\r\n]+""",
+        r"""\s+(?!\S)""",
+        r"""\s+""",
+    ]
+)
+# 어휘 이름 -> 사전 분할 규칙. 이름이 바뀐 파일은 어휘 크기(특수 토큰 제외)로 알아본다
+VOCAB_PATTERNS = {"cl100k_base": CL100K_PATTERN, "o200k_base": O200K_PATTERN}
+VOCAB_SIZES = {100256: "cl100k_base", 199998: "o200k_base"}
+# 짧은 문자열(문장·청크)만 캐시한다. 수 MB 문서 전체를 키로 잡아두지 않기 위해서다.
+COUNT_CACHE_SIZE = 65536
+COUNT_CACHE_MAX_LEN = 4096
+
+
+class TokenCounter(Protocol):
+    name: str
+    path: str | None
+
+    def count(self, text: str) -> int: ...
+
+
+class RegexTokenCounter:
+    """기존 단어 정규식 근사. 외부 파일 없이 동작하는 기본값."""
+
+    name = "regex"
+    path = None
+
+    def count(self, text: str) -> int:
+        return len(WORD_RE.findall(text))
+
+
+def _load_tiktoken_ranks(path: str | Path) -> dict[bytes, int]:
+    """tiktoken 형식 어휘 파일(줄마다 'base64토큰 순위')을 읽는다."""
+    ranks: dict[bytes, int] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+class BPETokenCounter:
+    """로컬 BPE 어휘 파일 기반 토큰 카운터.
+
+    tiktoken이 설치돼 있으면 같은 어휘로 Encoding을 만들어 Rust 구현을 쓰고,
+    없으면 순위가 가장 낮은 쌍부터 합치는 바이트 단위 BPE를 직접 돌린다.
+    사전 분할된 조각은 반복이 많아 조각별 결과를 캐시한다. 순수 파이썬 경로의 토큰 수는
+    regex 모듈이 있을 때만 tiktoken과 정확히 같다(PRETOKENIZE_RE 참고).
+
+    분할 규칙(pattern)을 주지 않으면 VOCAB_PATTERNS에서 파일 이름, 없으면 어휘 크기로 고른다.
+    둘 다 모르는 어휘면 토큰 수가 조용히 틀리지 않도록 ValueError를 낸다.
+    """
+
+    name = "bpe"
+
+    def __init__(self, path: str | Path, pattern: str | None = None) -> None:
+        self.path = str(path)
+        self.ranks = _load_tiktoken_ranks(path)
+        if pattern is None:
+            vocab = Path(path).stem if Path(path).stem in VOCAB_PATTERNS else VOCAB_SIZES.get(len(self.ranks))
+            if vocab is None:
+                raise ValueError(
+                    f"{path}: 사전 분할 규칙을 알 수 없는 어휘입니다 ({', '.join(VOCAB_PATTERNS)} 지원). pattern을 지정하세요."
+                )
+            pattern = VOCAB_PATTERNS[vocab]
+        self.pattern = pattern
+        self._encoding = None
+        self._pretokenize = None
+        if HAS_TIKTOKEN:
+            self._encoding = tiktoken.Encoding(
+                name=Path(path).stem, pat_str=pattern, mergeable_ranks=self.ranks, special_tokens={}
+            )
+        elif pattern == CL100K_PATTERN:
+            self._pretokenize = PRETOKENIZE_RE
+        elif HAS_REGEX:
+            self._pretokenize = regex.compile(pattern)
+        else:
+            raise ValueError(f"{path}: cl100k 외 어휘의 순수 파이썬 계산에는 regex 모듈이 필요합니다.")
+        self._piece_cache: dict[bytes, int] = {}
+
+    def __reduce__(self):
+        # 작업 프로세스로 보낼 때는 어휘 전체 대신 (경로, 분할 규칙)만 보내고 그쪽에서 다시 읽는다
+        return type(self), (self.path, self.pattern)
+
+    def _count_piece(self, piece: bytes) -> int:
+        if piece in self.ranks:
+            return 1
+        cached = self._piece_cache.get(piece)
+        if cached is not None:
+            return cached
+        parts = [piece[i : i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank, best_i = None, -1
+            for i in range(len(parts) - 1):
+                rank = self.ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_i = rank, i
+            if best_rank is None:
+                break
+            parts[best_i : best_i + 2] = [parts[best_i] + parts[best_i + 1]]
+        if len(self._piece_cache) < COUNT_CACHE_SIZE:
+            self._piece_cache[piece] = len(parts)
+        return len(parts)
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        return sum(self._count_piece(m.group().encode("utf-8")) for m in self._pretokenize.finditer(text))
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        if self._encoding is not None:
+            return [len(ids) for ids in self._encoding.encode_ordinary_batch(texts)]
+        return [self.count(t) for t in texts]
+
+
+_TOKENIZER: TokenCounter = RegexTokenCounter()
+_COUNT_CACHE: OrderedDict[str, int] = OrderedDict()
+# write_term처럼 여러 스레드가 count_tokens를 같이 부르므로 캐시 조회·갱신은 잠근다.
+# 토큰 계산 자체는 잠금 밖에서 한다
+_COUNT_LOCK = threading.Lock()
+
+
+def load_tokenizer(vocab_path: str | Path | None) -> TokenCounter:
+    """어휘 파일 경로가 있으면 BPE 카운터를, 없으면 단어 정규식 근사를 만든다."""
+    return BPETokenCounter(vocab_path) if vocab_path else RegexTokenCounter()
+
+
+def set_tokenizer(tokenizer: TokenCounter | str | Path | None) -> TokenCounter:
+    """이후 count_tokens/압축에 쓸 토큰 카운터를 바꾸고 캐시를 비운다."""
+    global _TOKENIZER
+    _TOKENIZER = load_tokenizer(tokenizer) if tokenizer is None or isinstance(tokenizer, (str, Path)) else tokenizer
+    with _COUNT_LOCK:
+        _COUNT_CACHE.clear()
+    return _TOKENIZER
+
+
+def get_tokenizer() -> TokenCounter:
+    return _TOKENIZER
+
+
+def _remember(text: str, n: int) -> None:
+    if len(text) <= COUNT_CACHE_MAX_LEN:
+        with _COUNT_LOCK:
+            _COUNT_CACHE[text] = n
+            if len(_COUNT_CACHE) > COUNT_CACHE_SIZE:
+                _COUNT_CACHE.popitem(last=False)
+
 
 def split_sentences(text: str) -> list[str]:
     """텍스트를 문장 단위로 분리한다. 빈 문장은 제거한다."""
@@ -31,8 +238,90 @@ def split_sentences(text: str) -> list[str]:
 
 
 def count_tokens(text: str) -> int:
-    """토큰 수를 단어 수로 근사한다."""
-    return len(WORD_RE.findall(text))
+    """현재 토큰 카운터로 토큰 수를 센다. 기본값은 단어 수 근사다."""
+    with _COUNT_LOCK:
+        cached = _COUNT_CACHE.get(text)
+    if cached is not None:
+        return cached
+    n = _TOKENIZER.count(text)
+    _remember(text, n)
+    return n
+
+
+def count_tokens_many(texts: Sequence[str]) -> list[int]:
+    """여러 문자열의 토큰 수를 한 번에 센다. 캐시에 없는 것만 모아 배치로 계산한다."""
+    with _COUNT_LOCK:
+        counts: list[int | None] = [_COUNT_CACHE.get(t) for t in texts]
+    missing = [i for i, c in enumerate(counts) if c is None]
+    if missing:
+        batch = getattr(_TOKENIZER, "count_batch", None)
+        todo = [texts[i] for i in missing]
+        fresh = batch(todo) if batch else [_TOKENIZER.count(t) for t in todo]
+        for i, n in zip(missing, fresh):
+            counts[i] = n
+            _remember(texts[i], n)
+    return counts  # type: ignore[return-value]
+
+
+@dataclass
+class _Sentence:
+    """한 번 분석한 문장. 토큰 수와 키워드 빈도를 캐시해 두고 재계산하지 않는다."""
+
+    index: int
+    text: str
+    tokens: int
+    keywords: Counter
+
+
+def iter_sentences(chunks: Iterable[str]) -> Iterator[str]:
+    """텍스트 청크 스트림을 받아 문장이 완성되는 대로 내보낸다.
+
+    청크 경계에 걸친 문장은 조각을 모아 두었다가 경계를 찾으면 이어 붙인다. 경계는 새 청크와
+    직전 청크의 마지막 글자만 보고 찾으므로, 긴 문장이 여러 청크에 걸쳐도 다시 훑지 않는다.
+    """
+    pieces: list[str] = []
+    last = ""  # 직전 청크의 마지막 글자. 경계 뒤보기([.!?다요])가 청크를 넘을 때 쓴다
+    for chunk in chunks:
+        if not chunk:
+            continue
+        offset = len(last)
+        start = 0
+        for m in SENTENCE_SPLIT_RE.finditer(last + chunk):
+            pieces.append(chunk[start : m.start() - offset])
+            sentence = "".join(pieces).strip()
+            if sentence:
+                yield sentence
+            pieces = []
+            start = m.end() - offset
+        pieces.append(chunk[start:])
+        last = chunk[-1]
+    sentence = "".join(pieces).strip()
+    if sentence:
+        yield sentence
+
+
+def _analyze_one(idx: int, sent: str, word_counted: bool) -> _Sentence:
+    words = WORD_RE.findall(sent)
+    tokens = len(words) if word_counted else count_tokens(sent)
+    return _Sentence(idx, sent, tokens, Counter(w for w in words if w not in STOPWORDS))
+
+
+def _analyze(sentences: Iterable[str]) -> tuple[list[_Sentence], Counter]:
+    """문장마다 단어 추출을 한 번만 해서 토큰 수·키워드 빈도·전체 빈도를 함께 만든다."""
+    records: list[_Sentence] = []
+    freq: Counter = Counter()
+    word_counted = isinstance(_TOKENIZER, RegexTokenCounter)
+    for idx, sent in enumerate(sentences):
+        record = _analyze_one(idx, sent, word_counted)
+        freq.update(record.keywords)
+        records.append(record)
+    return records, freq
+
+
+def _score(record: _Sentence, freq: Counter) -> float:
+    keyword_score = sum(freq[w] * n for w, n in record.keywords.items())
+    length_score = sum(record.keywords.values()) ** 0.5  # 너무 짧은 문장이 과도하게 뽑히지 않도록 완화
+    return keyword_score + length_score
 
 
 def score_sentences(sentences: list[str]) -> list[float]:
@@ -41,18 +330,63 @@ def score_sentences(sentences: list[str]) -> list[float]:
     점수 = (문장 내 고빈도 키워드 등장 수) + (문장 길이에 대한 로그 가중치).
     전체 문서에서 자주 등장하는 단어일수록 핵심 키워드로 간주한다.
     """
-    all_words: list[str] = []
-    for sent in sentences:
-        all_words.extend(w for w in WORD_RE.findall(sent) if w not in STOPWORDS)
-    freq = Counter(all_words)
+    records, freq = _analyze(sentences)
+    return [_score(r, freq) for r in records]
+
+
+def _select(records: list[_Sentence], freq: Counter, target_tokens: int) -> list[_Sentence]:
+    """점수 높은 순으로 예산을 채운다.
 
-    scores = []
-    for sent in sentences:
-        words = [w for w in WORD_RE.findall(sent) if w not in STOPWORDS]
-        keyword_score = sum(freq[w] for w in words)
-        length_score = len(words) ** 0.5  # 너무 짧은 문장이 과도하게 뽑히지 않도록 완화
-        scores.append(keyword_score + length_score)
-    return scores
+    전체를 힙으로 만들지 않고, 예산을 채우는 데 필요할 만큼(평균 문장 길이로 어림한 개수의
+    두 배)만 크기 제한 힙(heapq.nlargest)으로 뽑는다. 건너뛴 문장이 많아 모자라면 개수를 늘린다.
+    """
+    avg_tokens = max(1.0, sum(r.tokens for r in records) / max(len(records), 1))
+    want = max(16, int(2 * target_tokens / avg_tokens))
+    keyed = [(_score(r, freq), -r.index, r) for r in records]  # 점수는 한 번만 계산한다
+    selected: list[_Sentence] = []
+    used_tokens = 0
+    done = 0
+    while used_tokens < target_tokens and done < len(keyed):
+        ranked = [r for _, _, r in heapq.nlargest(want, keyed, key=lambda k: k[:2])]
+        for record in ranked[done:]:
+            if used_tokens >= target_tokens:
+                break
+            if used_tokens + record.tokens > target_tokens and selected:
+                continue
+            selected.append(record)
+            used_tokens += record.tokens
+        done = len(ranked)
+        want *= 2
+    selected.sort(key=lambda r: r.index)
+    return selected
+
+
+def _compress_records(
+    records: list[_Sentence], freq: Counter, target_tokens: int, total: int | None = None, sentences: int | None = None
+) -> tuple[str | None, dict]:
+    """압축 결과와 통계를 돌려준다. 이미 예산 안이면 결과 대신 None을 돌려준다.
+
+    스트리밍에서는 records가 후보 풀이라 원본 전체 토큰 수·문장 수를 따로 받는다.
+    """
+    total = sum(r.tokens for r in records) if total is None else total
+    sentences = len(records) if sentences is None else sentences
+    if total <= target_tokens or not records:
+        return None, {"original": total, "compressed": total, "sentences": sentences, "selected": sentences}
+    selected = _select(records, freq, target_tokens)
+    stats = {
+        "original": total,
+        "compressed": sum(r.tokens for r in selected),
+        "sentences": sentences,
+        "selected": len(selected),
+    }
+    return " ".join(r.text for r in selected), stats
+
+
+def _log_stats(stats: dict) -> None:
+    logger.info(
+        "압축 완료: 원본 %d토큰 -> %d토큰 (문장 %d개 중 %d개 선택)",
+        stats["original"], stats["compressed"], stats["sentences"], stats["selected"],
+    )
 
 
 def compress_to_budget(text: str, target_tokens: int) -> str:
@@ -61,37 +395,157 @@ def compress_to_budget(text: str, target_tokens: int) -> str:
     중요도 순으로 문장을 고르되, 최종 출력은 원문 순서를 유지해
     문맥이 어색해지지 않게 한다. 원문이 이미 목표보다 짧으면 그대로 반환한다.
     """
-    if count_tokens(text) <= target_tokens:
+    records, freq = _analyze(split_sentences(text))
+    result, stats = _compress_records(records, freq, target_tokens)
+    if result is None:
         return text
+    _log_stats(stats)
+    return result
 
-    sentences = split_sentences(text)
-    if not sentences:
-        return text
 
-    scores = score_sentences(sentences)
-    ranked_idx = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+# compress_stream 후보 풀 크기(예산 대비 토큰 배수). 풀이 두 배(적어도 STREAM_TRIM_TOKENS)를
+# 넘으면 그때까지의 빈도로 다시 점수를 매겨 이 크기로 줄인다. 줄이는 횟수를 아끼려고 하한을 둔다.
+STREAM_POOL_FACTOR = 4
+STREAM_TRIM_TOKENS = 50_000
 
-    selected: set[int] = set()
-    used_tokens = 0
-    for idx in ranked_idx:
-        tok = count_tokens(sentences[idx])
-        if used_tokens + tok > target_tokens and selected:
-            continue
-        selected.add(idx)
-        used_tokens += tok
-        if used_tokens >= target_tokens:
-            break
 
-    ordered = [sentences[i] for i in sorted(selected)]
-    result = " ".join(ordered)
-    logger.info(
-        "압축 완료: 원본 %d토큰 -> %d토큰 (문장 %d개 중 %d개 선택)",
-        count_tokens(text), count_tokens(result), len(sentences), len(selected),
-    )
+def compress_stream(chunks: Iterable[str], target_tokens: int) -> str:
+    """파일 읽기 등으로 들어오는 텍스트 청크를 한 번만 훑어 목표 토큰 수로 압축한다.
+
+    문장을 전부 모아 두지 않고 예산의 STREAM_POOL_FACTOR배 토큰만큼의 후보만 남긴다(입력이
+    STREAM_TRIM_TOKENS보다 짧으면 전부 남아 compress_to_budget과 같은 결과가 된다).
+    중간에 버리는 문장은 그 시점까지의 키워드 빈도로 점수를 매기므로, 끝까지 본 빈도로
+    고르는 compress_to_budget과 결과가 다를 수 있다. 메모리는 후보 풀과 어휘 빈도만큼이다.
+    """
+    pool_tokens = max(target_tokens, 1) * STREAM_POOL_FACTOR
+    trim_at = max(2 * pool_tokens, STREAM_TRIM_TOKENS)
+    word_counted = isinstance(_TOKENIZER, RegexTokenCounter)
+    pool: list[_Sentence] = []
+    freq: Counter = Counter()
+    used = total = sentences = 0
+    for idx, sent in enumerate(iter_sentences(chunks)):
+        record = _analyze_one(idx, sent, word_counted)
+        freq.update(record.keywords)
+        pool.append(record)
+        used += record.tokens
+        total += record.tokens
+        sentences += 1
+        if used > trim_at:
+            kept = _select(pool, freq, pool_tokens)
+            pool, used = kept, sum(r.tokens for r in kept)
+
+    result, stats = _compress_records(pool, freq, target_tokens, total, sentences)
+    if result is None:
+        return " ".join(r.text for r in pool)
+    _log_stats(stats)
     return result
 
 
+def _compress_quiet(args: tuple[str, int]) -> str:
+    text, target_tokens = args
+    records, freq = _analyze(split_sentences(text))
+    result, _ = _compress_records(records, freq, target_tokens)
+    return text if result is None else result
+
+
+def compress_many(
+    texts: Sequence[str], target_tokens: int | Sequence[int], max_workers: int | None = None
+) -> list[str]:
+    """검색된 청크 여러 개를 각자의 예산으로 병렬 압축한다. 결과 순서는 입력 순서와 같다.
+
+    순수 파이썬 연산이라 GIL을 피하려고 프로세스 풀을 쓴다. 청크가 적거나
+    max_workers=1이면 프로세스 기동 비용이 더 크므로 현재 프로세스에서 처리한다.
+    작업 프로세스는 지금 토큰 카운터를 pickle로 넘겨받는다. pickle할 수 없는 사용자 카운터면
+    다른 카운터로 예산을 잡지 않도록 현재 프로세스에서 순서대로 처리한다.
+    """
+    budgets = [target_tokens] * len(texts) if isinstance(target_tokens, int) else list(target_tokens)
+    if len(budgets) != len(texts):
+        raise ValueError("texts와 target_tokens 길이가 다릅니다.")
+    jobs = list(zip(texts, budgets))
+    if max_workers == 1 or len(jobs) < 4:
+        return [_compress_quiet(job) for job in jobs]
+    try:
+        pickle.dumps(_TOKENIZER)
+    except Exception as e:
+        logger.warning("토큰 카운터 %r를 작업 프로세스로 보낼 수 없어 순차 처리합니다: %s", _TOKENIZER, e)
+        return [_compress_quiet(job) for job in jobs]
+    workers = max_workers or os.cpu_count() or 1
+    # BPETokenCounter는 경로와 분할 규칙만 pickle되고 작업 프로세스에서 어휘 파일을 다시 읽는다.
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_tokenizer, initargs=(_TOKENIZER,)) as pool:
+        return list(pool.map(_compress_quiet, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+CODE_BLOCK_RE = re.compile(r"```.*?```", re.DOTALL)
+
+
+def _split_code_blocks(markdown: str) -> Iterator[tuple[str, str]]:
+    """마크다운을 ('text', 본문) / ('code', 코드블록) 조각으로 나눈다."""
+    pos = 0
+    for m in CODE_BLOCK_RE.finditer(markdown):
+        if m.start() > pos:
+            yield "text", markdown[pos : m.start()]
+        yield "code", m.group()
+        pos = m.end()
+    if pos < len(markdown):
+        yield "text", markdown[pos:]
+
+
+def tokenizer_report(posts_dir: str | Path, tokenizer: TokenCounter, estimator: TokenCounter | None = None) -> dict:
+    """_posts 코퍼스에서 근사치(estimator)와 실제 토큰 수(tokenizer)를 본문/코드별로 비교한다.
+
+    파일·조각마다 상대 오차를 구해 평균(MAPE)을 내고, 두 카운터의 처리 속도(µs/KB)도 함께 잰다.
+    """
+    estimator = estimator or RegexTokenCounter()
+    stats = {
+        kind: {"segments": 0, "bytes": 0, "estimated": 0, "actual": 0, "abs_pct_err": 0.0, "est_s": 0.0, "act_s": 0.0}
+        for kind in ("text", "code")
+    }
+    for md in sorted(Path(posts_dir).rglob("*.md")):
+        for kind, segment in _split_code_blocks(md.read_text(encoding="utf-8")):
+            if not segment.strip():
+                continue
+            start = time.perf_counter()
+            est = estimator.count(segment)
+            mid = time.perf_counter()
+            act = tokenizer.count(segment)
+            end = time.perf_counter()
+
+            row = stats[kind]
+            row["segments"] += 1
+            row["bytes"] += len(segment.encode("utf-8"))
+            row["estimated"] += est
+            row["actual"] += act
+            row["abs_pct_err"] += abs(est - act) / max(act, 1)
+            row["est_s"] += mid - start
+            row["act_s"] += end - mid
+
+    for kind, row in stats.items():
+        if not row["segments"]:
+            continue
+        kb = row["bytes"] / 1024
+        logger.info(
+            "[%s] 조각 %d개 %.0fKB | 근사 %d / 실제 %d토큰 (비율 %.2f, MAPE %.1f%%) | 근사 %.1fµs/KB, 실제 %.1fµs/KB",
+            kind, row["segments"], kb, row["estimated"], row["actual"],
+            row["estimated"] / max(row["actual"], 1), 100 * row["abs_pct_err"] / row["segments"],
+            1e6 * row["est_s"] / kb, 1e6 * row["act_s"] / kb,
+        )
+    return stats
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="토큰 예산 기반 추출요약 압축 데모")
+    parser.add_argument("--vocab", help="로컬 BPE 어휘 파일(tiktoken 형식) 경로")
+    parser.add_argument("--report", action="store_true", help="_posts 코퍼스로 근사치 vs 실제 토큰 수 비교")
+    parser.add_argument("--posts", default=Path(__file__).resolve().parent.parent / "_posts", type=Path)
+    args = parser.parse_args()
+
+    if args.report:
+        if not args.vocab:
+            parser.error("--report에는 --vocab이 필요합니다.")
+        tokenizer_report(args.posts, load_tokenizer(args.vocab))
+        raise SystemExit(0)
+
+    set_tokenizer(args.vocab)
     sample = (
         "RAG 파이프라인은 검색된 문서를 LLM 컨텍스트에 그대로 넣는다. "
         "문서가 길어지면 토큰 한도를 초과하거나 비용이 급증한다. "
@@ -106,3 +560,10 @@ if __name__ == "__main__":
         compressed = compress_to_budget(sample, budget)
         print(f"\n목표 {budget}토큰 -> 실제 {count_tokens(compressed)}토큰")
         print(compressed)
+
+    # 긴 문서를 청크 스트림으로 흘려 넣어도 문장 경계가 유지된다.
+    chunks = (sample[i : i + 37] for i in range(0, len(sample), 37))
+    print(f"\n스트리밍 30토큰: {compress_stream(chunks, 30)}")
+
+    batch = compress_many([sample] * 8, 15)
+    print(f"\n배치 압축 {len(batch)}건, 첫 결과 {count_tokens(batch[0])}토큰")
@@ -0,0 +1,225 @@
+"""에이전트 대화 히스토리를 토큰 예산 안에 유지하는 ConversationHistory.
+
+매 턴 전체 히스토리를 다시 보내면 요청 크기와 지연·비용이 턴 수에 비례해 늘어난다.
+ConversationHistory는 (시스템 프롬프트 + 이전 대화 요약)을 prefix로, 최근 턴만 메시지로 유지한다.
+
+- prefix + 최근 턴이 budget_tokens를 넘으면 최근 keep_recent_tokens만 남기고 오래된 턴을 떼어
+  백그라운드 스레드에서 기존 요약과 합쳐 다시 요약한다
+- 요약이 끝나기 전까지는 지금 히스토리를 그대로 보낸다. hard_limit_tokens를 넘으면 요약을 기다린다
+- 요약은 예산을 넘을 때만 한 번에 갱신되므로 prefix는 여러 턴 동안 바이트 단위로 같다.
+  chat_with_prefix로 보내면 프로바이더 prefix 캐시(Gemini cachedContents, OpenRouter cache_control)가 계속 맞는다
+
+요약기 기본값은 llm_context_compress의 추출요약이라 API 호출이 없다. llm_summarizer(client, model)로
+LLM 요약을 꽂을 수 있고, 요약기가 실패하면 추출요약으로 대신한다.
+
+독립 실행:
+    python3 -m src.llm_conversation_history
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from src.llm_context_compress import compress_to_budget, count_tokens
+
+logger = logging.getLogger(__name__)
+
+# (이전 요약, 새로 요약할 메시지들, 목표 토큰 수) -> 새 요약
+Summarizer = Callable[[str, list[dict], int], str]
+
+SUMMARY_HEADER = "[이전 대화 요약]"
+SUMMARY_PROMPT = (
+    "아래는 지금까지의 대화와 그 이전 요약이다. 이후 대화를 이어가는 데 필요한 사실, 결정, "
+    "코드·파일 이름, 미해결 질문만 남겨 {target_tokens} 토큰 이내로 요약하라. 요약만 출력하라.\n\n"
+    "이전 요약:\n{previous}\n\n대화:\n{conversation}"
+)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _background() -> ThreadPoolExecutor:
+    """요약 작업용 공용 스레드 풀. 첫 요약 때 만든다."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        return _executor
+
+
+def _render(messages: list[dict]) -> str:
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def extractive_summarizer(previous_summary: str, messages: list[dict], target_tokens: int) -> str:
+    """이전 요약과 새 턴을 이어 붙여 중요 문장만 남긴다 (API 호출 없음)."""
+    text = "\n".join(part for part in (previous_summary, _render(messages)) if part)
+    return compress_to_budget(text, target_tokens)
+
+
+def llm_summarizer(client, model: str, temperature: float = 0.2) -> Summarizer:
+    """BaseChatAPI 클라이언트로 요약하는 Summarizer를 만든다. 값싼 모델을 주는 것이 보통이다."""
+
+    def summarize(previous_summary: str, messages: list[dict], target_tokens: int) -> str:
+        prompt = SUMMARY_PROMPT.format(
+            target_tokens=target_tokens, previous=previous_summary or "(없음)", conversation=_render(messages)
+        )
+        return client.chat(model, prompt, temperature=temperature)
+
+    return summarize
+
+
+class ConversationHistory:
+    """시스템 프롬프트 + 롤링 요약 + 최근 턴으로 이루어진 대화 히스토리. 스레드에서 같이 써도 된다."""
+
+    def __init__(
+        self,
+        system_prompt: str,
+        budget_tokens: int = 6000,
+        keep_recent_tokens: int | None = None,
+        summary_tokens: int | None = None,
+        hard_limit_tokens: int | None = None,
+        summarize: Summarizer = extractive_summarizer,
+    ) -> None:
+        self.system_prompt = system_prompt
+        self.budget_tokens = budget_tokens
+        self.keep_recent_tokens = keep_recent_tokens or budget_tokens // 2
+        self.summary_tokens = summary_tokens or budget_tokens // 4
+        self.hard_limit_tokens = hard_limit_tokens or budget_tokens * 2
+        self.summarize = summarize
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._system_size = count_tokens(system_prompt)
+        self.reset()
+
+    def reset(self) -> None:
+        """요약과 턴을 모두 비운다. 진행 중인 요약 결과는 버린다."""
+        with self._lock:
+            self.summary = ""
+            self.turns: list[dict] = []
+            self._summary_size = 0
+            self._sizes: list[int] = []
+            self._total = 0
+            self._pending: Future | None = None
+            self._pending_args: tuple[str, list[dict], int] | None = None
+
+    @property
+    def tokens(self) -> int:
+        """지금 요청 하나에 들어갈 토큰 수 (prefix + 최근 턴)"""
+        return self._system_size + self._summary_size + self._total
+
+    def prefix(self) -> str:
+        """캐시 가능한 앞부분: 시스템 프롬프트와 이전 대화 요약. 요약이 갱신될 때만 바뀐다."""
+        if not self.summary:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\n{SUMMARY_HEADER}\n{self.summary}"
+
+    def append(self, role: str, content: str) -> None:
+        with self._lock:
+            self.turns.append({"role": role, "content": content})
+            self._sizes.append(count_tokens(content))
+            self._total += self._sizes[-1]
+
+    def pop(self) -> dict:
+        """마지막 턴을 되돌린다. 취소되거나 실패한 요청의 user 메시지를 지울 때 쓴다."""
+        with self._lock:
+            self._total -= self._sizes.pop()
+            return self.turns.pop()
+
+    def messages(self) -> list[dict]:
+        """요청에 보낼 최근 턴. 끝난 요약을 반영하고, hard_limit_tokens를 넘으면 진행 중인 요약을 기다린다."""
+        self._apply_finished(wait=self.tokens > self.hard_limit_tokens)
+        with self._lock:
+            return list(self.turns)
+
+    def full_messages(self) -> list[dict]:
+        """OpenAI 형식 전체 메시지 (prefix를 system 메시지로)"""
+        turns = self.messages()
+        return [{"role": "system", "content": self.prefix()}] + turns
+
+    def compact(self) -> bool:
+        """예산을 넘었으면 오래된 턴을 떼어 백그라운드 요약을 건다. 요약을 걸었으면 True."""
+        self._apply_finished(wait=False)
+        with self._lock:
+            if self._pending is not None or self.tokens <= self.budget_tokens:
+                return False
+            cut = self._cut_index()
+            if cut == 0:
+                return False
+            self._pending_args = (self.summary, self.turns[:cut], self.summary_tokens)
+            self._pending = _background().submit(self.summarize, *self._pending_args)
+        logger.debug("history compaction started: %d turns", cut)
+        return True
+
+    def _cut_index(self) -> int:
+        """뒤에서부터 keep_recent_tokens만큼 남기고, 남는 쪽이 user 메시지로 시작하는 자리를 찾는다."""
+        cut, kept = len(self.turns), 0
+        for i in range(len(self.turns) - 1, -1, -1):
+            if kept + self._sizes[i] > self.keep_recent_tokens:
+                break
+            kept += self._sizes[i]
+            cut = i
+        while cut < len(self.turns) and self.turns[cut]["role"] != "user":
+            cut += 1
+        return cut
+
+    def _apply_finished(self, wait: bool) -> None:
+        with self._lock:
+            pending, args = self._pending, self._pending_args
+        if pending is None or not (wait or pending.done()):
+            return
+        previous, compacted, target = args
+        try:
+            summary = pending.result()
+        except Exception as e:  # noqa: BLE001 - 요약기(LLM 호출) 실패는 추출요약으로 대신한다
+            logger.warning("history summarizer failed, falling back to extractive summary: %s", e)
+            summary = extractive_summarizer(previous, compacted, target)
+        with self._lock:
+            if self._pending is not pending:  # reset() 등으로 이미 버려졌다
+                return
+            n = len(compacted)
+            self.summary = summary.strip()
+            self._summary_size = count_tokens(self.summary)
+            self._total -= sum(self._sizes[:n])
+            del self.turns[:n], self._sizes[:n]
+            self._pending, self._pending_args = None, None
+            self.compactions += 1
+        logger.info("history compacted: %d turns -> summary %d tokens, now %d tokens", n, self._summary_size, self.tokens)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    logging.getLogger("src.llm_context_compress").setLevel(logging.WARNING)
+
+    # 40턴짜리 코딩 대화를 흉내 낸다. 응답은 매번 비슷한 길이의 설명문이다.
+    def fake_reply(turn: int) -> str:
+        return " ".join(
+            f"{turn}번째 답변의 {i}번째 문장에서는 함수 handler_{turn}와 모듈 service_{i % 5}의 동작을 설명한다."
+            for i in range(12)
+        )
+
+    history = ConversationHistory("You are a senior Python developer.", budget_tokens=1500)
+    naive_tokens = count_tokens(history.system_prompt)
+    prefixes: set[str] = set()
+    for turn in range(1, 41):
+        prompt = f"{turn}번째 요청: handler_{turn}를 리팩토링하고 테스트를 추가해 주세요."
+        history.append("user", prompt)
+        naive_tokens += count_tokens(prompt)
+        sent = history.messages()
+        prefixes.add(history.prefix())
+        if turn % 5 == 0:
+            print(
+                f"turn {turn:2d}: 보낸 토큰 {history.tokens:5d} (메시지 {len(sent):2d}개) | "
+                f"전체 히스토리였다면 {naive_tokens:5d}"
+            )
+        time.sleep(0.02)  # 프로바이더 호출 동안 백그라운드 요약이 끝난다
+        reply = fake_reply(turn)
+        history.append("assistant", reply)
+        naive_tokens += count_tokens(reply)
+        history.compact()
+
+    print(f"요약 {history.compactions}회, 서로 다른 prefix {len(prefixes)}개 / 40턴")
+    print("요약 앞부분:", history.summary[:120], "...")
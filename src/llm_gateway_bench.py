@@ -0,0 +1,187 @@
+"""llm_gateway_router FastAPI 앱의 동시 연결 처리량(RPS)과 p99 지연을 재는 로컬 벤치마크.
+
+스텁 provider(지연 50ms ± 10ms) 두 개 뒤에 게이트웨이를 uvicorn으로 별도 프로세스에 띄우고,
+keep-alive 연결 1,000개로 요청을 쏟아 부어 아래 구성을 비교한다.
+
+- sync def: 기존 방식. 요청마다 스레드풀 워커를 점유하고 provider 호출 동안 블로킹한다
+- async: async 엔드포인트 + agenerate()
+- async+backpressure: provider별 동시 요청 상한과 대기 기한(넘기면 503)
+- async SSE: stream=true로 chat.completion.chunk를 끝까지 받는 시간
+
+클라이언트는 연결 수천 개를 가볍게 유지하려고 asyncio 스트림으로 HTTP/1.1을 직접 주고받는다.
+서버와 클라이언트가 같은 머신에서 돌므로 코어가 적으면 수치가 함께 눌린다.
+
+독립 실행:
+    python llm_gateway_bench.py
+    python llm_gateway_bench.py --connections 1000 --requests 10000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import socket
+import time
+from typing import Any
+
+from fastapi import FastAPI
+
+from llm_gateway_router import ChatCompletionRequest, Router, StubProvider, build_app
+
+logger = logging.getLogger("llm_gateway_bench")
+
+SCENARIOS = ("sync def", "async", "async+backpressure", "async SSE")
+
+
+def _providers() -> list[StubProvider]:
+    return [
+        StubProvider("stub-a", "gemini", latency_s=0.050, jitter_s=0.010, seed=1),
+        StubProvider("stub-b", "gemini", latency_s=0.050, jitter_s=0.010, seed=2),
+    ]
+
+
+def _legacy_app(router: Router) -> FastAPI:
+    """비교 기준: 변경 전 build_app과 같은 plain def 엔드포인트"""
+    app = FastAPI(title="mini-llm-gateway-sync")
+
+    @app.post("/v1/chat/completions")
+    def chat_completions(req: ChatCompletionRequest) -> dict[str, Any]:
+        return router.route(req)
+
+    return app
+
+
+def _make_app(scenario: str) -> FastAPI:
+    if scenario == "sync def":
+        return _legacy_app(Router(_providers()))
+    if scenario == "async+backpressure":
+        return build_app(Router(_providers(), max_in_flight=32, queue_timeout_s=0.5))
+    return build_app(Router(_providers()))
+
+
+def _serve(scenario: str, port: int) -> None:
+    import uvicorn
+
+    uvicorn.run(_make_app(scenario), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(port: int, timeout_s: float = 20.0) -> None:
+    deadline = time.perf_counter() + timeout_s
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, dict[str, str]]:
+    """응답 하나를 끝까지 읽고 (상태 코드, 헤더)를 돌려준다 (Content-Length / chunked 둘 다)."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:] if line)}
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, headers
+
+
+async def _load(port: int, connections: int, n_requests: int, stream: bool) -> tuple[list[float], dict[int, int], float]:
+    body = json.dumps({
+        "model": "gemini-2.5-flash",
+        "messages": [{"role": "user", "content": "벤치마크"}],
+        "stream": stream,
+    }).encode()
+    request = (
+        b"POST /v1/chat/completions HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    remaining = n_requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                writer.write(request)
+                headers: dict[str, str] = {}
+                try:
+                    status, headers = await _read_response(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    writer.close()
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    status = -1
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                elif "retry-after" in headers:
+                    # 실제 클라이언트처럼 Retry-After만큼 물러난다 (즉시 재시도하면 503 폭주만 잰다)
+                    await asyncio.sleep(float(headers["retry-after"]))
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def run_scenario(scenario: str, connections: int, n_requests: int) -> None:
+    port = _free_port()
+    server = mp.Process(target=_serve, args=(scenario, port), daemon=True)
+    server.start()
+    try:
+        asyncio.run(_wait_ready(port))
+        stream = scenario == "async SSE"
+        asyncio.run(_load(port, min(connections, 64), min(n_requests, 256), stream))  # 워밍업
+        latencies, statuses, elapsed = asyncio.run(_load(port, connections, n_requests, stream))
+    finally:
+        server.terminate()
+        server.join()
+
+    latencies.sort()
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else float("nan")
+
+    logger.info(
+        "%-19s | %6.0f req/s (200만) | p50 %7.1fms p99 %7.1fms | 상태 %s",
+        scenario, statuses.get(200, 0) / elapsed, pct(0.50), pct(0.99), dict(sorted(statuses.items())),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="llm_gateway_router 동시 연결 벤치마크")
+    parser.add_argument("--connections", type=int, default=1000, help="동시에 유지할 keep-alive 연결 수")
+    parser.add_argument("--requests", type=int, default=10000, help="구성마다 보낼 총 요청 수")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="일부 구성만 실행 (반복 지정 가능)")
+    args = parser.parse_args()
+
+    logger.info("연결 %d개, 요청 %d건, 스텁 지연 50±10ms", args.connections, args.requests)
+    for scenario in args.scenario or SCENARIOS:
+        run_scenario(scenario, args.connections, args.requests)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    main()
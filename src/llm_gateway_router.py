@@ -2,14 +2,32 @@
 
 실제 API 키 없이도 데모 provider(고정 응답)로 동작 확인이 가능하다.
 uvicorn 없이 함수 호출만으로도 라우팅 로직을 검증할 수 있게 TestClient를 사용한다.
+
+Router는 provider별 EWMA 지연·오류율·진행 중 요청 수를 추적해 같은 모델 계열을 처리하는
+provider 중 가장 빠를 것으로 보이는 건강한 provider를 고르고, 선택적으로 헤지 요청
+(첫 provider가 p95 지연 안에 답하지 않으면 두 번째 provider에도 보내 먼저 온 답을 쓴다)을 보낸다.
+
+독립 실행:
+    python llm_gateway_router.py              # TestClient 라우팅 데모
+    python llm_gateway_router.py --loadtest   # 스텁 provider 부하 테스트 (첫 매치 / 라우팅 / 헤지 비교)
+    python llm_gateway_bench.py               # uvicorn 서버에 1k 동시 연결 RPS/p99 벤치마크
 """
 from __future__ import annotations
 
+import argparse
+import asyncio
+import json
 import logging
+import random
+import statistics
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any
+from collections import Counter, defaultdict, deque
+from typing import Any, AsyncIterator
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -23,6 +41,7 @@ class ChatMessage(BaseModel):
 class ChatCompletionRequest(BaseModel):
     model: str
     messages: list[ChatMessage]
+    stream: bool = False
 
 
 class ILLMProvider(ABC):
@@ -36,6 +55,18 @@ class ILLMProvider(ABC):
     def generate(self, model: str, messages: list[ChatMessage]) -> str:
         """모델과 메시지를 받아 응답 텍스트를 반환한다."""
 
+    async def agenerate(self, model: str, messages: list[ChatMessage]) -> str:
+        """generate()의 async 버전. 기본 구현은 스레드에서 generate()를 실행한다."""
+        return await asyncio.to_thread(self.generate, model, messages)
+
+    async def astream(self, model: str, messages: list[ChatMessage]) -> AsyncIterator[str]:
+        """응답을 델타 단위로 내보낸다. 기본 구현은 agenerate() 결과를 한 번에 내보낸다."""
+        yield await self.agenerate(model, messages)
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
 
 class GeminiDemoProvider(ILLMProvider):
     """Gemini 계열 모델명을 처리하는 데모 provider. 고정 응답을 반환한다."""
@@ -47,6 +78,9 @@ class GeminiDemoProvider(ILLMProvider):
         last_user = next((m.content for m in reversed(messages) if m.role == "user"), "")
         return f"[gemini-demo:{model}] 받은 질문: {last_user[:40]}"
 
+    async def agenerate(self, model: str, messages: list[ChatMessage]) -> str:
+        return self.generate(model, messages)
+
 
 class GroqDemoProvider(ILLMProvider):
     """Groq 계열 모델명을 처리하는 데모 provider. 고정 응답을 반환한다."""
@@ -58,6 +92,9 @@ class GroqDemoProvider(ILLMProvider):
         last_user = next((m.content for m in reversed(messages) if m.role == "user"), "")
         return f"[groq-demo:{model}] 받은 질문: {last_user[:40]}"
 
+    async def agenerate(self, model: str, messages: list[ChatMessage]) -> str:
+        return self.generate(model, messages)
+
 
 class CerebrasDemoProvider(ILLMProvider):
     """Cerebras 계열 모델명을 처리하는 데모 provider. 고정 응답을 반환한다."""
@@ -69,20 +106,326 @@ class CerebrasDemoProvider(ILLMProvider):
         last_user = next((m.content for m in reversed(messages) if m.role == "user"), "")
         return f"[cerebras-demo:{model}] 받은 질문: {last_user[:40]}"
 
+    async def agenerate(self, model: str, messages: list[ChatMessage]) -> str:
+        return self.generate(model, messages)
+
+
+class ProviderStats:
+    """provider 하나의 최근 지연·오류율·진행 중 요청 수.
+
+    EWMA는 최근 요청에 alpha만큼 가중치를 준 이동 평균이다. p95는 최근 window건의 지연으로 계산한다.
+    오류율은 트래픽이 없어도 error_half_life_s마다 절반으로 줄어든다. 그래서 unhealthy로 밀려나
+    요청을 못 받는 provider도 시간이 지나면 다시 후보가 되어 회복 여부를 확인받는다.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 200, error_half_life_s: float = 30.0) -> None:
+        self.alpha = alpha
+        self.error_half_life_s = error_half_life_s
+        self.ewma_latency_s: float | None = None
+        self._error_rate = 0.0
+        self._error_at = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, latency_s: float | None, ok: bool) -> None:
+        """요청 하나를 마감한다. latency_s=None이면(헤지에서 취소) 지표에는 반영하지 않는다."""
+        with self._lock:
+            self.in_flight -= 1
+            if latency_s is None:
+                return
+            self.requests += 1
+            error_rate = self._decayed_error_rate(time.monotonic())
+            self._error_rate = error_rate + self.alpha * ((0.0 if ok else 1.0) - error_rate)
+            self._error_at = time.monotonic()
+            if ok:
+                self._latencies.append(latency_s)
+                if self.ewma_latency_s is None:
+                    self.ewma_latency_s = latency_s
+                else:
+                    self.ewma_latency_s += self.alpha * (latency_s - self.ewma_latency_s)
+
+    def _decayed_error_rate(self, now: float) -> float:
+        if self.error_half_life_s <= 0:
+            return self._error_rate
+        return self._error_rate * 0.5 ** ((now - self._error_at) / self.error_half_life_s)
+
+    @property
+    def error_rate(self) -> float:
+        return self._decayed_error_rate(time.monotonic())
+
+    def p95(self) -> float | None:
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self, prior_latency_s: float = 0.0) -> float:
+        """예상 응답 시간. 작을수록 좋다. 대기열(in_flight)과 오류로 인한 재시도 비용을 반영한다.
+
+        지연 표본이 없을 때: 한 번도 안 써 본 provider는 0으로 보고 먼저 써 본다. 요청은 했지만
+        실패만 한 provider는 prior_latency_s(Router가 넘기는 다른 provider들의 중앙값)로 본다.
+        """
+        if self.ewma_latency_s is not None:
+            latency = self.ewma_latency_s
+        else:
+            latency = 0.0 if self.requests == 0 else prior_latency_s
+        return latency * (1 + self.in_flight) / max(1.0 - self.error_rate, 0.05)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "ewma_latency_ms": None if self.ewma_latency_s is None else round(self.ewma_latency_s * 1000, 1),
+            "p95_ms": None if self.p95() is None else round(self.p95() * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+        }
 
-class Router:
-    """요청의 model 필드를 보고 등록된 provider 중 하나로 라우팅한다."""
 
-    def __init__(self, providers: list[ILLMProvider]) -> None:
+class Router:
+    """요청의 model 필드를 보고 등록된 provider 중 하나로 라우팅한다.
+
+    같은 모델을 처리하는 provider가 여럿이면 ProviderStats.score()가 가장 낮은 건강한 provider를
+    고른다. 오류율이 unhealthy_error_rate 이상인 provider는 건강한 후보가 없을 때만 쓴다.
+    오류율은 시간이 지나면 줄어들므로(error_half_life_s) 밀려난 provider도 다시 시도된다.
+
+    Args:
+        providers: 등록 순서는 점수가 같을 때의 우선순위다
+        hedge: 기본으로 헤지 요청을 보낼지 여부 (aroute에서 요청별로 바꿀 수 있다)
+        hedge_delay_s: p95를 계산할 표본이 부족할 때 쓰는 헤지 대기 시간
+        max_attempts: 오류 시 다음 provider로 넘어가며 시도할 최대 provider 수
+        max_in_flight: provider별 동시 요청 상한 (None이면 무제한). async 경로에만 적용된다
+        queue_timeout_s: 모든 후보가 상한에 걸렸을 때 슬롯을 기다리는 최대 시간. 넘기면 503
+        error_half_life_s: 요청이 없을 때 provider 오류율이 절반으로 줄어드는 시간
+    """
+
+    def __init__(
+        self,
+        providers: list[ILLMProvider],
+        hedge: bool = False,
+        hedge_delay_s: float = 0.5,
+        hedge_min_samples: int = 20,
+        max_attempts: int = 3,
+        unhealthy_error_rate: float = 0.5,
+        max_in_flight: int | None = None,
+        queue_timeout_s: float = 1.0,
+        error_half_life_s: float = 30.0,
+    ) -> None:
         self._providers = providers
+        self.hedge = hedge
+        self.hedge_delay_s = hedge_delay_s
+        self.hedge_min_samples = hedge_min_samples
+        self.max_attempts = max_attempts
+        self.unhealthy_error_rate = unhealthy_error_rate
+        self.max_in_flight = max_in_flight
+        self.queue_timeout_s = queue_timeout_s
+        self.stats = {provider: ProviderStats(error_half_life_s=error_half_life_s) for provider in providers}
+        # 슬롯 대기열: provider별 FIFO. 한 요청의 future가 후보 provider 모든 대기열에 들어가고,
+        # 슬롯이 빈 provider가 살아 있는 첫 future에 슬롯을 넘긴다(예약). 끝난 future는 꺼낼 때 버린다.
+        self._waiters: defaultdict[ILLMProvider, deque[asyncio.Future]] = defaultdict(deque)
+        self._reserved: Counter[ILLMProvider] = Counter()
+        self.rejected = 0
+
+    def candidates(self, model: str) -> list[ILLMProvider]:
+        """model을 처리할 수 있는 provider를 건강한 것 먼저, 점수 순으로 돌려준다."""
+        matching = [p for p in self._providers if p.supports(model)]
+        latencies = [self.stats[p].ewma_latency_s for p in matching if self.stats[p].ewma_latency_s is not None]
+        prior = statistics.median(latencies) if latencies else 0.0
+        return sorted(
+            matching,
+            key=lambda p: (self.stats[p].error_rate >= self.unhealthy_error_rate, self.stats[p].score(prior)),
+        )
+
+    def _hedge_delay(self, provider: ILLMProvider) -> float:
+        stats = self.stats[provider]
+        if stats.requests < self.hedge_min_samples:
+            return self.hedge_delay_s
+        return stats.p95() or self.hedge_delay_s
+
+    def _has_capacity(self, provider: ILLMProvider) -> bool:
+        if self.max_in_flight is None:
+            return True
+        waiters = self._waiters[provider]
+        while waiters and waiters[0].done():
+            waiters.popleft()
+        if waiters:
+            return False  # 먼저 기다리던 요청이 우선이다
+        return self.stats[provider].in_flight + self._reserved[provider] < self.max_in_flight
+
+    def _pick(self, candidates: list[ILLMProvider]) -> ILLMProvider | None:
+        return next((p for p in candidates if self._has_capacity(p)), None)
+
+    async def _admit(self, candidates: list[ILLMProvider]) -> ILLMProvider:
+        """슬롯이 있는 가장 좋은 후보를 고른다. 없으면 queue_timeout_s까지 기다리고, 그래도 없으면 503."""
+        provider = self._pick(candidates)
+        if provider is not None:
+            return provider
+        waiter = asyncio.get_running_loop().create_future()
+        for candidate in candidates:
+            self._waiters[candidate].append(waiter)
+        try:
+            provider = await asyncio.wait_for(waiter, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="gateway overloaded", headers={"Retry-After": "1"}) from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result(), reserved=True)  # 받은 슬롯을 다음 대기자에게
+            raise
+        self._reserved[provider] -= 1
+        return provider
+
+    def _release(self, provider: ILLMProvider, reserved: bool = False) -> None:
+        """provider 슬롯 하나를 기다리는 다음 요청에 넘긴다."""
+        if reserved:
+            self._reserved[provider] -= 1
+        waiters = self._waiters.get(provider)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                self._reserved[provider] += 1
+                waiter.set_result(provider)
+                return
 
     def route(self, request: ChatCompletionRequest) -> dict[str, Any]:
-        for provider in self._providers:
-            if provider.supports(request.model):
-                logger.info("routed model=%s -> %s", request.model, type(provider).__name__)
+        """동기 버전. 헤지·대기열 없이 순위대로 시도한다."""
+        candidates = self.candidates(request.model)
+        if not candidates:
+            raise HTTPException(status_code=400, detail=f"no provider supports model={request.model}")
+        last_error: Exception | None = None
+        for provider in candidates[: self.max_attempts]:
+            stats = self.stats[provider]
+            stats.start()
+            start = time.perf_counter()
+            try:
                 text = provider.generate(request.model, request.messages)
-                return self._to_openai_response(request.model, text)
-        raise HTTPException(status_code=400, detail=f"no provider supports model={request.model}")
+            except Exception as e:
+                stats.finish(time.perf_counter() - start, ok=False)
+                logger.debug("provider %s failed: %s", provider.name, e)
+                last_error = e
+                continue
+            stats.finish(time.perf_counter() - start, ok=True)
+            logger.debug("routed model=%s -> %s", request.model, provider.name)
+            return self._to_openai_response(request.model, text)
+        raise HTTPException(status_code=502, detail=f"all providers failed: {last_error}")
+
+    async def _call(self, provider: ILLMProvider, request: ChatCompletionRequest) -> str:
+        """호출자가 stats.start()로 슬롯을 잡은 뒤 부른다. 끝나면 슬롯을 다음 대기자에게 넘긴다."""
+        stats = self.stats[provider]
+        start = time.perf_counter()
+        try:
+            text = await provider.agenerate(request.model, request.messages)
+        except asyncio.CancelledError:
+            stats.finish(None, ok=False)  # 헤지에서 진 쪽: 느렸다는 것 외에는 알 수 없다
+            raise
+        except Exception:
+            stats.finish(time.perf_counter() - start, ok=False)
+            raise
+        else:
+            stats.finish(time.perf_counter() - start, ok=True)
+        finally:
+            self._release(provider)
+        return text
+
+    async def aroute(self, request: ChatCompletionRequest, hedge: bool | None = None) -> dict[str, Any]:
+        """async 라우팅. 실패하면 다음 후보로 넘어가고, hedge면 p95 지연 뒤 두 번째 후보를 추가로 띄운다."""
+        candidates = self.candidates(request.model)[: self.max_attempts]
+        if not candidates:
+            raise HTTPException(status_code=400, detail=f"no provider supports model={request.model}")
+        hedge = self.hedge if hedge is None else hedge
+
+        untried = list(candidates)
+        running: dict[asyncio.Task, ILLMProvider] = {}
+
+        def launch(provider: ILLMProvider | None) -> bool:
+            # 고른 직후 await 없이 슬롯을 잡아야 다른 요청이 같은 슬롯을 보지 못한다
+            if provider is None:
+                return False
+            untried.remove(provider)
+            self.stats[provider].start()
+            running[asyncio.create_task(self._call(provider, request))] = provider
+            return True
+
+        launch(await self._admit(candidates))
+        hedged = False
+        last_error: BaseException | None = None
+        try:
+            while running:
+                timeout = None
+                if hedge and not hedged and len(running) == 1:
+                    timeout = self._hedge_delay(next(iter(running.values())))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if launch(self._pick(untried)):
+                        logger.debug("hedge model=%s -> %s", request.model, list(running.values())[-1].name)
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is None:
+                        logger.debug("routed model=%s -> %s", request.model, provider.name)
+                        return self._to_openai_response(request.model, task.result())
+                    last_error = task.exception()
+                    logger.debug("provider %s failed: %s", provider.name, last_error)
+                if not running:
+                    launch(self._pick(untried))  # 장애 전환은 기다리지 않는다: 빈 슬롯이 없으면 포기
+        finally:
+            for task in running:
+                task.cancel()
+        raise HTTPException(status_code=502, detail=f"all providers failed: {last_error}")
+
+    async def open_stream(self, request: ChatCompletionRequest) -> AsyncIterator[str]:
+        """스트리밍 요청을 받아들이고 델타 이터레이터를 돌려준다.
+
+        400/503은 여기서 바로 올라오므로 응답을 시작하기 전에 상태 코드로 돌려줄 수 있다.
+        첫 델타 전에 실패하면 다음 후보로 넘어가고, 델타를 보낸 뒤의 실패는 그대로 전파한다.
+        """
+        candidates = self.candidates(request.model)[: self.max_attempts]
+        if not candidates:
+            raise HTTPException(status_code=400, detail=f"no provider supports model={request.model}")
+        provider = await self._admit(candidates)
+        self.stats[provider].start()
+        stream = self._stream(provider, [c for c in candidates if c is not provider], request)
+        return _AdmittedStream(self, provider, stream)
+
+    async def _stream(
+        self, provider: ILLMProvider, fallbacks: list[ILLMProvider], request: ChatCompletionRequest
+    ) -> AsyncIterator[str]:
+        while True:
+            stats = self.stats[provider]
+            start = time.perf_counter()
+            sent = False
+            ok: bool | None = None  # None: 클라이언트가 끊었거나 취소됨
+            try:
+                async for delta in provider.astream(request.model, request.messages):
+                    sent = True
+                    yield delta
+                ok = True
+                return
+            except Exception as e:
+                ok = False
+                if sent:
+                    raise
+                logger.debug("provider %s failed before first delta: %s", provider.name, e)
+                last_error = e
+            finally:
+                stats.finish(None if ok is None else time.perf_counter() - start, ok=bool(ok))
+                self._release(provider)
+            provider = self._pick(fallbacks)
+            if provider is None:
+                raise HTTPException(status_code=502, detail=f"all providers failed: {last_error}")
+            fallbacks.remove(provider)
+            self.stats[provider].start()
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """provider별 현재 지표 (모니터링·디버깅용)"""
+        return {p.name: self.stats[p].snapshot() for p in self._providers}
 
     @staticmethod
     def _to_openai_response(model: str, text: str) -> dict[str, Any]:
@@ -100,12 +443,202 @@ class Router:
         }
 
 
+class _AdmittedStream:
+    """open_stream이 잡은 슬롯을 책임지는 async iterator.
+
+    첫 __anext__부터는 Router._stream의 finally가 슬롯을 돌려준다. 응답 본문을 시작하기 전에 클라이언트가
+    끊어 한 번도 돌지 않은 채 버려지면 aclose() 또는 GC 시점에 여기서 돌려준다.
+    """
+
+    def __init__(self, router: Router, provider: ILLMProvider, stream: AsyncIterator[str]) -> None:
+        self._router = router
+        self._provider = provider
+        self._stream = stream
+        self._loop = asyncio.get_running_loop()
+        self._started = False
+        self._abandoned = False
+
+    def __aiter__(self) -> _AdmittedStream:
+        return self
+
+    async def __anext__(self) -> str:
+        self._started = True
+        return await self._stream.__anext__()
+
+    async def aclose(self) -> None:
+        self._abandon()
+        await self._stream.aclose()
+
+    def _abandon(self) -> None:
+        if self._started or self._abandoned:
+            return
+        self._abandoned = True
+        self._router.stats[self._provider].finish(None, ok=False)
+        self._router._release(self._provider)
+
+    def __del__(self) -> None:
+        if self._started or self._abandoned:
+            return
+        try:  # 대기 중인 future는 이벤트 루프 스레드에서 깨워야 한다
+            self._loop.call_soon_threadsafe(self._abandon)
+        except RuntimeError:  # 루프가 이미 닫혔다
+            self._abandon()
+
+
+class StubProvider(ILLMProvider):
+    """부하 테스트용 provider. 기본 지연 + 지터, 가끔 긴 꼬리 지연, 일정 비율의 오류를 흉내낸다."""
+
+    def __init__(
+        self,
+        name: str,
+        prefix: str,
+        latency_s: float,
+        jitter_s: float = 0.0,
+        tail_prob: float = 0.0,
+        tail_s: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self._name = name
+        self.prefix = prefix
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.tail_prob = tail_prob
+        self.tail_s = tail_s
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def supports(self, model: str) -> bool:
+        return model.startswith(self.prefix)
+
+    def _draw(self) -> tuple[float, bool]:
+        delay = self.latency_s + self._rng.uniform(-self.jitter_s, self.jitter_s)
+        if self._rng.random() < self.tail_prob:
+            delay += self.tail_s
+        return max(delay, 0.0), self._rng.random() < self.error_rate
+
+    def generate(self, model: str, messages: list[ChatMessage]) -> str:
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(f"{self.name}: 503 upstream error")
+        return f"[{self.name}:{model}] ok"
+
+    async def agenerate(self, model: str, messages: list[ChatMessage]) -> str:
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError(f"{self.name}: 503 upstream error")
+        return f"[{self.name}:{model}] ok"
+
+    async def astream(self, model: str, messages: list[ChatMessage]) -> AsyncIterator[str]:
+        # 첫 토큰까지 지연을 다 쓰고 이후 토큰은 바로 흘린다
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError(f"{self.name}: 503 upstream error")
+        for token in f"[{self.name}:{model}] streamed ok".split(" "):
+            yield token + " "
+
+
+def stub_providers(seed: int = 0) -> list[ILLMProvider]:
+    """같은 gemini 계열을 처리하는 성격이 다른 스텁 세 개. 첫 번째가 기존 '첫 매치' 라우팅의 선택이다."""
+    return [
+        StubProvider("tail-heavy", "gemini", latency_s=0.030, jitter_s=0.005, tail_prob=0.08, tail_s=0.6, seed=seed),
+        StubProvider("steady", "gemini", latency_s=0.060, jitter_s=0.010, seed=seed + 1),
+        StubProvider("flaky", "gemini", latency_s=0.020, jitter_s=0.005, error_rate=0.4, seed=seed + 2),
+    ]
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else float("nan")
+
+
+async def _drive(router: Router, n_requests: int, concurrency: int, hedge: bool) -> tuple[list[float], int]:
+    request = ChatCompletionRequest(model="gemini-2.5-flash", messages=[ChatMessage(role="user", content="부하 테스트")])
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            try:
+                await router.aroute(request, hedge=hedge)
+            except HTTPException:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    return latencies, errors
+
+
+def loadtest(n_requests: int = 2000, concurrency: int = 50, seed: int = 0) -> None:
+    """첫 매치(기존 방식) / 지표 기반 라우팅 / 라우팅 + 헤지를 같은 스텁 구성에서 비교한다."""
+    scenarios = [
+        ("첫 매치", lambda providers: Router(providers[:1], max_attempts=1), False),
+        ("라우팅", lambda providers: Router(providers), False),
+        ("라우팅+헤지", lambda providers: Router(providers), True),
+    ]
+    for label, make_router, hedge in scenarios:
+        router = make_router(stub_providers(seed))
+        start = time.perf_counter()
+        latencies, errors = asyncio.run(_drive(router, n_requests, concurrency, hedge))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        logger.info(
+            "%-8s | %6.0f req/s | p50 %6.1fms p95 %6.1fms p99 %6.1fms | 실패 %d/%d",
+            label, n_requests / elapsed,
+            _percentile(latencies, 0.50) * 1000, _percentile(latencies, 0.95) * 1000,
+            _percentile(latencies, 0.99) * 1000, errors, n_requests,
+        )
+        for name, snap in router.snapshot().items():
+            logger.info("           %-10s %s", name, snap)
+
+
+async def sse_events(model: str, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """델타를 OpenAI chat.completion.chunk SSE 이벤트로 감싼다. 도중 실패는 error 이벤트로 알린다."""
+
+    def event(delta: dict[str, str], finish_reason: str | None = None) -> str:
+        chunk = {
+            "id": "chatcmpl-demo",
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    yield event({"role": "assistant"})
+    try:
+        async for delta in deltas:
+            yield event({"content": delta})
+    except Exception as e:
+        message = e.detail if isinstance(e, HTTPException) else str(e)
+        yield f"data: {json.dumps({'error': {'message': message}}, ensure_ascii=False)}\n\n"
+        return
+    yield event({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
 def build_app(router: Router) -> FastAPI:
     app = FastAPI(title="mini-llm-gateway")
 
-    @app.post("/v1/chat/completions")
-    def chat_completions(req: ChatCompletionRequest) -> dict[str, Any]:
-        return router.route(req)
+    @app.post("/v1/chat/completions", response_model=None)
+    async def chat_completions(req: ChatCompletionRequest) -> dict[str, Any] | StreamingResponse:
+        if not req.stream:
+            return await router.aroute(req)
+        deltas = await router.open_stream(req)
+        return StreamingResponse(sse_events(req.model, deltas), media_type="text/event-stream")
+
+    @app.get("/v1/router/stats")
+    async def router_stats() -> dict[str, Any]:
+        return {"providers": router.snapshot(), "rejected": router.rejected}
 
     return app
 
@@ -114,8 +647,16 @@ def default_router() -> Router:
     return Router([GeminiDemoProvider(), GroqDemoProvider(), CerebrasDemoProvider()])
 
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+def main() -> None:
+    parser = argparse.ArgumentParser(description="mini LLM gateway 데모 / 부하 테스트")
+    parser.add_argument("--loadtest", action="store_true", help="스텁 provider로 라우팅 전략별 지연을 비교")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.loadtest:
+        loadtest(args.requests, args.concurrency)
+        return
 
     from fastapi.testclient import TestClient
 
@@ -132,9 +673,18 @@ if __name__ == "__main__":
         resp = client.post("/v1/chat/completions", json=payload)
         print(resp.status_code, resp.json()["choices"][0]["message"]["content"])
 
+    # stream=True면 SSE(chat.completion.chunk)로 흘려보낸다
+    with client.stream("POST", "/v1/chat/completions", json={**demo_requests[0], "stream": True}) as resp:
+        print(resp.status_code, [line for line in resp.iter_lines() if line][-3:])
+
     # 지원하지 않는 모델은 400
     resp = client.post(
         "/v1/chat/completions",
         json={"model": "unknown-model", "messages": [{"role": "user", "content": "x"}]},
     )
     print(resp.status_code, resp.json())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    main()
@@ -1,29 +1,156 @@
-"""LLM 응답 문자열에서 JSON 객체를 3단계 폴백(직접 파싱 -> 코드블록 -> 중괄호 추적)으로 추출한다."""
+"""LLM 응답 문자열에서 JSON 객체를 3단계 폴백(직접 파싱 -> 코드블록 -> 구조 추적)으로 추출한다.
+
+스트리밍 응답은 StreamingJSONExtractor에 델타를 그대로 흘려 넣으면, 최상위 객체나
+최상위 배열의 원소가 닫히는 즉시 파싱된 값을 돌려받아 생성과 후처리를 겹칠 수 있다.
+"""
 from __future__ import annotations
 
 import json
 import logging
 import re
+from typing import Iterable, Iterator
 
 logger = logging.getLogger(__name__)
 
 CODE_BLOCK_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+# 문자 하나씩 도는 대신 정규식으로 다음 의미 있는 문자까지 건너뛴다
+_STRUCTURAL_RE = re.compile(r'["{}\[\],]')
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+_CLOSERS = {"}": "{", "]": "["}
 
 
-def _extract_balanced_braces(text: str) -> str | None:
-    """첫 '{' 부터 중괄호 깊이를 세어 깊이가 0으로 돌아오는 지점까지 슬라이싱한다."""
-    start = text.find("{")
-    if start == -1:
-        return None
-    depth = 0
-    for i, ch in enumerate(text[start:], start=start):
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                return text[start : i + 1]
-    return None
+class StreamingJSONExtractor:
+    """조각으로 들어오는 텍스트에서 완결된 JSON 값을 점진적으로 꺼낸다.
+
+    문자열 안의 괄호·쉼표와 이스케이프(\\", \\\\)를 구분하며, 조각 경계가 어디서 잘려도 된다.
+    JSON 앞뒤의 설명 문장이나 ```json 펜스는 건너뛴다.
+
+    - 최상위 배열: 원소 하나가 끝날 때마다 그 원소를 내보낸다 (배열 자체는 내보내지 않는다)
+    - 최상위 객체: 닫히면 객체 전체를 내보낸다. split_objects=True면 멤버가 끝날 때마다 (키, 값)을 내보낸다
+    - 최상위 값이 끝나면 다음 '{'/'['를 찾아 계속한다
+
+    Args:
+        roots: 최상위 값으로 인정할 여는 괄호. "{"만 주면 배열은 무시한다
+        split_objects: 최상위 객체를 멤버 단위로 내보낼지 여부
+    """
+
+    def __init__(self, roots: str = "{[", split_objects: bool = False) -> None:
+        self.split_objects = split_objects
+        self._root_re = re.compile("[" + re.escape(roots) + "]")
+        self._buf = ""
+        self._pos = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._root_char = ""
+        self._root_start = 0
+        self._elem_start = 0
+        self._elem_done = False  # 컨테이너 원소를 닫는 괄호에서 이미 내보냈는지
+
+    def feed(self, chunk: str) -> list:
+        """조각을 하나 더 넣고, 이번에 완결된 값들을 순서대로 돌려준다."""
+        self._buf += chunk
+        out: list = []
+        buf = self._buf
+        pos = self._pos
+        while True:
+            if self._in_string:
+                m = _STRING_SPECIAL_RE.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                if m.group() == "\\":
+                    if m.end() >= len(buf):
+                        pos = m.start()  # 이스케이프 대상 문자가 아직 안 왔다
+                        break
+                    pos = m.end() + 1
+                    continue
+                self._in_string = False
+                pos = m.end()
+                continue
+
+            if not self._stack:
+                m = self._root_re.search(buf, pos)
+                if m is None:
+                    buf, pos = "", 0  # 루트 밖의 텍스트는 버린다
+                    break
+                self._root_char = m.group()
+                self._stack.append(self._root_char)
+                self._root_start = m.start()
+                self._elem_start = m.end()
+                self._elem_done = False
+                pos = m.end()
+                continue
+
+            m = _STRUCTURAL_RE.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            ch = m.group()
+            pos = m.end()
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack[-1] != _CLOSERS[ch]:
+                    logger.debug("괄호 짝이 맞지 않아 현재 루트를 버림: %r", buf[self._root_start : pos][:80])
+                    self._stack.clear()
+                    continue
+                self._stack.pop()
+                if len(self._stack) == 1 and self._splits:
+                    self._emit_element(buf[self._elem_start : pos], out)
+                    self._elem_done = True
+                elif not self._stack:
+                    if self._splits:
+                        if not self._elem_done:
+                            self._emit_element(buf[self._elem_start : m.start()], out)
+                    else:
+                        self._emit_value(buf[self._root_start : pos], out)
+                    buf, pos = buf[pos:], 0
+            elif ch == "," and len(self._stack) == 1 and self._splits:
+                if not self._elem_done:
+                    self._emit_element(buf[self._elem_start : m.start()], out)
+                self._elem_start = pos
+                self._elem_done = False
+
+        # 아직 필요한 앞부분만 남겨 버퍼가 응답 길이만큼 자라지 않게 한다
+        if self._stack:
+            keep = self._elem_start if self._splits else self._root_start
+            buf, pos = buf[keep:], pos - keep
+            self._root_start -= keep
+            self._elem_start -= keep
+        self._buf, self._pos = buf, pos
+        return out
+
+    @property
+    def _splits(self) -> bool:
+        """현재 루트를 원소/멤버 단위로 쪼개 내보내는지"""
+        return self._root_char == "[" or self.split_objects
+
+    def _emit_element(self, text: str, out: list) -> None:
+        text = text.strip()
+        if not text:
+            return
+        try:
+            if self._root_char == "{":
+                out.append(next(iter(json.loads("{" + text + "}").items())))
+            else:
+                out.append(json.loads(text))
+        except (json.JSONDecodeError, StopIteration):
+            logger.debug("원소 파싱 실패, 건너뜀: %r", text[:80])
+
+    def _emit_value(self, text: str, out: list) -> None:
+        try:
+            out.append(json.loads(text))
+        except json.JSONDecodeError:
+            logger.debug("최상위 값 파싱 실패, 건너뜀: %r", text[:80])
+
+
+def iter_json(chunks: Iterable[str], roots: str = "{[", split_objects: bool = False) -> Iterator:
+    """stream_chat() 같은 델타 이터러블에서 완결된 JSON 값을 도착 순서대로 내보낸다."""
+    extractor = StreamingJSONExtractor(roots, split_objects)
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
 
 
 def extract_json(text: str) -> dict | None:
@@ -31,7 +158,7 @@ def extract_json(text: str) -> dict | None:
     LLM 응답에서 JSON 객체를 추출한다.
 
     순서: 1) json.loads 직접 파싱 2) 마크다운 코드블록(```json ... ```) 추출 후 재파싱
-    3) 첫 '{'부터 중괄호 균형을 추적해 첫 완결 JSON 객체를 슬라이싱 후 재파싱.
+    3) 문자열·이스케이프를 구분해 괄호 구조를 추적하며 파싱되는 첫 JSON 객체를 찾는다.
 
     세 단계 모두 실패하면 None을 반환한다. 재프롬프트(모델에 재요청해 다시 받기)는
     이 함수의 책임이 아니다 — 호출자가 None을 받았을 때 처리해야 한다.
@@ -46,15 +173,11 @@ def extract_json(text: str) -> dict | None:
         try:
             return json.loads(match.group(1).strip())
         except json.JSONDecodeError:
-            logger.debug("2단계(코드블록 추출) 실패, 중괄호 추적 시도")
-
-    candidate = _extract_balanced_braces(text)
-    if candidate:
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            logger.debug("3단계(중괄호 추적)도 실패")
+            logger.debug("2단계(코드블록 추출) 실패, 구조 추적 시도")
 
+    for value in StreamingJSONExtractor(roots="{").feed(text):
+        return value
+    logger.debug("3단계(구조 추적)도 실패")
     return None
 
 
@@ -65,9 +188,23 @@ if __name__ == "__main__":
         "직접 파싱 성공": '{"name": "taewony", "role": "engineer"}',
         "코드블록으로 감쌈": '여기 결과입니다.\n```json\n{"ok": true, "count": 3}\n```\n감사합니다.',
         "앞뒤에 설명 텍스트": '결과: {"status": "done", "items": [1, 2, 3]} 이상입니다.',
+        "문자열 안의 중괄호": '설명 {잘못된} 뒤에 {"pattern": "a{2}\\"}", "ok": true} 끝',
         "완전히 파싱 불가": "죄송합니다, JSON을 생성할 수 없습니다.",
     }
 
     for label, text in samples.items():
         result = extract_json(text)
         print(f"[{label}] -> {result}")
+
+    # 스트리밍: 7글자씩 도착하는 응답에서 배열 원소가 닫히는 즉시 꺼낸다
+    streamed = '```json\n[{"term": "RAG", "note": "검색 증강 {생성}"}, {"term": "LLM"}, 3]\n```'
+    deltas = [streamed[i : i + 7] for i in range(0, len(streamed), 7)]
+    extractor = StreamingJSONExtractor()
+    for i, delta in enumerate(deltas):
+        for value in extractor.feed(delta):
+            print(f"[스트리밍] 델타 {i + 1}/{len(deltas)}에서 완결 -> {value}")
+
+    # 객체 루트를 멤버 단위로: write_term의 {"영어 풀네임": {...}, ...} 응답 형태
+    streamed = '{"largeLanguageModel": {"term": "LLM"}, "retrievalAugmentedGeneration": {"term": "RAG"}}'
+    for key, value in iter_json((streamed[i : i + 5] for i in range(0, len(streamed), 5)), split_objects=True):
+        print(f"[멤버] {key} -> {value}")
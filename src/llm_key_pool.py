@@ -1,68 +1,573 @@
-"""라운드로빈 키 로테이션 + 실패 쿨다운으로 무료 API 키 풀을 관리하는 KeyManager.
+"""쿼터를 아는 스케줄링 + 실패 쿨다운으로 무료 API 키 풀을 관리하는 KeyManager.
 
 `mark_failed(key)`가 호출되면 해당 키를 N초 쿨다운시켜 다음 라운드에서 건너뛴다.
 쿨다운이 끝나면 자동으로 풀에 복귀한다.
+
+키마다 RPM/TPM/일일 쿼터의 남은 양을 추적한다. 응답 헤더(x-ratelimit-*, retry-after)를
+`update_from_headers()`로 넘기면 그 값을 쓰고, 없으면 설정한 한도로 직접 센다.
+선택은 힙 두 개로 O(log n)이다.
+- ready: 지금 쓸 수 있는 키. 남은 여유(headroom)가 큰 순, 같으면 오래 안 쓴 순(라운드로빈)
+- waiting: 쿨다운·쿼터 소진으로 쉬는 키. 다시 쓸 수 있게 되는 시각 순
+
+상태가 바뀐 키는 새 항목을 넣고 옛 항목은 버전 번호로 걸러낸다(지연 삭제).
+모든 연산은 짧은 임계 구역 하나(threading.Lock)로 보호되어 스레드·asyncio 팬아웃에서 안전하다.
+
+여러 워커 프로세스가 키를 나눠 쓸 때는 같은 인터페이스의 SharedKeyManager가 상태를 SQLite 파일에 둔다.
+
+독립 실행:
+    python llm_key_pool.py           # 동작 데모
+    python llm_key_pool.py --bench   # 키 수천 개, 스레드 경합 벤치마크
+    python llm_key_pool.py --shared  # 여러 프로세스가 SQLite로 상태를 공유할 때의 지연과 일관성
 """
 from __future__ import annotations
 
+import argparse
+import heapq
+import itertools
 import logging
+import multiprocessing as mp
+import os
+import re
+import sqlite3
+import tempfile
+import threading
 import time
-from dataclasses import dataclass, field
+from contextlib import contextmanager
+from dataclasses import astuple, dataclass, field, fields
+from typing import Iterator, Mapping
+
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
 
 logger = logging.getLogger(__name__)
 
+WINDOW_SECONDS = 60.0
+DAY_SECONDS = 86400.0
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
 
 @dataclass
 class _KeyState:
     key: str
     cooldown_until: float = 0.0
+    # 한도/남은 양/리셋 시각. 한도가 None이면 그 축은 추적하지 않는다
+    rpm_limit: int | None = None
+    rpm_remaining: int | None = None
+    rpm_reset_at: float = 0.0
+    tpm_limit: int | None = None
+    tpm_remaining: int | None = None
+    tpm_reset_at: float = 0.0
+    daily_limit: int | None = None
+    daily_remaining: int | None = None
+    daily_reset_at: float = 0.0
+    version: int = 0
 
     def is_cooling_down(self, now: float) -> bool:
         return now < self.cooldown_until
 
+    def refresh(self, now: float) -> None:
+        """리셋 시각이 지난 창의 남은 양을 한도로 되돌린다."""
+        if self.rpm_limit is not None and now >= self.rpm_reset_at:
+            self.rpm_remaining, self.rpm_reset_at = self.rpm_limit, now + WINDOW_SECONDS
+        if self.tpm_limit is not None and now >= self.tpm_reset_at:
+            self.tpm_remaining, self.tpm_reset_at = self.tpm_limit, now + WINDOW_SECONDS
+        if self.daily_limit is not None and now >= self.daily_reset_at:
+            self.daily_remaining, self.daily_reset_at = self.daily_limit, now + DAY_SECONDS
+
+    def available_at(self, now: float, tokens: int = 0) -> float:
+        """이 키를 다시 쓸 수 있는 가장 이른 시각. now 이하면 지금 쓸 수 있다."""
+        at = self.cooldown_until
+        if self.rpm_remaining is not None and self.rpm_remaining <= 0:
+            at = max(at, self.rpm_reset_at)
+        if self.tpm_remaining is not None and self.tpm_remaining < max(tokens, 1):
+            at = max(at, self.tpm_reset_at)
+        if self.daily_remaining is not None and self.daily_remaining <= 0:
+            at = max(at, self.daily_reset_at)
+        return at
+
+    def consume(self, tokens: int) -> None:
+        """선택 한 번만큼 요청 수·토큰·일일 쿼터를 차감한다."""
+        if self.rpm_remaining is not None:
+            self.rpm_remaining -= 1
+        if self.tpm_remaining is not None:
+            self.tpm_remaining -= tokens
+        if self.daily_remaining is not None:
+            self.daily_remaining -= 1
+
+    def apply_headers(self, headers: Mapping[str, str], now: float) -> None:
+        """x-ratelimit-*, retry-after 응답 헤더로 한도·남은 양·리셋 시각·쿨다운을 맞춘다."""
+        h = {k.lower(): v for k, v in headers.items()}
+        for suffix, axis in (("-requests", "rpm"), ("-tokens", "tpm"), ("", "rpm")):
+            limit = h.get(f"x-ratelimit-limit{suffix}")
+            remaining = h.get(f"x-ratelimit-remaining{suffix}")
+            reset = h.get(f"x-ratelimit-reset{suffix}")
+            limit, remaining = _parse_count(limit), _parse_count(remaining)
+            if limit is not None:
+                setattr(self, f"{axis}_limit", limit)
+            if remaining is not None:
+                setattr(self, f"{axis}_remaining", remaining)
+            if reset is not None and (reset_at := _parse_reset(reset, now)) is not None:
+                setattr(self, f"{axis}_reset_at", reset_at)
+            elif remaining is not None and getattr(self, f"{axis}_reset_at") <= now:
+                setattr(self, f"{axis}_reset_at", now + WINDOW_SECONDS)  # 리셋 헤더가 없으면 1분 창으로 본다
+        if "retry-after" in h and (until := _parse_reset(h["retry-after"], now)) is not None:
+            self.cooldown_until = max(self.cooldown_until, until)
+
+    def headroom(self) -> float:
+        """가장 빠듯한 축의 남은 비율 (0~1). 추적하는 축이 없으면 1."""
+        ratios = [
+            remaining / limit
+            for remaining, limit in (
+                (self.rpm_remaining, self.rpm_limit),
+                (self.tpm_remaining, self.tpm_limit),
+                (self.daily_remaining, self.daily_limit),
+            )
+            if remaining is not None and limit
+        ]
+        return max(min(ratios), 0.0) if ratios else 1.0
+
+
+# SharedKeyManager 테이블 열: _KeyState 필드에서 프로세스 로컬인 version만 뺀다
+_STATE_COLUMNS = tuple(f.name for f in fields(_KeyState) if f.name != "version")
+_SELECT_COLUMNS = ", ".join(_STATE_COLUMNS)
+_UPDATE_COLUMNS = ", ".join(f"{name} = ?" for name in _STATE_COLUMNS[1:])
+_COLUMN_DEFAULTS = [
+    (f.name, "NULL" if f.default is None else f.default) for f in fields(_KeyState) if f.name in _STATE_COLUMNS[1:]
+]
+
 
 class NoAvailableKeyError(RuntimeError):
-    """풀의 모든 키가 쿨다운 중일 때 발생한다."""
+    """풀의 모든 키가 쿨다운 중이거나 쿼터를 다 썼을 때 발생한다. retry_after는 가장 빠른 복귀까지 남은 초."""
+
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_count(value: str | None) -> int | None:
+    """한도·남은 양 헤더를 정수로 바꾼다. 비었거나 숫자가 아니면 None(헤더가 없는 것과 같다)."""
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        logger.debug("ignoring malformed rate-limit header value %r", value)
+        return None
+
+
+def _parse_reset(value: str, now: float) -> float | None:
+    """'1s', '6m0s', '20ms' 같은 남은 시간 또는 epoch 초/밀리초를 절대 시각으로 바꾼다."""
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = _DURATION_RE.findall(value)
+        if not parts:
+            return None
+        return now + sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+    if number > 1e11:  # epoch 밀리초 (OpenRouter X-RateLimit-Reset)
+        return number / 1000
+    if number > 1e9:  # epoch 초
+        return number
+    return now + number  # 남은 초
 
 
 @dataclass
 class KeyManager:
     keys: list[str]
     cooldown_seconds: float = 300.0
+    rpm_limit: int | None = None
+    tpm_limit: int | None = None
+    daily_limit: int | None = None
     _states: dict[str, _KeyState] = field(init=False, default_factory=dict)
-    _cursor: int = field(init=False, default=0)
+    _ready: list[tuple[float, int, int, str]] = field(init=False, default_factory=list)
+    _waiting: list[tuple[float, int, int, str]] = field(init=False, default_factory=list)
+    _seq: itertools.count = field(init=False, default_factory=itertools.count)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock)
 
     def __post_init__(self) -> None:
         if not self.keys:
             raise ValueError("keys must not be empty")
-        self._states = {k: _KeyState(key=k) for k in self.keys}
+        for key in self.keys:
+            self._add(key, time.time())
+
+    def _add(self, key: str, now: float) -> _KeyState:
+        # 남은 양은 처음 선택될 때 refresh()가 채운다
+        state = _KeyState(key=key, rpm_limit=self.rpm_limit, tpm_limit=self.tpm_limit, daily_limit=self.daily_limit)
+        self._states[key] = state
+        self._schedule(state, now)
+        return state
+
+    def _schedule(self, state: _KeyState, now: float, tokens: int = 0) -> None:
+        """상태가 바뀐 키를 알맞은 힙에 다시 넣는다. 예전 항목은 버전이 달라 무시된다."""
+        state.version += 1
+        at = state.available_at(now, tokens)
+        if at <= now:
+            heapq.heappush(self._ready, (-state.headroom(), next(self._seq), state.version, state.key))
+        else:
+            heapq.heappush(self._waiting, (at, next(self._seq), state.version, state.key))
 
-    def get_next_key(self, now: float | None = None) -> str:
-        """라운드로빈으로 다음 활성 키를 반환한다. 전부 쿨다운 중이면 예외를 낸다."""
+    def _promote(self, now: float) -> None:
+        """다시 쓸 수 있게 된 키를 waiting에서 ready로 옮긴다."""
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, version, key = heapq.heappop(self._waiting)
+            state = self._states[key]
+            if version == state.version:
+                state.refresh(now)
+                self._schedule(state, now)
+
+    def get_next_key(self, now: float | None = None, tokens: int = 0) -> str:
+        """여유가 가장 큰 활성 키를 골라 쿼터를 차감하고 반환한다. 쓸 키가 없으면 예외를 낸다.
+
+        tokens는 이번 요청의 예상 입력 토큰 수로, TPM 차감과 TPM 여유 판단에 쓴다.
+        """
         now = time.time() if now is None else now
-        n = len(self.keys)
-        for offset in range(n):
-            idx = (self._cursor + offset) % n
-            candidate = self.keys[idx]
-            if not self._states[candidate].is_cooling_down(now):
-                self._cursor = (idx + 1) % n
-                return candidate
-        raise NoAvailableKeyError("all keys are cooling down")
-
-    def mark_failed(self, key: str, now: float | None = None) -> None:
-        """키를 실패 처리하고 cooldown_seconds 동안 선택 대상에서 제외한다."""
+        if self.tpm_limit is not None and tokens > self.tpm_limit:
+            raise NoAvailableKeyError(f"request of {tokens} tokens exceeds tpm_limit={self.tpm_limit}")
+        with self._lock:
+            self._promote(now)
+            # 이번 요청만 TPM이 모자란 키는 waiting으로 보내지 않는다. 더 작은 요청은 그 키를 계속 쓸 수 있다
+            skipped: list[_KeyState] = []
+            try:
+                while self._ready:
+                    _, _, version, key = heapq.heappop(self._ready)
+                    state = self._states[key]
+                    if version != state.version:
+                        continue
+                    state.refresh(now)
+                    if state.available_at(now) > now:
+                        self._schedule(state, now)
+                        continue
+                    if state.available_at(now, tokens) > now:
+                        skipped.append(state)
+                        continue
+                    state.consume(tokens)
+                    self._schedule(state, now)
+                    return key
+            finally:
+                for state in skipped:
+                    self._schedule(state, now)
+
+            while self._waiting and self._waiting[0][2] != self._states[self._waiting[0][3]].version:
+                heapq.heappop(self._waiting)
+            candidates = [s.tpm_reset_at for s in skipped if s.tpm_limit is None or tokens <= s.tpm_limit]
+            if self._waiting:
+                candidates.append(self._waiting[0][0])
+            retry_after = min(candidates) - now if candidates else None
+        if skipped and retry_after is None:
+            raise NoAvailableKeyError(f"request of {tokens} tokens exceeds every key's TPM limit")
+        raise NoAvailableKeyError("all keys are cooling down or out of quota", retry_after)
+
+    def mark_failed(self, key: str, now: float | None = None, retry_after: float | None = None) -> None:
+        """키를 실패 처리하고 retry_after(없으면 cooldown_seconds) 동안 선택 대상에서 제외한다."""
         now = time.time() if now is None else now
-        state = self._states.setdefault(key, _KeyState(key=key))
-        state.cooldown_until = now + self.cooldown_seconds
+        with self._lock:
+            state = self._states.get(key) or self._add(key, now)
+            state.cooldown_until = now + (self.cooldown_seconds if retry_after is None else retry_after)
+            self._schedule(state, now)
         logger.warning("key=%s marked failed, cooldown until %.0f", key[:8], state.cooldown_until)
 
+    def update_from_headers(self, key: str, headers: Mapping[str, str], now: float | None = None) -> None:
+        """응답 헤더의 레이트 리밋 정보로 키 상태를 맞춘다.
+
+        x-ratelimit-{limit,remaining,reset}-{requests,tokens} (OpenAI/Groq 형식),
+        x-ratelimit-{limit,remaining,reset} (OpenRouter 형식, 요청 수 기준), retry-after를 읽는다.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(key) or self._add(key, now)
+            state.apply_headers(headers, now)
+            self._schedule(state, now)
+
     def active_count(self, now: float | None = None) -> int:
         now = time.time() if now is None else now
-        return sum(1 for s in self._states.values() if not s.is_cooling_down(now))
+        with self._lock:
+            return sum(1 for s in self._states.values() if s.available_at(now) <= now)
 
+    def headroom(self, key: str) -> float:
+        with self._lock:
+            return self._states[key].headroom()
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+class SharedKeyManager:
+    """KeyManager와 같은 인터페이스로, 키 상태를 SQLite 파일에 두어 한 호스트의 여러 프로세스가 공유한다.
+
+    gunicorn/multiprocessing 워커가 같은 path를 열면 쿨다운과 쿼터 차감이 모든 워커에 곧바로 보인다.
+    선택 한 번은 잠금 -> 인덱스 조회 -> UPDATE -> 커밋으로 끝나는 트랜잭션 하나다.
+    ready/waiting 힙 대신 (waiting, rank, last_used)와 (waiting, available_at) 인덱스를 쓴다.
+
+    프로세스 간 직렬화는 path + ".lock" 파일의 flock으로 한다. SQLite 자체의 busy 재시도는
+    밀리초 단위로 잠들었다 깨어나 경합 때 지연이 튄다. fcntl이 없는 환경(Windows)에서는 busy_timeout에 맡긴다.
+    WAL + synchronous=OFF라 커밋마다 fsync하지 않는다. 전원이 나가면 최근 차감 몇 건을 잃을 수 있지만
+    어차피 다음 응답 헤더로 다시 맞춰지는 추정치다.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        path: str,
+        cooldown_seconds: float = 300.0,
+        rpm_limit: int | None = None,
+        tpm_limit: int | None = None,
+        daily_limit: int | None = None,
+    ) -> None:
+        if not keys:
+            raise ValueError("keys must not be empty")
+        self.path = path
+        self.cooldown_seconds = cooldown_seconds
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.daily_limit = daily_limit
+        self._lock = threading.Lock()
+        self._lock_file = open(f"{path}.lock", "a+b") if HAS_FCNTL else None
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        with self._transaction() as conn:
+            conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS key_states (
+                    key TEXT PRIMARY KEY,
+                    {", ".join(f"{name} NUMERIC DEFAULT {default}" for name, default in _COLUMN_DEFAULTS)},
+                    waiting INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    rank REAL NOT NULL DEFAULT -1,
+                    last_used INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_key_states_ready ON key_states(waiting, rank, last_used)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_key_states_waiting ON key_states(waiting, available_at)")
+            # 다른 워커가 이미 만든 행은 건드리지 않는다 (재시작해도 쿨다운·차감이 유지된다)
+            conn.executemany(
+                "INSERT OR IGNORE INTO key_states (key, rpm_limit, tpm_limit, daily_limit) VALUES (?, ?, ?, ?)",
+                [(key, rpm_limit, tpm_limit, daily_limit) for key in keys],
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            if self._lock_file is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self._conn
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+            finally:
+                if self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _load(self, key: str) -> _KeyState:
+        row = self._conn.execute(f"SELECT {_SELECT_COLUMNS} FROM key_states WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return _KeyState(*row)
+        self._conn.execute(
+            "INSERT INTO key_states (key, rpm_limit, tpm_limit, daily_limit) VALUES (?, ?, ?, ?)",
+            (key, self.rpm_limit, self.tpm_limit, self.daily_limit),
+        )
+        return _KeyState(key=key, rpm_limit=self.rpm_limit, tpm_limit=self.tpm_limit, daily_limit=self.daily_limit)
+
+    def _save(self, state: _KeyState, now: float) -> None:
+        """KeyManager._schedule에 해당한다. 상태와 함께 어느 인덱스 구간에 둘지 기록한다."""
+        at = state.available_at(now)
+        values = astuple(state)[1 : len(_STATE_COLUMNS)]
+        self._conn.execute(
+            f"UPDATE key_states SET {_UPDATE_COLUMNS}, waiting = ?, available_at = ?, rank = ?, last_used = ?"
+            " WHERE key = ?",
+            (*values, int(at > now), at, -state.headroom(), time.time_ns(), state.key),
+        )
+
+    def get_next_key(self, now: float | None = None, tokens: int = 0) -> str:
+        """KeyManager.get_next_key와 같다. 선택과 차감이 모든 프로세스에 대해 원자적이다."""
+        now = time.time() if now is None else now
+        if self.tpm_limit is not None and tokens > self.tpm_limit:
+            raise NoAvailableKeyError(f"request of {tokens} tokens exceeds tpm_limit={self.tpm_limit}")
+        with self._transaction() as conn:
+            promotable = conn.execute(
+                f"SELECT {_SELECT_COLUMNS} FROM key_states WHERE waiting = 1 AND available_at <= ?", (now,)
+            ).fetchall()
+            for row in promotable:
+                state = _KeyState(*row)
+                state.refresh(now)
+                self._save(state, now)
+            # 이번 요청만 TPM이 모자란 키는 waiting = 0 그대로 두고 이번 선택에서만 건너뛴다
+            skipped: list[_KeyState] = []
+            while True:
+                exclude = ", ".join("?" * len(skipped))
+                row = conn.execute(
+                    f"SELECT {_SELECT_COLUMNS} FROM key_states WHERE waiting = 0 AND key NOT IN ({exclude})"
+                    " ORDER BY rank, last_used LIMIT 1",
+                    [s.key for s in skipped],
+                ).fetchone()
+                if row is None:
+                    break
+                state = _KeyState(*row)
+                state.refresh(now)
+                if state.available_at(now) > now:
+                    self._save(state, now)
+                    continue
+                if state.available_at(now, tokens) > now:
+                    skipped.append(state)
+                    continue
+                state.consume(tokens)
+                self._save(state, now)
+                return state.key
+            for state in skipped:
+                self._save(state, now)
+            (earliest,) = conn.execute("SELECT min(available_at) FROM key_states WHERE waiting = 1").fetchone()
+        candidates = [s.tpm_reset_at for s in skipped if s.tpm_limit is None or tokens <= s.tpm_limit]
+        if earliest is not None:
+            candidates.append(earliest)
+        if skipped and not candidates:
+            raise NoAvailableKeyError(f"request of {tokens} tokens exceeds every key's TPM limit")
+        raise NoAvailableKeyError(
+            "all keys are cooling down or out of quota", min(candidates) - now if candidates else None
+        )
+
+    def mark_failed(self, key: str, now: float | None = None, retry_after: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._transaction():
+            state = self._load(key)
+            state.cooldown_until = now + (self.cooldown_seconds if retry_after is None else retry_after)
+            self._save(state, now)
+        logger.warning("key=%s marked failed, cooldown until %.0f", key[:8], state.cooldown_until)
+
+    def update_from_headers(self, key: str, headers: Mapping[str, str], now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._transaction():
+            state = self._load(key)
+            state.apply_headers(headers, now)
+            self._save(state, now)
+
+    def active_count(self, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT count(*) FROM key_states WHERE waiting = 0 OR available_at <= ?", (now,)
+            ).fetchone()
+        return count
+
+    def headroom(self, key: str) -> float:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_SELECT_COLUMNS} FROM key_states WHERE key = ?", (key,)).fetchone()
+        return _KeyState(*row).headroom()
+
+    def close(self) -> None:
+        self._conn.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+
+def bench(n_keys: int = 5000, selections: int = 200_000, thread_counts: tuple[int, ...] = (1, 4, 16)) -> None:
+    """키 n_keys개에서 스레드 수별 초당 선택 수와 선택 지연 p99를 잰다. 64번에 한 번 mark_failed를 섞는다."""
+    for n_threads in thread_counts:
+        manager = KeyManager([f"key-{i:05d}" for i in range(n_keys)], cooldown_seconds=0.05, rpm_limit=1_000_000)
+        per_thread = selections // n_threads
+        latencies: list[list[float]] = [[] for _ in range(n_threads)]
+        barrier = threading.Barrier(n_threads + 1)
+
+        def worker(slot: int) -> None:
+            samples = latencies[slot]
+            barrier.wait()
+            for i in range(per_thread):
+                start = time.perf_counter()
+                try:
+                    key = manager.get_next_key()
+                except NoAvailableKeyError:
+                    continue
+                samples.append(time.perf_counter() - start)
+                if i % 64 == 0:
+                    manager.mark_failed(key)
+
+        logger.setLevel(logging.ERROR)  # mark_failed 경고가 측정을 흐리지 않게
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        logger.setLevel(logging.NOTSET)
+        merged = sorted(x for samples in latencies for x in samples)
+        logger.info(
+            "키 %d개 | 스레드 %2d | %8.0f 선택/s | p50 %5.1fµs p99 %6.1fµs",
+            n_keys, n_threads, len(merged) / elapsed,
+            merged[len(merged) // 2] * 1e6, merged[int(len(merged) * 0.99)] * 1e6,
+        )
+
+
+def _shared_bench_worker(path: str, keys: list[str], rpm_limit: int, attempts: int, out: mp.Queue) -> None:
+    manager = SharedKeyManager(keys, path, rpm_limit=rpm_limit)
+    picked: dict[str, int] = {}
+    latencies: list[float] = []
+    for _ in range(attempts):
+        start = time.perf_counter()
+        try:
+            key = manager.get_next_key()
+        except NoAvailableKeyError:
+            continue
+        latencies.append(time.perf_counter() - start)
+        picked[key] = picked.get(key, 0) + 1
+    manager.close()
+    out.put((picked, latencies))
+
+
+def bench_shared(n_keys: int = 1000, rpm_limit: int = 10, process_counts: tuple[int, ...] = (1, 4, 8)) -> None:
+    """프로세스 N개가 한 SQLite 파일을 공유할 때의 선택 지연과 쿼터 일관성을 잰다.
+
+    전체 쿼터(n_keys * rpm_limit)의 두 배를 시도해서, 성공한 선택 수가 쿼터와 정확히 같고
+    어떤 키도 rpm_limit을 넘겨 뽑히지 않았는지 확인한다.
+    """
+    quota = n_keys * rpm_limit
+    keys = [f"key-{i:05d}" for i in range(n_keys)]
+    for n_procs in process_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "keys.sqlite")
+            SharedKeyManager(keys, path, rpm_limit=rpm_limit).close()
+            out: mp.Queue = mp.Queue()
+            procs = [
+                mp.Process(target=_shared_bench_worker, args=(path, keys, rpm_limit, 2 * quota // n_procs, out))
+                for _ in range(n_procs)
+            ]
+            start = time.perf_counter()
+            for proc in procs:
+                proc.start()
+            results = [out.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+            elapsed = time.perf_counter() - start
+        totals: dict[str, int] = {}
+        for picked, _ in results:
+            for key, count in picked.items():
+                totals[key] = totals.get(key, 0) + count
+        merged = sorted(x for _, latencies in results for x in latencies)
+        logger.info(
+            "프로세스 %d개 | 성공 %d/%d (최대 %d/키) | %6.0f 선택/s | p50 %5.1fµs p99 %6.1fµs",
+            n_procs, sum(totals.values()), quota, max(totals.values()), len(merged) / elapsed,
+            merged[len(merged) // 2] * 1e6, merged[int(len(merged) * 0.99)] * 1e6,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API 키 풀 데모 / 벤치마크")
+    parser.add_argument("--bench", action="store_true", help="키 수천 개, 스레드 경합 벤치마크")
+    parser.add_argument("--shared", action="store_true", help="여러 프로세스가 SQLite로 상태를 공유하는 벤치마크")
+    parser.add_argument("--keys", type=int, default=5000)
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.keys)
+        return
+    if args.shared:
+        bench_shared()
+        return
 
     manager = KeyManager(keys=["key-A", "key-B", "key-C"], cooldown_seconds=5)
 
@@ -81,3 +586,19 @@ if __name__ == "__main__":
     # 쿨다운 시간이 지나면 자동 복귀한다.
     future = time.time() + 6
     print("selected (after cooldown expires):", manager.get_next_key(now=future))
+
+    # 응답 헤더로 쿼터를 알게 되면 여유가 큰 키를 먼저 고른다.
+    manager.update_from_headers("key-A", {"x-ratelimit-limit-requests": "30", "x-ratelimit-remaining-requests": "2",
+                                          "x-ratelimit-reset-requests": "20s"}, now=future)
+    manager.update_from_headers("key-C", {"x-ratelimit-limit-requests": "30", "x-ratelimit-remaining-requests": "25",
+                                          "x-ratelimit-reset-requests": "20s"}, now=future)
+    manager.update_from_headers("key-B", {"x-ratelimit-limit-requests": "30", "x-ratelimit-remaining-requests": "9",
+                                          "retry-after": "3"}, now=future)
+    print("headroom A/B/C:", *(round(manager.headroom(k), 2) for k in ("key-A", "key-B", "key-C")))
+    print("selected (by headroom, B retry-after):", [manager.get_next_key(now=future) for _ in range(4)])
+    print("selected (B back):", [manager.get_next_key(now=future + 4) for _ in range(4)])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    main()
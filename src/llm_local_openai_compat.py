@@ -2,13 +2,29 @@
 
 실제 환경에서는 OLLAMA_CMD_TEMPLATE 같은 커맨드를 그대로 실행하면 된다.
 API 키·네트워크 없이 데모를 돌리기 위해 기본 커맨드는 echo 스텁으로 대체했다.
+
+호출마다 프로세스를 띄우면 프로세스 기동과 모델 로드를 매번 다시 치른다. LocalInferenceWorker는
+오래 사는 백엔드(JSON Lines로 배치를 주고받는 자식 프로세스, 또는 Ollama HTTP keep-alive 연결)를
+하나 붙잡아 두고, 짧은 창(window_ms) 안에 들어온 동시 요청을 한 배치로 묶어 보낸다.
+응답에는 런타임이 센 실제 토큰 수와 요청별 대기/연산 시간이 들어간다.
+
+독립 실행:
+    python llm_local_openai_compat.py     # 단발 subprocess vs 상주 워커 + 마이크로배칭 비교
 """
 from __future__ import annotations
 
+import http.client
+import json
 import logging
+import queue
 import subprocess
+import sys
+import threading
 import time
-from typing import Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Protocol
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +33,34 @@ OLLAMA_CMD_TEMPLATE = ["ollama", "run", "{model}", "{prompt}"]
 
 _SUBPROCESS_TIMEOUT_SEC = 30.0
 
+# 데모용 상주 워커. 기동 시 모델 로드를 흉내내고, stdin으로 받은 배치를 한 번에 처리한다.
+# 프로토콜(한 줄 = 한 배치): {"model": ..., "prompts": [...]} -> {"results": [{"text", "prompt_tokens", "completion_tokens"}]}
+# 토큰 수는 런타임이 세는 값이라는 가정으로, 스텁에서는 공백 단위로 센다.
+STUB_WORKER_SOURCE = r'''
+import json, sys, time
+time.sleep(0.3)  # 모델 로드
+
+def run(model, prompts):
+    time.sleep(0.02 + 0.005 * len(prompts))  # 배치 한 번: 고정 비용 + 프롬프트당 비용
+    out = []
+    for prompt in prompts:
+        text = f"[local:{model}] stub response for: {prompt}"
+        out.append({"text": text, "prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split())})
+    return out
+
+if sys.argv[1:2] == ["--once"]:
+    print(run(sys.argv[2], [sys.argv[3]])[0]["text"])
+    sys.exit(0)
+for line in sys.stdin:
+    req = json.loads(line)
+    print(json.dumps({"results": run(req["model"], req["prompts"])}, ensure_ascii=False), flush=True)
+'''
+STUB_WORKER_CMD = [sys.executable, "-c", STUB_WORKER_SOURCE]
+
 
 def _run_local_cli(cmd: list[str], timeout: float = _SUBPROCESS_TIMEOUT_SEC) -> str:
     """subprocess.run()으로 로컬 커맨드를 실행하고 stdout을 반환한다."""
-    logger.info("executing local cli: %s", " ".join(cmd))
+    logger.info("executing local cli: %s", " ".join(cmd)[:200])
     result = subprocess.run(
         cmd,
         capture_output=True,
@@ -33,16 +73,334 @@ def _run_local_cli(cmd: list[str], timeout: float = _SUBPROCESS_TIMEOUT_SEC) ->
     return result.stdout.strip()
 
 
+class LocalBackend(Protocol):
+    """배치 하나를 처리해 프롬프트 순서대로 {"text", "prompt_tokens", "completion_tokens"}를 돌려주는 백엔드"""
+
+    def generate_batch(self, model: str, prompts: list[str]) -> list[dict[str, Any]]: ...
+
+    def close(self) -> None: ...
+
+
+class SubprocessBackend:
+    """JSON Lines 프로토콜을 말하는 자식 프로세스 하나를 계속 살려 두고 배치를 보낸다.
+
+    프로세스가 죽어 있으면 다음 배치에서 다시 띄운다. 응답이 timeout 안에 오지 않으면 죽이고 예외를 낸다.
+    stdout은 리더 스레드가 줄 단위로 큐에 넣고(select 없이 Windows에서도 동작, 덜 쓴 줄에서 막히지 않음),
+    stderr는 별도 스레드가 계속 비워 파이프가 차서 자식이 멈추지 않게 하고 마지막 몇 줄만 오류 메시지용으로 남긴다.
+    """
+
+    STDERR_TAIL_LINES = 20
+
+    def __init__(self, cmd: list[str] = STUB_WORKER_CMD, timeout: float = _SUBPROCESS_TIMEOUT_SEC) -> None:
+        self.cmd = cmd
+        self.timeout = timeout
+        self._proc: subprocess.Popen | None = None
+        self._lines: queue.Queue[str | None] = queue.Queue()
+        self._stderr_tail: deque[str] = deque(maxlen=self.STDERR_TAIL_LINES)
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> subprocess.Popen:
+        if self._proc is None or self._proc.poll() is not None:
+            logger.info("starting local worker: %s", " ".join(self.cmd)[:80])
+            self._proc = subprocess.Popen(
+                self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
+            )
+            # 프로세스마다 새 큐: 죽인 프로세스가 늦게 내놓은 줄이 다음 배치 응답으로 섞이지 않는다
+            self._lines = queue.Queue()
+            self._stderr_tail = deque(maxlen=self.STDERR_TAIL_LINES)
+            for target, stream, sink in (
+                (self._read_stdout, self._proc.stdout, self._lines),
+                (self._drain_stderr, self._proc.stderr, self._stderr_tail),
+            ):
+                threading.Thread(target=target, args=(stream, sink), name="local-worker-io", daemon=True).start()
+        return self._proc
+
+    @staticmethod
+    def _read_stdout(stream, lines: queue.Queue) -> None:
+        try:
+            for line in stream:
+                lines.put(line)
+        finally:
+            lines.put(None)  # EOF: 프로세스가 끝났다
+
+    @staticmethod
+    def _drain_stderr(stream, tail: deque) -> None:
+        for line in stream:
+            tail.append(line.rstrip())
+            logger.debug("local worker stderr: %s", line.rstrip())
+
+    def _kill(self, proc: subprocess.Popen) -> None:
+        proc.kill()
+        proc.wait()
+        self._proc = None
+
+    def generate_batch(self, model: str, prompts: list[str]) -> list[dict[str, Any]]:
+        with self._lock:
+            proc = self._ensure_started()
+            try:
+                proc.stdin.write(json.dumps({"model": model, "prompts": prompts}, ensure_ascii=False) + "\n")
+                proc.stdin.flush()
+            except OSError as e:
+                self._kill(proc)
+                raise RuntimeError(f"local worker is not accepting input: {e}") from e
+            try:
+                line = self._lines.get(timeout=self.timeout)
+            except queue.Empty:
+                self._kill(proc)
+                raise TimeoutError(f"local worker did not answer within {self.timeout}s") from None
+            if line is None:
+                proc.wait()
+                raise RuntimeError(f"local worker exited (rc={proc.returncode}): {' | '.join(self._stderr_tail)}")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"local worker error: {reply['error']}")
+        return reply["results"]
+
+    def close(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.stdin.close()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._kill(self._proc)
+
+
+class OllamaHTTPBackend:
+    """Ollama /api/generate에 keep-alive 연결로 붙는다. 배치는 스레드별 연결로 동시에 보낸다.
+
+    keep_alive로 모델을 메모리에 붙잡아 두고, 토큰 수는 응답의 prompt_eval_count/eval_count를 쓴다.
+    서버 쪽 동시 처리는 OLLAMA_NUM_PARALLEL에 따른다.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 11434,
+        keep_alive: str = "30m",
+        max_parallel: int = 4,
+        timeout: float = _SUBPROCESS_TIMEOUT_SEC,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="ollama-http")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _generate(self, model: str, prompt: str) -> dict[str, Any]:
+        body = json.dumps({"model": model, "prompt": prompt, "stream": False, "keep_alive": self.keep_alive})
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", "/api/generate", body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                data = json.loads(resp.read())
+                break
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()  # 서버가 유휴 연결을 끊었으면 한 번만 다시 연결한다
+                self._local.conn = None
+                if attempt:
+                    raise
+        if resp.status != 200:
+            raise RuntimeError(f"ollama error ({resp.status}): {data.get('error', data)}")
+        return {
+            "text": data.get("response", ""),
+            "prompt_tokens": data.get("prompt_eval_count", 0),
+            "completion_tokens": data.get("eval_count", 0),
+        }
+
+    def generate_batch(self, model: str, prompts: list[str]) -> list[dict[str, Any]]:
+        return list(self._pool.map(lambda prompt: self._generate(model, prompt), prompts))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+@dataclass
+class LocalCompletion:
+    """요청 하나의 결과. compute_sec는 이 요청이 속한 배치 전체의 처리 시간이다."""
+
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+    queue_sec: float
+    compute_sec: float
+    batch_size: int
+
+
+@dataclass
+class _Pending:
+    model: str
+    prompt: str
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class LocalInferenceWorker:
+    """상주 백엔드 앞에서 동시 요청을 마이크로배치로 묶어 보낸다.
+
+    첫 요청이 도착한 뒤 window_ms 동안(또는 max_batch개가 찰 때까지) 모은 요청을 모델별로
+    나눠 backend.generate_batch()에 한 번에 넘긴다. 배치는 디스패처 스레드 하나가 차례로 처리한다.
+    """
+
+    def __init__(self, backend: LocalBackend | None = None, max_batch: int = 8, window_ms: float = 5.0) -> None:
+        self.backend = backend or SubprocessBackend()
+        self.max_batch = max_batch
+        self.window_s = window_ms / 1000
+        self._queue: queue.Queue[_Pending | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="local-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, model: str, prompt: str) -> Future:
+        """요청을 넣고 LocalCompletion을 담을 Future를 돌려준다."""
+        pending = _Pending(model, prompt)
+        self._queue.put(pending)
+        return pending.future
+
+    def chat_completion(self, model: str, prompt: str, timeout: float | None = _SUBPROCESS_TIMEOUT_SEC) -> dict[str, Any]:
+        """local_chat_completion()과 같은 모양의 응답을 실제 usage와 대기/연산 시간을 채워 돌려준다."""
+        result: LocalCompletion = self.submit(model, prompt).result(timeout)
+        response = _to_openai_response(model, result.text, result.prompt_tokens, result.completion_tokens)
+        response["_local_elapsed_sec"] = round(result.queue_sec + result.compute_sec, 4)
+        response["_local_queue_sec"] = round(result.queue_sec, 4)
+        response["_local_compute_sec"] = round(result.compute_sec, 4)
+        response["_local_batch_size"] = result.batch_size
+        return response
+
+    def _collect(self, first: _Pending) -> tuple[list[_Pending], bool]:
+        batch = [first]
+        deadline = time.perf_counter() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, closing = self._collect(first)
+            by_model: dict[str, list[_Pending]] = {}
+            for item in batch:
+                by_model.setdefault(item.model, []).append(item)
+            for model, items in by_model.items():
+                try:
+                    self._run_batch(model, items)
+                except Exception as e:
+                    # 배치 하나의 예상 못 한 오류로 디스패처가 죽으면 이후 요청이 모두 영원히 기다린다
+                    logger.exception("local batch for %s failed", model)
+                    for item in items:
+                        _resolve(item.future, exception=e)
+            if closing:
+                return
+
+    def _run_batch(self, model: str, items: list[_Pending]) -> None:
+        # 호출자가 이미 취소한 요청은 빼고, 남은 요청은 RUNNING으로 바꿔 이후 취소되지 않게 한다
+        items = [item for item in items if item.future.set_running_or_notify_cancel()]
+        if not items:
+            return
+        started = time.perf_counter()
+        try:
+            # 제너레이터나 None을 돌려주는 백엔드도 여기서 걸러지도록 try 안에서 리스트로 만든다
+            results = list(self.backend.generate_batch(model, [item.prompt for item in items]))
+        except Exception as e:
+            for item in items:
+                _resolve(item.future, exception=e)
+            return
+        compute = time.perf_counter() - started
+        for item, result in zip(items, results):
+            try:
+                completion = LocalCompletion(
+                    text=result["text"],
+                    prompt_tokens=result.get("prompt_tokens", 0),
+                    completion_tokens=result.get("completion_tokens", 0),
+                    queue_sec=started - item.enqueued,
+                    compute_sec=compute,
+                    batch_size=len(items),
+                )
+            except (KeyError, TypeError, AttributeError):
+                _resolve(item.future, exception=RuntimeError(f"malformed local worker result: {result!r:.200}"))
+                continue
+            _resolve(item.future, completion)
+        if len(results) < len(items):
+            error = RuntimeError(f"local worker returned {len(results)} results for {len(items)} prompts")
+            for item in items[len(results):]:
+                _resolve(item.future, exception=error)
+
+    def close(self) -> None:
+        """대기 중인 요청까지 처리한 뒤 디스패처와 백엔드를 정리한다."""
+        self._queue.put(None)
+        self._thread.join()
+        self.backend.close()
+
+    def __enter__(self) -> LocalInferenceWorker:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def _resolve(future: Future, result: Any = None, exception: BaseException | None = None) -> None:
+    """이미 끝난 Future에 다시 결과를 넣으려다 InvalidStateError로 디스패처가 죽지 않게 한다."""
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+def _to_openai_response(model: str, output: str, prompt_tokens: int, completion_tokens: int) -> dict[str, Any]:
+    return {
+        "id": f"local-{int(time.time())}",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": output},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
 def local_chat_completion(
     model: str,
     prompt: str,
     *,
     cmd: list[str] | None = None,
+    worker: LocalInferenceWorker | None = None,
 ) -> dict[str, Any]:
     """로컬 LLM 호출 결과를 OpenAI `/v1/chat/completions` 응답 형식으로 감싼다.
 
-    cmd를 지정하지 않으면 echo 기반 데모 스텁을 사용한다(외부 바이너리 불필요).
+    worker를 주면 상주 워커로 보내 마이크로배칭과 실제 토큰 수를 쓴다.
+    아니면 호출마다 cmd를 실행한다. cmd를 지정하지 않으면 echo 기반 데모 스텁을 사용한다(외부 바이너리 불필요).
+    단발 CLI는 토큰 수를 알려주지 않으므로 usage는 공백 단위 추정치다(_usage_estimated).
     """
+    if worker is not None:
+        return worker.chat_completion(model, prompt)
+
     if cmd is None:
         # 데모용 스텁: 실제로는 OLLAMA_CMD_TEMPLATE.format(model=model, prompt=prompt) 형태를 쓴다.
         cmd = ["echo", f"[local:{model}] echo-stub response for: {prompt}"]
@@ -51,20 +409,10 @@ def local_chat_completion(
     output = _run_local_cli(cmd)
     elapsed = time.perf_counter() - started
 
-    return {
-        "id": f"local-{int(time.time())}",
-        "object": "chat.completion",
-        "model": model,
-        "choices": [
-            {
-                "index": 0,
-                "message": {"role": "assistant", "content": output},
-                "finish_reason": "stop",
-            }
-        ],
-        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
-        "_local_elapsed_sec": round(elapsed, 4),
-    }
+    response = _to_openai_response(model, output, len(prompt.split()), len(output.split()))
+    response["_local_elapsed_sec"] = round(elapsed, 4)
+    response["_usage_estimated"] = True
+    return response
 
 
 if __name__ == "__main__":
@@ -79,3 +427,25 @@ if __name__ == "__main__":
         local_chat_completion(model="broken", prompt="x", cmd=["nonexistent-binary-xyz"])
     except (RuntimeError, FileNotFoundError) as e:
         print(f"expected failure: {e}")
+
+    # 단발 subprocess(매번 모델 로드) vs 상주 워커 + 마이크로배칭: 동시 요청 16건
+    logging.getLogger(__name__).setLevel(logging.WARNING)
+    prompts = [f"질문 {i}: 로컬 모델 배칭 테스트" for i in range(16)]
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        started = time.perf_counter()
+        list(pool.map(
+            lambda p: local_chat_completion("local-demo-7b", p, cmd=[*STUB_WORKER_CMD, "--once", "local-demo-7b", p]),
+            prompts,
+        ))
+        print(f"단발 subprocess: {time.perf_counter() - started:.2f}s")
+
+        with LocalInferenceWorker(SubprocessBackend(), max_batch=8, window_ms=5) as worker:
+            worker.chat_completion("local-demo-7b", "워밍업")  # 모델 로드는 한 번만
+            started = time.perf_counter()
+            responses = list(pool.map(lambda p: local_chat_completion("local-demo-7b", p, worker=worker), prompts))
+            print(f"상주 워커: {time.perf_counter() - started:.2f}s")
+        for r in responses[:3]:
+            print(
+                f"  usage={r['usage']} batch={r['_local_batch_size']} "
+                f"queue={r['_local_queue_sec'] * 1000:.1f}ms compute={r['_local_compute_sec'] * 1000:.1f}ms"
+            )
@@ -1,11 +1,28 @@
-"""런타임에 발견한 LLM 모델명을 tier(cheap/standard/premium)로 자동 분류하고 라우팅한다."""
+"""런타임에 발견한 LLM 모델명을 tier(cheap/standard/premium)로 자동 분류하고 라우팅한다.
+
+ModelCatalog는 모델 목록을 디스크(.cache/model_catalog_<이름>.json)에 두고 백그라운드 스레드로
+갱신한다. 시작할 때는 디스크 스냅샷만 읽으므로 네트워크를 기다리지 않는다. 갱신할 때는
+ETag로 조건부 요청을 보내 목록이 그대로면 304로 끝낸다. tier 버킷과 tier별 선택 결과는
+갱신 때 미리 계산해 두므로 route()는 dict 조회 한 번이다.
+
+독립 실행:
+    python llm_model_tier_router.py
+"""
 from __future__ import annotations
 
+import json
 import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
 from typing import Callable, Iterable
 
 logger = logging.getLogger(__name__)
 
+CATALOG_DIR = Path(__file__).resolve().parent.parent / ".cache"
+
 # tier 오름차순 — cheap < standard < premium
 TIER_ORDER: list[str] = ["cheap", "standard", "premium"]
 
@@ -48,6 +65,127 @@ def route(buckets: dict[str, list[str]], requested_tier: str) -> str | None:
     return None
 
 
+def precompute_routes(buckets: dict[str, list[str]]) -> dict[str, str | None]:
+    """모든 요청 tier에 대한 route() 결과를 미리 계산한다."""
+    return {tier: route(buckets, tier) for tier in TIER_ORDER}
+
+
+class ModelCatalog:
+    """provider 하나의 모델 목록을 디스크에 캐시하고 백그라운드로 갱신하는 tier 라우팅 테이블.
+
+    provider는 models_if_changed(etag) -> (목록 또는 None, etag)를 구현하면 조건부 요청을 쓰고,
+    아니면 list_models()나 models()로 전체 목록을 받는다. ttl_s가 지나지 않은 스냅샷은 다시 받지 않는다.
+    """
+
+    def __init__(
+        self,
+        provider: object,
+        name: str,
+        path: str | Path | None = None,
+        ttl_s: float = 6 * 3600,
+    ) -> None:
+        self.provider = provider
+        self.name = name
+        self.path = Path(path) if path is not None else CATALOG_DIR / f"model_catalog_{name}.json"
+        self.ttl_s = ttl_s
+        self.models: list[str] = []
+        self.etag: str | None = None
+        self.fetched_at = 0.0
+        self._buckets: dict[str, list[str]] = {tier: [] for tier in TIER_ORDER}
+        self._routes: dict[str, str | None] = dict.fromkeys(TIER_ORDER)
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._load()
+
+    @property
+    def buckets(self) -> dict[str, list[str]]:
+        return self._buckets
+
+    def is_stale(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self.fetched_at >= self.ttl_s
+
+    def route(self, requested_tier: str) -> str | None:
+        """미리 계산한 결과를 돌려준다. 모르는 tier는 standard로 본다."""
+        routes = self._routes
+        return routes[requested_tier] if requested_tier in routes else routes[DEFAULT_TIER]
+
+    def _apply(self, models: list[str]) -> None:
+        # 새 dict를 다 만든 뒤 참조만 바꾼다: route()는 락 없이 항상 일관된 스냅샷을 본다
+        buckets = discover_and_classify(lambda: models)
+        self.models = models
+        self._buckets, self._routes = buckets, precompute_routes(buckets)
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("model catalog %s unreadable, ignoring: %s", self.path, e)
+            return
+        self.etag = data.get("etag")
+        self.fetched_at = data.get("fetched_at", 0.0)
+        self._apply(data.get("models", []))
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"models": self.models, "etag": self.etag, "fetched_at": self.fetched_at}
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _fetch(self) -> tuple[list[str] | None, str | None]:
+        if hasattr(self.provider, "models_if_changed"):
+            return self.provider.models_if_changed(self.etag)
+        list_models = getattr(self.provider, "list_models", None) or self.provider.models
+        return list(list_models()), None
+
+    def refresh(self, force: bool = False) -> bool:
+        """스냅샷이 만료됐으면(force면 항상) 다시 받는다. 목록이 바뀌었으면 True."""
+        with self._refresh_lock:
+            if not force and not self.is_stale():
+                return False
+            models, etag = self._fetch()
+            self.fetched_at = time.time()
+            changed = models is not None and models != self.models
+            if models is not None:
+                self.etag = etag
+                if changed:
+                    self._apply(models)
+            self._save()
+        logger.info("model catalog %s refreshed: %s", self.name, "changed" if changed else "not modified")
+        return changed
+
+    def start(self, interval_s: float | None = None) -> "ModelCatalog":
+        """백그라운드 갱신 스레드를 띄운다. 만료된 스냅샷이면 바로 한 번 갱신한다. stop() 뒤에 다시 불러도 된다."""
+        interval_s = self.ttl_s if interval_s is None else interval_s
+        if self._thread is None:
+            self._stop.clear()  # stop()이 남긴 신호 때문에 새 스레드가 첫 대기에서 바로 끝나지 않게 한다
+            self._thread = threading.Thread(target=self._run, args=(interval_s,), name=f"catalog-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self, interval_s: float) -> None:
+        while True:
+            try:
+                self.refresh()
+                wait = min(interval_s, max(self.fetched_at + self.ttl_s - time.time(), 1.0))
+            except Exception as e:  # noqa: BLE001 - 갱신 실패는 기존 스냅샷으로 계속 버틴다
+                logger.warning("model catalog %s refresh failed: %s", self.name, e)
+                wait = min(interval_s, 60.0)
+            if self._stop.wait(wait):
+                return
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
 class DummyProvider:
     """실제 공급자 SDK 대신 고정된 모델 목록을 돌려주는 더미 provider."""
 
@@ -61,6 +199,22 @@ class DummyProvider:
         ]
 
 
+class DummyETagProvider(DummyProvider):
+    """ETag 조건부 요청을 흉내 낸다. fetches는 실제로 목록을 내려준 횟수."""
+
+    etag = '"v1"'
+
+    def __init__(self) -> None:
+        self.fetches = 0
+
+    def models_if_changed(self, etag: str | None = None) -> tuple[list[str] | None, str | None]:
+        time.sleep(0.2)  # 원격 왕복
+        if etag == self.etag:
+            return None, etag
+        self.fetches += 1
+        return self.list_models(), self.etag
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
@@ -78,3 +232,29 @@ if __name__ == "__main__":
     # cheap tier가 비어 있을 때 상위로 업그레이드되는지 확인
     empty_cheap = {"cheap": [], "standard": ["gpt-4-mini-standin"], "premium": ["gemini-2.5-pro"]}
     print("cheap 버킷이 비었을 때:", route(empty_cheap, "cheap"))
+
+    # 디스크 캐시 + 백그라운드 갱신: 두 번째 프로세스 시작은 네트워크 없이 스냅샷으로 바로 라우팅한다.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "model_catalog_dummy.json"
+        remote = DummyETagProvider()
+
+        start = time.perf_counter()
+        first = ModelCatalog(remote, "dummy", path=path).start()
+        print(f"첫 시작(스냅샷 없음): {(time.perf_counter() - start) * 1000:.1f}ms, route(cheap)={first.route('cheap')}")
+        time.sleep(0.5)  # 백그라운드 첫 갱신 대기
+        first.stop()
+        print(f"백그라운드 갱신 후: route(cheap)={first.route('cheap')}, 목록 다운로드 {remote.fetches}회")
+
+        start = time.perf_counter()
+        second = ModelCatalog(remote, "dummy", path=path).start()
+        print(f"재시작(스냅샷 있음): {(time.perf_counter() - start) * 1000:.1f}ms, route(premium)={second.route('premium')}")
+        second.stop()
+
+        second.refresh(force=True)
+        print(f"강제 갱신(ETag 일치 -> 304): 목록 다운로드 {remote.fetches}회")
+
+        n = 1_000_000
+        start = time.perf_counter()
+        for _ in range(n):
+            second.route("cheap")
+        print(f"route() 1회: {(time.perf_counter() - start) / n * 1e9:.0f}ns")
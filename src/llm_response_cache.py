@@ -0,0 +1,450 @@
+"""BaseChatAPI.chat 앞에 끼우는 2단 응답 캐시.
+
+term.extract_term·write_term.analyze_text·subagent처럼 같은 긴 프롬프트 템플릿을
+반복해서 보내는 호출에서, 똑같은 요청은 다시 보내지 않도록 응답을 저장해 둔다.
+
+- 정확 일치 계층: (provider, model, temperature, 정규화한 messages)의 해시를 키로
+  SQLite 파일에 저장한다. TTL이 지나면 만료되고, 개수 상한을 넘으면 가장 오래
+  안 쓴 항목부터 지운다.
+- 유사도 계층(선택): similarity_threshold를 주면 정확 일치가 없을 때 같은
+  provider/model/temperature 안에서 코사인 유사도가 임계값 이상인 응답을 돌려준다.
+  기본 임베딩은 외부 모델 없이 쓰는 해시 문자 3-gram 벡터다. 템플릿이 길고 본문만
+  다른 프롬프트는 서로 비슷하게 보이므로 임계값은 보수적으로(0.97 이상) 잡는다.
+
+hit/miss 횟수와 캐시 덕분에 아낀 시간(원래 호출 지연 - 조회 시간)은 stats로 확인한다.
+
+독립 실행:
+    python3 -m src.llm_response_cache
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+from src.chat import BaseChatAPI
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+logger = logging.getLogger("llm_response_cache")
+
+EMBED_DIM = 256
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "llm_responses.sqlite"
+
+EmbedFn = Callable[[str], list[float]]
+
+
+def normalize_messages(messages: list | str) -> str:
+    """문자열/메시지 리스트를 같은 요청이면 같은 문자열이 되도록 정규화한다.
+
+    문자열 앞뒤 공백만 지운다. 코드 들여쓰기·표·줄바꿈처럼 안쪽 공백은 의미가 있을 수 있어 그대로 둔다.
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+
+    def strip(value):
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items()}
+        return value
+
+    return json.dumps(strip(messages), ensure_ascii=False, sort_keys=True, default=_encode_blob)
+
+
+def _encode_blob(value):
+    """vision 메시지의 llm_vision.Base64Blob은 base64 본문 대신 원본 이미지 해시로 키에 넣는다."""
+    image = getattr(value, "image", None)
+    if image is not None and hasattr(image, "sha256"):
+        return {"image_sha256": image.sha256(), "mime": image.mime}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def is_cacheable_response(response: str) -> bool:
+    """CachedChatAPI의 기본 should_cache. 빈 응답과 오류 응답은 저장하지 않는다.
+
+    Gemini/OpenRouter의 _parse_chat은 본문에 답이 없으면(4xx 오류, 차단 등) 응답 dict를 str()로,
+    Ollama는 "Error: ..."를 돌려준다. 이런 값을 TTL 동안 캐시하면 같은 요청이 계속 실패한다.
+    """
+    text = (response or "").strip()
+    return bool(text) and not text.startswith(("Error:", "{'"))
+
+
+def hashed_ngram_embedding(text: str, dim: int = EMBED_DIM) -> list[float]:
+    """문자 3-gram을 dim개 버킷에 해시해 세고 L2 정규화한 벡터. 임베딩 모델 없이 쓰는 기본값."""
+    vec = [0.0] * dim
+    for i in range(max(1, len(text) - 2)):
+        digest = hashlib.blake2b(text[i : i + 3].encode("utf-8"), digest_size=4).digest()
+        vec[int.from_bytes(digest, "little") % dim] += 1.0
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    saved_s: float = 0.0  # 캐시 적중으로 아낀 시간(초)
+
+
+class ResponseCache:
+    """SQLite 기반 정확 일치 + 선택적 유사도 응답 캐시. 여러 스레드에서 같이 써도 된다."""
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        ttl_s: float = 7 * 24 * 3600,
+        max_entries: int = 10_000,
+        similarity_threshold: float | None = None,
+        embed_fn: EmbedFn = hashed_ngram_embedding,
+    ) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                response TEXT NOT NULL,
+                latency_s REAL NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                embedding BLOB
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_ns ON responses(namespace, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _namespace(provider: str, model: str, temperature: float) -> str:
+        return f"{provider}|{model}|{temperature:g}"
+
+    @staticmethod
+    def _key(namespace: str, normalized: str) -> str:
+        return hashlib.sha256(f"{namespace}|{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, provider: str, model: str, temperature: float, messages: list | str) -> str | None:
+        start = time.perf_counter()
+        namespace = self._namespace(provider, model, temperature)
+        normalized = normalize_messages(messages)
+        key = self._key(namespace, normalized)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, latency_s FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_s),
+            ).fetchone()
+            if row is not None:
+                self._touch(key, now)
+                self.stats.exact_hits += 1
+                self.stats.saved_s += max(0.0, row[1] - (time.perf_counter() - start))
+                return row[0]
+
+        if self.similarity_threshold is not None:
+            found = self._get_similar(namespace, normalized, now)
+            if found is not None:
+                response, similar_key, latency_s = found
+                with self._lock:
+                    self._touch(similar_key, now)
+                    self.stats.similar_hits += 1
+                    self.stats.saved_s += max(0.0, latency_s - (time.perf_counter() - start))
+                return response
+
+        with self._lock:
+            self.stats.misses += 1
+        return None
+
+    def _get_similar(self, namespace: str, normalized: str, now: float) -> tuple[str, str, float] | None:
+        query = self.embed_fn(normalized)
+        best: tuple[float, str, str, float] | None = None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, response, latency_s, embedding FROM responses "
+                "WHERE namespace = ? AND created_at >= ? AND embedding IS NOT NULL",
+                (namespace, now - self.ttl_s),
+            ).fetchall()
+        for key, response, latency_s, blob in rows:
+            vec = array("f")
+            vec.frombytes(blob)
+            score = sum(a * b for a, b in zip(query, vec))
+            if score >= self.similarity_threshold and (best is None or score > best[0]):
+                best = (score, key, response, latency_s)
+        if best is None:
+            return None
+        return best[2], best[1], best[3]
+
+    def _touch(self, key: str, now: float) -> None:
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+
+    def put(
+        self, provider: str, model: str, temperature: float, messages: list | str, response: str, latency_s: float
+    ) -> None:
+        namespace = self._namespace(provider, model, temperature)
+        normalized = normalize_messages(messages)
+        embedding = None
+        if self.similarity_threshold is not None:
+            embedding = array("f", self.embed_fn(normalized)).tobytes()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(namespace, normalized), namespace, response, latency_s, now, now, embedding),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats_dict(self) -> dict:
+        stats = asdict(self.stats)
+        total = self.stats.exact_hits + self.stats.similar_hits + self.stats.misses
+        stats["hit_rate"] = (self.stats.exact_hits + self.stats.similar_hits) / total if total else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_DEFAULT_CACHE: ResponseCache | None = None
+
+
+def default_cache() -> ResponseCache:
+    """스크립트들이 같이 쓰는 디스크 캐시(.cache/llm_responses.sqlite)를 연다."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        DEFAULT_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _DEFAULT_CACHE = ResponseCache(str(DEFAULT_CACHE_PATH))
+    return _DEFAULT_CACHE
+
+
+class CachedChatAPI(BaseChatAPI):
+    """다른 BaseChatAPI를 감싸 chat/stream_chat(및 async 버전) 결과를 ResponseCache에 저장·재사용한다."""
+
+    def __init__(
+        self,
+        client: BaseChatAPI,
+        cache: ResponseCache,
+        provider: str | None = None,
+        should_cache: Callable[[str], bool] = is_cacheable_response,
+    ) -> None:
+        self.client = client
+        self.cache = cache
+        self.provider = provider or type(client).__name__.lower()
+        self.should_cache = should_cache
+
+    @property
+    def MODEL_PRICES(self) -> dict:
+        return self.client.MODEL_PRICES
+
+    def models(self) -> list:
+        return self.client.models()
+
+    # vision 해상도 상한과 이미지 content 항목(Gemini Files API 업로드 포함)은 감싼 클라이언트 것을 쓴다.
+    # BaseChatAPI 클래스 속성이 __getattr__보다 먼저 잡히므로 명시적으로 넘긴다
+    @property
+    def VISION_MAX_SIDE(self) -> int:
+        return self.client.VISION_MAX_SIDE
+
+    @property
+    def VISION_MAX_SHORT_SIDE(self) -> int | None:
+        return self.client.VISION_MAX_SHORT_SIDE
+
+    def _image_part(self, image) -> dict:
+        return self.client._image_part(image)
+
+    def chat(self, model: str, messages: list | str, temperature: float = 0.7) -> str:
+        return self._cached_call(model, messages, temperature, lambda: self.client.chat(model, messages, temperature))
+
+    def chat_with_prefix(self, model: str, prefix: str, messages: list | str, temperature: float = 0.7) -> str:
+        """캐시 키는 prefix를 붙인 전체 대화로 잡고, 미스일 때만 프로바이더 prefix 캐시 경로로 보낸다."""
+        return self._cached_call(
+            model,
+            self._prefixed(prefix, messages),
+            temperature,
+            lambda: self.client.chat_with_prefix(model, prefix, messages, temperature),
+        )
+
+    def vision(self, model: str, prompt: str, images: list, temperature: float = 0.7) -> str:
+        """캐시 키는 원본 이미지 해시로 잡고, 미스일 때만 감싼 클라이언트가 이미지 항목을 만든다.
+
+        Gemini처럼 큰 이미지를 업로드하는 프로바이더도 적중하면 업로드 없이 끝나고,
+        업로드 URI가 바뀌어도 같은 이미지면 같은 키가 된다.
+        """
+        from src.llm_vision import Base64Blob, prepare_image
+
+        prepared = [prepare_image(img, self.VISION_MAX_SIDE, self.VISION_MAX_SHORT_SIDE) for img in images]
+        text = {"type": "text", "text": prompt}
+        key_messages = [{"role": "user", "content": [text, *(Base64Blob(image) for image in prepared)]}]
+
+        def call() -> str:
+            content = [text, *(self.client._image_part(image) for image in prepared)]
+            return self.client.chat(model, [{"role": "user", "content": content}], temperature)
+
+        return self._cached_call(model, key_messages, temperature, call)
+
+    def _cached_call(self, model: str, messages: list | str, temperature: float, call: Callable[[], str]) -> str:
+        cached = self._lookup(model, messages, temperature)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        response = call()
+        self._store(model, messages, temperature, response, time.perf_counter() - start)
+        return response
+
+    def _lookup(self, model: str, messages: list | str, temperature: float) -> str | None:
+        cached = self.cache.get(self.provider, model, temperature, messages)
+        if cached is not None:
+            # 응답 캐시 적중은 프로바이더에 아무것도 보내지 않은 호출이다
+            self.last_usage = {"input_tokens": 0, "cached_tokens": 0, "response_cache_hit": True}
+        return cached
+
+    def _store(self, model: str, messages: list | str, temperature: float, response: str, latency_s: float) -> None:
+        self.last_usage = getattr(self.client, "last_usage", None)
+        if self.should_cache(response):
+            self.cache.put(self.provider, model, temperature, messages, response, latency_s)
+
+    async def achat(self, model: str, messages: list | str, temperature: float = 0.7) -> str:
+        cached = self._lookup(model, messages, temperature)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        response = await self.client.achat(model, messages, temperature)
+        self._store(model, messages, temperature, response, time.perf_counter() - start)
+        return response
+
+    def stream_chat(self, model: str, messages: list | str, temperature: float = 0.7, stats=None) -> Iterator[str]:
+        """적중하면 캐시된 응답을 한 번에, 아니면 원래 스트림을 그대로 흘리면서 끝에 저장한다."""
+        yield from self._cached_stream(
+            model, messages, temperature, lambda: self.client.stream_chat(model, messages, temperature, stats=stats)
+        )
+
+    def stream_chat_with_prefix(
+        self, model: str, prefix: str, messages: list | str, temperature: float = 0.7, stats=None
+    ) -> Iterator[str]:
+        """캐시 키는 chat_with_prefix()와 같고, 미스일 때만 프로바이더 prefix 캐시 경로로 스트리밍한다."""
+        yield from self._cached_stream(
+            model,
+            self._prefixed(prefix, messages),
+            temperature,
+            lambda: self.client.stream_chat_with_prefix(model, prefix, messages, temperature, stats=stats),
+        )
+
+    async def astream_chat(self, model: str, messages: list | str, temperature: float = 0.7, stats=None):
+        """stream_chat()의 async iterator 버전. 미스면 감싼 클라이언트의 스트림을 그대로 흘린다."""
+        async for delta in self._acached_stream(
+            model, messages, temperature, lambda: self.client.astream_chat(model, messages, temperature, stats=stats)
+        ):
+            yield delta
+
+    async def astream_chat_with_prefix(
+        self, model: str, prefix: str, messages: list | str, temperature: float = 0.7, stats=None
+    ):
+        """stream_chat_with_prefix()의 async iterator 버전"""
+        async for delta in self._acached_stream(
+            model,
+            self._prefixed(prefix, messages),
+            temperature,
+            lambda: self.client.astream_chat_with_prefix(model, prefix, messages, temperature, stats=stats),
+        ):
+            yield delta
+
+    def _cached_stream(self, model: str, messages: list | str, temperature: float, stream: Callable[[], Iterator[str]]):
+        cached = self.cache.get(self.provider, model, temperature, messages)
+        if cached is not None:
+            yield cached
+            return
+        start = time.perf_counter()
+        deltas = []
+        for delta in stream():
+            deltas.append(delta)
+            yield delta
+        self._store_stream(model, messages, temperature, "".join(deltas), time.perf_counter() - start)
+
+    async def _acached_stream(self, model: str, messages: list | str, temperature: float, stream: Callable):
+        cached = self.cache.get(self.provider, model, temperature, messages)
+        if cached is not None:
+            yield cached
+            return
+        start = time.perf_counter()
+        deltas = []
+        async for delta in stream():
+            deltas.append(delta)
+            yield delta
+        self._store_stream(model, messages, temperature, "".join(deltas), time.perf_counter() - start)
+
+    def _store_stream(self, model: str, messages: list | str, temperature: float, response: str, latency_s: float) -> None:
+        self.last_stream_stats = getattr(self.client, "last_stream_stats", None)
+        if self.should_cache(response):
+            self.cache.put(self.provider, model, temperature, messages, response, latency_s)
+
+    def __getattr__(self, name: str):
+        # base_url·key·web_search 등 감싼 클라이언트 고유 속성은 그대로 넘긴다
+        return getattr(self.client, name)
+
+
+class _SlowEchoChat(BaseChatAPI):
+    """데모용 목 클라이언트. 실제 API 대신 지연 후 프롬프트 끝부분을 돌려준다."""
+
+    def __init__(self, delay_s: float = 0.2) -> None:
+        self.delay_s = delay_s
+
+    @property
+    def MODEL_PRICES(self) -> dict:
+        return {}
+
+    def models(self) -> list:
+        return ["echo"]
+
+    def chat(self, model: str, messages: list | str, temperature: float = 0.7) -> str:
+        time.sleep(self.delay_s)
+        text = messages if isinstance(messages, str) else messages[-1]["content"]
+        return f"echo: {text[-20:]}"
+
+
+def main() -> None:
+    cache = ResponseCache(similarity_threshold=0.97)
+    client = CachedChatAPI(_SlowEchoChat(), cache, provider="mock")
+    template = "다음 텍스트에서 IT 용어를 찾아 JSON으로 정리한다. " * 20
+
+    prompts = [
+        template + "RAG 파이프라인은 검색된 문서를 LLM에 넣는다.",
+        template + "RAG 파이프라인은 검색된 문서를 LLM에 넣는다.",   # 정확 일치
+        template + "RAG 파이프라인은 검색된 문서를 LLM에 넣는다.\n",  # 끝 공백만 다름 → 정규화로 정확 일치
+        template + "RAG 파이프라인은 검색한 문서를 LLM에 넣는다.",   # 한 글자 다름 → 유사도 계층
+        "완전히 다른 질문",
+    ]
+    for prompt in prompts:
+        start = time.perf_counter()
+        client.chat("echo", prompt, temperature=0.0)
+        logger.info("%.3fs  %s", time.perf_counter() - start, prompt[-30:].strip())
+    logger.info("캐시 통계: %s", cache.stats_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""비전 요청용 이미지 준비와 base64를 흘려보내는 JSON 요청 본문.
+
+BaseChatAPI.vision()이 쓰는 파이프라인:
+
+1. detect_mime: 파일 앞 몇 바이트(매직 넘버)로 MIME을 판별한다. 확장자나 image/jpeg 고정값에 기대지 않는다
+2. prepare_image: 모델이 실제로 보는 해상도(max_side, max_short_side)보다 크면 Pillow로 줄여 다시 인코딩한다.
+   JPEG은 draft()로 DCT 단계에서부터 1/2~1/8로 디코딩한다. Pillow가 없거나 이미 작으면 원본을 그대로 쓰고,
+   경로로 받은 파일은 메모리에 통째로 올리지 않는다
+3. Base64Blob: payload 안에서 base64 문자열 자리를 차지하는 자리표시자
+4. json_body: payload를 JSON으로 직렬화하되 Base64Blob 자리는 요청을 보내는 동안 48KiB씩 base64로 인코딩해
+   흘려보낸다. 이미지 전체의 base64 문자열이나 본문 전체 JSON 문자열을 만들지 않고, Content-Length는 미리 계산한다
+
+큰 이미지는 프로바이더 파일 업로드 API로 한 번 올리고 URI로 참조한다 (Gemini._image_part).
+
+독립 실행 (저장소 루트에서):
+    python3 -m src.llm_vision
+    python3 -m src.llm_vision --megapixels 24
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# Pillow는 축소할 때만 import한다 (import 시간 절약)
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+# base64는 3바이트를 4글자로 바꾸므로 3의 배수로 잘라야 청크를 이어 붙여도 패딩이 끼지 않는다
+B64_CHUNK = 3 * 16384
+
+# (오프셋, 매직 바이트, MIME). 위에서부터 검사한다
+_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"BM", "image/bmp"),
+    (8, b"heic", "image/heic"),
+    (8, b"heix", "image/heic"),
+    (8, b"mif1", "image/heif"),
+    (8, b"avif", "image/avif"),
+)
+
+# 다시 인코딩해도 되는 형식. GIF(애니메이션)나 HEIC는 원본을 보낸다
+_RESIZABLE = {"image/png", "image/jpeg", "image/webp", "image/bmp"}
+
+
+def detect_mime(head: bytes) -> str:
+    """이미지 앞부분(32바이트면 충분)으로 MIME을 판별한다. 모르는 형식이면 ValueError."""
+    for offset, magic, mime in _SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            if mime == "image/webp" and head[:4] != b"RIFF":
+                continue
+            return mime
+    raise ValueError(f"이미지 형식을 알 수 없습니다 (앞 16바이트: {head[:16]!r})")
+
+
+def base64_len(n: int) -> int:
+    return 4 * ((n + 2) // 3)
+
+
+@dataclass
+class PreparedImage:
+    """보낼 준비가 끝난 이미지. data(메모리) 또는 path(디스크) 중 하나를 가진다."""
+
+    mime: str
+    size: int  # 보낼 바이트 수
+    data: bytes | memoryview | None = None
+    path: Path | None = None
+    width: int | None = None
+    height: int | None = None
+    original_size: int | None = None  # 축소했으면 원본 바이트 수
+
+    def chunks(self, chunk_size: int = B64_CHUNK) -> Iterator[bytes | memoryview]:
+        """원본 바이트를 chunk_size씩 내보낸다. 메모리 이미지는 복사 없이 memoryview 조각을 준다."""
+        if self.data is not None:
+            view = memoryview(self.data)
+            for i in range(0, len(view), chunk_size):
+                yield view[i:i + chunk_size]
+            return
+        with open(self.path, "rb") as f:
+            while block := f.read(chunk_size):
+                yield block
+
+    # requests의 data=로 넘기면 Content-Length를 달고 청크 단위로 보낸다 (업로드 API용)
+    def __iter__(self) -> Iterator[bytes | memoryview]:
+        return self.chunks()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def sha256(self) -> str:
+        digest = hashlib.sha256()
+        for chunk in self.chunks(1 << 20):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+def _fit(width: int, height: int, max_side: int, max_short_side: int | None) -> float:
+    scale = max_side / max(width, height)
+    if max_short_side:
+        scale = min(scale, max_short_side / min(width, height))
+    return min(1.0, scale)
+
+
+def prepare_image(
+    source: str | Path | bytes | bytearray | memoryview | PreparedImage,
+    max_side: int = 2048,
+    max_short_side: int | None = 768,
+    quality: int = 85,
+) -> PreparedImage:
+    """경로나 bytes를 PreparedImage로 만든다. 긴 변이 max_side, 짧은 변이 max_short_side를 넘으면 줄인다.
+
+    기본값은 OpenAI high detail 기준(2048 정사각형 안, 짧은 변 768)이다. 이보다 큰 이미지는 프로바이더가
+    어차피 줄이므로 보내는 바이트와 인코딩 시간만 늘어난다.
+    """
+    if isinstance(source, PreparedImage):
+        return source
+    if isinstance(source, (str, Path)):
+        path, data = Path(source), None
+        with open(path, "rb") as f:
+            head = f.read(32)
+        size = path.stat().st_size
+    else:
+        path, data = None, source
+        head = bytes(memoryview(source)[:32])
+        size = len(data)
+    image = PreparedImage(detect_mime(head), size, data, path)
+    if image.mime not in _RESIZABLE:
+        return image
+    if not HAS_PIL:
+        logger.debug("Pillow가 없어 이미지를 줄이지 않습니다: pip install pillow")
+        return image
+    return _downscale(image, max_side, max_short_side, quality)
+
+
+def _downscale(image: PreparedImage, max_side: int, max_short_side: int | None, quality: int) -> PreparedImage:
+    from PIL import Image, ImageOps
+
+    with Image.open(image.path or io.BytesIO(image.data)) as im:  # 여기까지는 헤더만 읽는다
+        image.width, image.height = im.size
+        scale = _fit(*im.size, max_side, max_short_side)
+        if scale >= 1.0:
+            return image
+        long_side = max(1, round(max(im.size) * scale))
+        im.draft("RGB", (round(im.width * scale), round(im.height * scale)))  # JPEG: DCT 단계에서 줄여 디코딩
+        has_alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+        frame = ImageOps.exif_transpose(im).convert("RGBA" if has_alpha else "RGB")
+    # EXIF 회전으로 가로세로가 바뀔 수 있어 긴 변 기준 정사각형 상자에 맞춘다
+    frame.thumbnail((long_side, long_side), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    if has_alpha:
+        frame.save(out, "PNG", optimize=True)
+        mime = "image/png"
+    else:
+        frame.save(out, "JPEG", quality=quality, optimize=True)
+        mime = "image/jpeg"
+    if out.tell() >= image.size:  # 줄였는데 더 커지면(이미 고압축 등) 원본을 보낸다
+        return image
+    return PreparedImage(
+        mime, out.tell(), out.getbuffer(), None, frame.width, frame.height, original_size=image.size
+    )
+
+
+class Base64Blob:
+    """payload 안에서 base64 문자열 자리를 차지한다. prefix는 "data:image/png;base64," 같은 data URL 머리"""
+
+    __slots__ = ("image", "prefix")
+
+    def __init__(self, image: PreparedImage, prefix: str = "") -> None:
+        self.image = image
+        self.prefix = prefix.encode("ascii")
+
+    def __len__(self) -> int:
+        return len(self.prefix) + base64_len(self.image.size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.prefix:
+            yield self.prefix
+        for chunk in self.image.chunks(B64_CHUNK):
+            yield base64.b64encode(chunk)
+
+    def __repr__(self) -> str:
+        return f"Base64Blob({self.image.mime}, {self.image.size} bytes)"
+
+
+class StreamingJSONBody:
+    """JSON 조각(bytes)과 Base64Blob을 이어 보내는 요청 본문. len()은 전체 바이트 수다.
+
+    requests의 data=에 넘기면 Content-Length를 달고 청크 단위로 보낸다. httpx AsyncClient에는 aiter()를 넘긴다.
+    여러 번 순회할 수 있어 재시도에도 그대로 쓸 수 있다.
+    """
+
+    def __init__(self, parts: list[bytes | Base64Blob]) -> None:
+        self.parts = parts
+        self._length = sum(len(part) for part in parts)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from part
+
+    async def aiter(self):
+        for chunk in self:
+            yield chunk
+
+
+def json_body(payload) -> bytes | StreamingJSONBody:
+    """payload를 JSON 요청 본문으로 만든다. Base64Blob이 없으면 그냥 bytes다."""
+    blobs: list[Base64Blob] = []
+    marker = os.urandom(8).hex()
+
+    def collect(obj):
+        if isinstance(obj, Base64Blob):
+            blobs.append(obj)
+            return f"{marker}{len(blobs) - 1}{marker}"
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    text = json.dumps(payload, ensure_ascii=False, allow_nan=False, default=collect)
+    if not blobs:
+        return text.encode("utf-8")
+    # "앞부분 marker0marker 중간 marker1marker 뒷부분" -> 짝수 칸은 JSON 조각, 홀수 칸은 blob 번호
+    pieces = text.split(marker)
+    return StreamingJSONBody(
+        [blobs[int(piece)] if i % 2 else piece.encode("utf-8") for i, piece in enumerate(pieces)]
+    )
+
+
+def _synthetic_png(width: int, height: int) -> bytes:
+    """Pillow 없이 만드는 노이즈 PNG (압축이 거의 안 되는 사진 크기를 흉내 낸다)"""
+    import struct
+    import zlib
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = width * 3
+    noise = os.urandom(row * 64)
+    raw = b"".join(b"\x00" + noise[(y % 64) * row:(y % 64 + 1) * row] for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def _legacy_body(data: bytes, prompt: str) -> bytes:
+    """예전 vision(): 전체 base64 문자열 -> data URL -> json.dumps -> encode"""
+    b64 = base64.b64encode(data).decode()
+    content = [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}}]
+    return json.dumps({"model": "m", "messages": [{"role": "user", "content": content}]}).encode()
+
+
+def _streamed_body(path: Path, prompt: str) -> int:
+    image = prepare_image(path)
+    blob = Base64Blob(image, prefix=f"data:{image.mime};base64,")
+    content = [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": blob}}]
+    body = json_body({"model": "m", "messages": [{"role": "user", "content": content}]})
+    sent = sum(len(chunk) for chunk in body)  # 소켓에 쓰는 대신 길이만 센다
+    assert sent == len(body)
+    return sent
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="비전 요청 본문 생성: 예전 방식 vs 스트리밍")
+    parser.add_argument("--megapixels", type=float, default=12.0, help="합성 이미지 크기 (폰 사진 ~12MP)")
+    args = parser.parse_args()
+
+    side = int((args.megapixels * 1e6) ** 0.5)
+    path = Path(f".cache/vision_demo_{side}.png")
+    path.parent.mkdir(exist_ok=True)
+    if not path.exists():
+        path.write_bytes(_synthetic_png(side, side * 3 // 4))
+    data = path.read_bytes()
+    logger.info("합성 이미지 %s: %.1fMB, MIME=%s, Pillow=%s", path, len(data) / 1e6, detect_mime(data[:32]), HAS_PIL)
+
+    for label, run in (
+        ("예전 방식 (파일 전체 + base64 str + json.dumps)", lambda: len(_legacy_body(path.read_bytes(), "설명해줘"))),
+        ("스트리밍 (MIME 판별 + 축소 + 청크 base64)", lambda: _streamed_body(path, "설명해줘")),
+    ):
+        tracemalloc.start()
+        start = time.perf_counter()
+        sent = run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        logger.info("%s: 본문 %.1fMB, %.0fms, 최대 추가 메모리 %.1fMB", label, sent / 1e6, elapsed * 1000, peak / 1e6)
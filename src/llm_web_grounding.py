@@ -1,23 +1,50 @@
 #!/usr/bin/env python3
-"""유료 검색 API 없이 웹 검색 결과를 LLM 그라운딩용 컨텍스트로 만드는 2단계 폴백.
+"""유료 검색 API 없이 웹 검색 결과를 LLM 그라운딩용 컨텍스트로 만드는 비동기 그라운딩 서비스.
 
-1) DuckDuckGo HTML 라이트 엔드포인트(`html.duckduckgo.com/html/`)를 requests로
-   호출해 결과를 파싱한다.
-2) 네트워크 오류·차단·파싱 실패 시 목(mock) fetch 함수로 폴백해 오프라인에서도
-   동일한 인터페이스로 검색 결과 스니펫 리스트를 반환한다.
+GroundingService는 여러 검색 엔진에 같은 쿼리를 동시에 던진다.
+- DuckDuckGo HTML 라이트 엔드포인트(`html.duckduckgo.com/html/`): httpx가 있으면 공유 AsyncClient,
+  없으면 requests를 스레드에서 호출한다
+- OllamaWeb.web_search: 설정 파일(.config.yaml 또는 LLM_CONFIG_PATH)에 ollama 키가 있을 때.
+  키가 없으면 이 엔진은 첫 검색에서 실패로 빠지고 나머지 엔진만 쓴다
+- LocalIndex: 이 블로그의 `_posts`를 SQLite FTS5로 색인한 로컬 검색 (네트워크 없이 항상 동작)
 
-requirements: requests (없으면 mock 경로만 동작), 표준 라이브러리 html.parser
+도착하는 순서대로 URL을 정규화해 중복을 지우고, 좋은 결과가 K건 모이거나 마감 시간(deadline_s)이
+지나면 나머지 엔진은 취소한다. 쿼리별 결과는 TTL 캐시에 두고, 같은 쿼리가 동시에 들어오면 검색을
+한 번만 한다. select_snippets는 결과를 토큰 예산에 맞게 잘라 build_grounding_prompt로 넘긴다.
+모든 엔진이 실패하면 목(mock) 결과로 폴백해 오프라인에서도 같은 인터페이스를 유지한다.
+
+requirements: 표준 라이브러리(html.parser, sqlite3 FTS5), 선택: httpx 또는 requests
+
+독립 실행 (저장소 루트에서):
+    python3 -m src.llm_web_grounding
+    python3 -m src.llm_web_grounding "jekyll 글쓰기" --k 3 --deadline 1.5
+    LLM_CONFIG_PATH=~/llm-keys.yaml python3 -m src.llm_web_grounding   # OllamaWeb 엔진까지 쓸 때
 """
 from __future__ import annotations
 
+import argparse
+import asyncio
 import logging
-from dataclasses import dataclass
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from html.parser import HTMLParser
+from pathlib import Path
+from typing import Awaitable, Callable
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+from src.llm_context_compress import count_tokens
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
 DUCKDUCKGO_URL = "https://html.duckduckgo.com/html/"
+ROOT = Path(__file__).resolve().parent.parent
+SITE_URL = "https://taewonynet.github.io"
 
 
 @dataclass
@@ -25,19 +52,40 @@ class SearchResult:
     title: str
     snippet: str
     url: str
+    source: str = ""  # 결과를 준 엔진 이름
+
+
+# (쿼리, 최대 결과 수) -> 결과. 예외를 내면 그 엔진만 건너뛴다
+Engine = Callable[[str, int], Awaitable[list[SearchResult]]]
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+async def _in_thread(fn, *args):
+    """동기 검색 호출을 전용 스레드 풀에서 돌린다.
+
+    asyncio.to_thread(기본 executor)를 쓰면 마감 시간에 버린 호출이 끝날 때까지 asyncio.run()이 종료를 기다린다.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="grounding")
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
 
 
 class _DuckDuckGoResultParser(HTMLParser):
-    """DuckDuckGo HTML 결과 페이지에서 `result__a`(제목+링크) 텍스트를 추출한다.
+    """DuckDuckGo HTML 결과 페이지에서 `result__a`(제목+링크)와 `result__snippet`(요약)을 추출한다.
 
     실제 페이지 구조는 자주 바뀌므로, 여기서는 데모 목적의 단순화된 파서다.
-    a 태그 중 class에 result__a가 포함된 것만 제목/링크 후보로 모은다.
+    a 태그 중 class에 result__a가 포함된 것을 제목/링크로, 그 뒤의 result__snippet을 요약으로 모은다.
     """
 
     def __init__(self) -> None:
         super().__init__()
         self.results: list[SearchResult] = []
-        self._in_result_link = False
+        self._field: str | None = None  # 지금 읽는 a 태그: "title" / "snippet" / None
         self._current_href = ""
         self._current_text = ""
 
@@ -47,32 +95,41 @@ class _DuckDuckGoResultParser(HTMLParser):
         attr_dict = dict(attrs)
         cls = attr_dict.get("class") or ""
         if "result__a" in cls:
-            self._in_result_link = True
+            self._field = "title"
             self._current_href = attr_dict.get("href") or ""
-            self._current_text = ""
+        elif "result__snippet" in cls and self.results:
+            self._field = "snippet"
+        else:
+            return
+        self._current_text = ""
 
     def handle_endtag(self, tag: str) -> None:
-        if tag == "a" and self._in_result_link:
-            self._in_result_link = False
-            if self._current_text.strip():
-                self.results.append(
-                    SearchResult(
-                        title=self._current_text.strip(),
-                        snippet="",
-                        url=self._current_href,
-                    )
-                )
+        if tag != "a" or self._field is None:
+            return
+        text = " ".join(self._current_text.split())
+        if self._field == "title" and text:
+            self.results.append(SearchResult(title=text, snippet="", url=self._current_href, source="duckduckgo"))
+        elif self._field == "snippet":
+            self.results[-1].snippet = text
+        self._field = None
 
     def handle_data(self, data: str) -> None:
-        if self._in_result_link:
+        if self._field is not None:
             self._current_text += data
 
 
-def _fetch_duckduckgo(query: str, timeout: float = 5.0) -> list[SearchResult]:
-    """DuckDuckGo HTML 엔드포인트를 호출해 검색 결과를 파싱한다.
+def _parse_duckduckgo(html: str, limit: int) -> list[SearchResult]:
+    parser = _DuckDuckGoResultParser()
+    parser.feed(html)
+    if not parser.results:
+        raise ValueError("DuckDuckGo 결과 파싱 실패: 결과 0건")
+    return parser.results[:limit]
+
+
+def _fetch_duckduckgo(query: str, timeout: float = 5.0, limit: int = 5) -> list[SearchResult]:
+    """DuckDuckGo HTML 엔드포인트를 requests로 호출해 검색 결과를 파싱한다.
 
     requests 미설치이거나 네트워크 실패 시 예외를 그대로 올린다.
-    호출부(`search_and_ground`)가 이를 잡아 mock 폴백으로 넘어간다.
     """
     import requests  # 지연 임포트: 미설치 환경에서도 모듈 로드가 되게 한다
 
@@ -83,11 +140,307 @@ def _fetch_duckduckgo(query: str, timeout: float = 5.0) -> list[SearchResult]:
         timeout=timeout,
     )
     resp.raise_for_status()
-    parser = _DuckDuckGoResultParser()
-    parser.feed(resp.text)
-    if not parser.results:
-        raise ValueError("DuckDuckGo 결과 파싱 실패: 결과 0건")
-    return parser.results[:5]
+    return _parse_duckduckgo(resp.text, limit)
+
+
+def duckduckgo_engine(timeout: float = 5.0) -> Engine:
+    """DuckDuckGo HTML 검색 엔진. httpx가 있으면 공유 AsyncClient로, 없으면 requests를 스레드에서 부른다."""
+
+    async def search(query: str, limit: int) -> list[SearchResult]:
+        from src.chat import HAS_HTTPX, get_async_client
+
+        if not HAS_HTTPX:
+            return await _in_thread(_fetch_duckduckgo, query, timeout, limit)
+        resp = await get_async_client().get(
+            DUCKDUCKGO_URL, params={"q": query}, headers={"User-Agent": "Mozilla/5.0"}, timeout=timeout
+        )
+        resp.raise_for_status()
+        return _parse_duckduckgo(resp.text, limit)
+
+    return search
+
+
+def ollama_web_engine(client=None) -> Engine:
+    """OllamaWeb.web_search 엔진. client가 없으면 첫 검색 때 .config.yaml의 키로 만든다.
+
+    web_search는 동기 호출이라 스레드에서 돌린다. 마감 시간에 취소돼도 스레드의 요청은 끝까지 간다.
+    """
+    state = {"client": client, "error": None}
+
+    async def search(query: str, limit: int) -> list[SearchResult]:
+        if state["client"] is None:
+            if state["error"] is not None:  # 키가 없으면 매번 다시 만들지 않는다
+                raise state["error"]
+            from src.ollama_web import OllamaWeb
+
+            try:
+                state["client"] = OllamaWeb()
+            except ValueError as e:
+                state["error"] = e
+                raise
+        data = await _in_thread(state["client"].web_search, query, limit)
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return [
+            SearchResult(title=r.get("title", ""), snippet=r.get("content", ""), url=r.get("url", ""), source="ollama_web")
+            for r in data.get("results", [])
+        ]
+
+    return search
+
+
+class LocalIndex:
+    """마크다운 문서를 SQLite FTS5(BM25)로 색인한 로컬 검색 엔진. 인스턴스를 그대로 Engine으로 쓴다."""
+
+    def __init__(self, docs: list[SearchResult]) -> None:
+        # 검색은 이벤트 루프 스레드에서 바로 한다 (수 ms 이내). 다른 스레드에서 불러도 되게 락을 둔다
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("CREATE VIRTUAL TABLE docs USING fts5(title, url UNINDEXED, body)")
+        self._conn.executemany(
+            "INSERT INTO docs (title, url, body) VALUES (?, ?, ?)", [(d.title, d.url, d.snippet) for d in docs]
+        )
+        self.size = len(docs)
+
+    @classmethod
+    def from_posts(cls, posts_dir: str | Path = ROOT / "_posts", site_url: str = SITE_URL) -> LocalIndex:
+        """Jekyll `_posts`를 하위 카테고리 폴더까지 색인한다. URL은 _config.yml의 permalink(/posts/:title/)를 따른다.
+
+        숨은 폴더(.ipynb_checkpoints 등)는 건너뛴다. 읽지 못한 글이 있으면 색인 수와 글 수가 달라 경고한다.
+        """
+        root = Path(posts_dir)
+        paths = sorted(
+            p for p in root.rglob("*.md") if not any(part.startswith(".") for part in p.relative_to(root).parts)
+        )
+        docs = []
+        for path in paths:
+            try:
+                text = path.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning("로컬 인덱스: %s 읽기 실패: %s", path, e)
+                continue
+            front, body = _split_front_matter(text)
+            slug = re.sub(r"^\d{4}-\d{2}-\d{2}-", "", path.stem)
+            title = re.search(r"^title:\s*(.+)$", front, re.M)
+            docs.append(SearchResult(
+                title=title.group(1).strip().strip("\"'") if title else slug,
+                snippet=body,
+                url=f"{site_url}/posts/{slug}/",
+                source="local",
+            ))
+        if len(docs) != len(paths):
+            logger.warning("로컬 인덱스: 글 %d개 중 %d개만 색인했다", len(paths), len(docs))
+        logger.info("로컬 인덱스: %s 문서 %d개", posts_dir, len(docs))
+        return cls(docs)
+
+    def search(self, query: str, limit: int) -> list[SearchResult]:
+        # 어절마다 따옴표로 감싸 FTS5 문법 문자(-, :, ( 등)를 그대로 찾고, 접두 매칭(OR)으로 조사가 붙은 어절도 건다
+        words = [w.replace('"', '""') for w in query.split()]
+        if not words:
+            return []
+        match_expr = " OR ".join(f'"{w}"*' for w in words)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT title, url, snippet(docs, 2, '', '', ' … ', 32) FROM docs WHERE docs MATCH ? "
+                "ORDER BY bm25(docs) LIMIT ?",
+                (match_expr, limit),
+            ).fetchall()
+        return [SearchResult(title=t, snippet=" ".join(s.split()), url=u, source="local") for t, u, s in rows]
+
+    async def __call__(self, query: str, limit: int) -> list[SearchResult]:
+        return self.search(query, limit)
+
+
+def _split_front_matter(text: str) -> tuple[str, str]:
+    if text.startswith("---"):
+        end = text.find("\n---", 3)
+        if end != -1:
+            return text[3:end], text[end + 4:]
+    return "", text
+
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|ref|ref_src)$")
+
+
+def unwrap_redirect(url: str) -> str:
+    """DuckDuckGo 리다이렉트 링크(//duckduckgo.com/l/?uddg=...)면 실제 목적지 URL을 돌려준다."""
+    if url.startswith("//"):
+        url = "https:" + url
+    parts = urlsplit(url)
+    if parts.netloc.endswith("duckduckgo.com") and parts.path.startswith("/l/"):
+        target = parse_qs(parts.query).get("uddg")
+        if target:
+            return target[0]
+    return url
+
+
+def normalize_url(url: str) -> str:
+    """중복 판정용 URL. 리다이렉트를 풀고 스킴·호스트 소문자·www·끝 슬래시·프래그먼트·추적 파라미터를
+    통일한다. http(s)가 아니면 빈 문자열."""
+    parts = urlsplit(unwrap_redirect(url))
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return ""
+    host = parts.netloc.lower().removeprefix("www.")
+    query = urlencode([(k, v) for k, v in parse_qs(parts.query).items() if not _TRACKING_PARAMS.match(k)], doseq=True)
+    return urlunsplit(("https", host, parts.path.rstrip("/") or "/", query, ""))
+
+
+def _is_good(result: SearchResult, key: str) -> bool:
+    # DuckDuckGo 광고(duckduckgo.com/y.js)와 제목 없는 결과는 버린다
+    return bool(key) and bool(result.title.strip()) and not key.startswith("https://duckduckgo.com/")
+
+
+class _TTLCache:
+    """쿼리 결과용 LRU + TTL 캐시 (이벤트 루프 하나에서만 쓴다)."""
+
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._items: OrderedDict[tuple, tuple[float, list[SearchResult]]] = OrderedDict()
+
+    def get(self, key: tuple, now: float) -> list[SearchResult] | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key: tuple, value: list[SearchResult], now: float) -> None:
+        self._items[key] = (now + self.ttl_s, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+
+class GroundingService:
+    """여러 검색 엔진을 병렬로 부르고, 마감 시간 안에 먼저 모인 좋은 결과 K건을 돌려준다."""
+
+    def __init__(
+        self,
+        engines: dict[str, Engine],
+        k: int = 5,
+        deadline_s: float = 2.0,
+        ttl_s: float = 600.0,
+        max_cache_entries: int = 1024,
+    ) -> None:
+        self.engines = engines
+        self.k = k
+        self.deadline_s = deadline_s
+        self._cache = _TTLCache(ttl_s, max_cache_entries)
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def search(self, query: str, k: int | None = None) -> list[SearchResult]:
+        """중복을 지운 결과 최대 k건. 캐시에 있으면 바로, 같은 쿼리가 진행 중이면 그 결과를 기다린다."""
+        k = k or self.k
+        key = (" ".join(query.lower().split()), k)
+        cached = self._cache.get(key, time.monotonic())
+        if cached is not None:
+            self.hits += 1
+            return list(cached)
+        if key in self._inflight:
+            self.hits += 1
+            return list(await asyncio.shield(self._inflight[key]))
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            results = await self._gather(query, k)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 기다리는 쪽이 없어도 경고가 뜨지 않게 읽어 둔다
+            raise
+        finally:
+            del self._inflight[key]
+        if results:  # 전부 실패한 결과는 캐시하지 않는다
+            self._cache.put(key, results, time.monotonic())
+        future.set_result(results)
+        return list(results)
+
+    async def _gather(self, query: str, k: int) -> list[SearchResult]:
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.deadline_s
+        tasks = {asyncio.create_task(engine(query, k)): name for name, engine in self.engines.items()}
+        merged: dict[str, SearchResult] = {}
+        try:
+            while tasks and len(merged) < k:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.exception() is not None:
+                        logger.warning("검색 엔진 %s 실패: %s", name, task.exception())
+                        continue
+                    for result in task.result():
+                        key = normalize_url(result.url)
+                        if not _is_good(result, key):
+                            continue
+                        if key in merged:
+                            if not merged[key].snippet and result.snippet:
+                                merged[key].snippet = result.snippet
+                        elif len(merged) < k:
+                            merged[key] = replace(result, url=unwrap_redirect(result.url), source=result.source or name)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(
+            "그라운딩 %r: %d건 (%s), %.0fms, 마감 전 취소 %d개",
+            query, len(merged), ", ".join(sorted({r.source for r in merged.values()})) or "-",
+            (time.perf_counter() - started) * 1000, len(tasks),
+        )
+        return list(merged.values())
+
+    async def ground(self, query: str, budget_tokens: int = 800, k: int | None = None) -> list[SearchResult]:
+        """search() 결과를 토큰 예산에 맞춘 스니펫 집합으로 돌려준다. build_grounding_prompt에 그대로 넘긴다."""
+        return select_snippets(query, await self.search(query, k), budget_tokens)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:  # 말줄임표까지 예산 안에 드는 가장 긴 앞부분 (문자 수 이분 탐색)
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid].rstrip() + " …") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + " …" if lo else ""
+
+
+def select_snippets(
+    query: str, results: list[SearchResult], budget_tokens: int, max_snippet_tokens: int = 120
+) -> list[SearchResult]:
+    """build_grounding_prompt 결과가 budget_tokens 안에 들도록 결과를 고르고 스니펫을 자른다.
+
+    순서대로 채우며, 스니펫은 결과당 max_snippet_tokens까지만 남긴다. 남은 예산이 스니펫에 모자라면
+    남은 만큼만 쓰고, 제목 줄도 들어가지 않으면 거기서 멈춘다.
+    """
+    remaining = budget_tokens - count_tokens(build_grounding_prompt(query, []))
+    selected = []
+    for result in results:
+        head = count_tokens(f"{len(selected) + 1}. {result.title} ({result.url})")
+        if head > remaining:
+            break
+        remaining -= head
+        snippet = ""
+        if result.snippet and remaining > 0:
+            snippet = _truncate_to_tokens(result.snippet, min(max_snippet_tokens, remaining))
+            remaining -= count_tokens(f"   {snippet}") if snippet else 0
+        selected.append(replace(result, snippet=snippet))
+    return selected
 
 
 def _mock_fetch(query: str) -> list[SearchResult]:
@@ -98,32 +451,54 @@ def _mock_fetch(query: str) -> list[SearchResult]:
             title=f"{query} 관련 최신 동향 정리",
             snippet=f"'{query}'에 대한 2026년 기준 요약 스니펫. (mock 데이터)",
             url="https://example.com/mock-result-1",
+            source="mock",
         ),
         SearchResult(
             title=f"{query} 공식 문서",
             snippet=f"'{query}' 관련 공식 레퍼런스 발췌. (mock 데이터)",
             url="https://example.com/mock-result-2",
+            source="mock",
         ),
     ]
 
 
-def search_and_ground(query: str) -> list[SearchResult]:
-    """검색을 수행해 LLM 컨텍스트 주입용 스니펫 리스트를 반환한다.
+_default_service: GroundingService | None = None
+
 
-    1차: DuckDuckGo HTML 파싱. 2차(예외 발생 시): mock 폴백.
+def default_service() -> GroundingService:
+    """DuckDuckGo + OllamaWeb + 블로그 _posts 로컬 인덱스를 쓰는 기본 서비스 (처음 부를 때 만든다)."""
+    global _default_service
+    if _default_service is None:
+        _default_service = GroundingService({
+            "duckduckgo": duckduckgo_engine(),
+            "ollama_web": ollama_web_engine(),
+            "local": LocalIndex.from_posts(),
+        })
+    return _default_service
+
+
+def search_and_ground(query: str, budget_tokens: int = 800) -> list[SearchResult]:
+    """검색을 수행해 LLM 컨텍스트 주입용 스니펫 리스트(토큰 예산 적용)를 반환한다.
+
+    default_service()로 엔진들을 병렬 조회하고, 결과가 하나도 없으면 mock으로 폴백한다.
     반환된 리스트가 비어 있지 않다는 것만 보장하며, 실패 원인은 로그로 남긴다.
+    이미 이벤트 루프 안이라면 `await default_service().ground(query)`를 쓴다.
     """
-    try:
-        results = _fetch_duckduckgo(query)
-        logger.info("DuckDuckGo 검색 성공: %d건", len(results))
-        return results
-    except Exception as exc:  # noqa: BLE001 - 네트워크/파싱 실패를 폭넓게 흡수해 폴백
-        logger.warning("DuckDuckGo 검색 실패(%s) -> mock 폴백", exc)
-        return _mock_fetch(query)
+
+    async def run() -> list[SearchResult]:
+        from src.chat import aclose_http
+
+        try:
+            return await default_service().ground(query, budget_tokens)
+        finally:
+            await aclose_http()
+
+    results = asyncio.run(run())
+    return results or select_snippets(query, _mock_fetch(query), budget_tokens)
 
 
 def build_grounding_prompt(query: str, results: list[SearchResult]) -> str:
-    """검색 결과를 LLM 시스템 프롬프트에 넣을 블록 텍스트로 조립한다."""
+    """검색 결과를 LLM 시스템 프롬프트에 넣을 블록 텍스트로 조립한다. 예산은 select_snippets로 미리 맞춘다."""
     lines = [f"다음은 '{query}'에 대한 검색 결과다. 참고해 답하라.", ""]
     for i, r in enumerate(results, start=1):
         lines.append(f"{i}. {r.title} ({r.url})")
@@ -133,8 +508,35 @@ def build_grounding_prompt(query: str, results: list[SearchResult]) -> str:
 
 
 if __name__ == "__main__":
-    query = "2026년 LLM 컨텍스트 압축 기법"
-    results = search_and_ground(query)
-    prompt_block = build_grounding_prompt(query, results)
-    print(f"검색 결과 {len(results)}건")
-    print(prompt_block)
+    parser = argparse.ArgumentParser(description="병렬 웹 그라운딩 데모")
+    parser.add_argument("query", nargs="?", default="jekyll 포스트 작성 typography")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--deadline", type=float, default=2.0)
+    parser.add_argument("--budget", type=int, default=300)
+    args = parser.parse_args()
+
+    async def slow_engine(query: str, limit: int) -> list[SearchResult]:
+        # 응답이 마감보다 늦는 엔진: 결과를 기다리지 않고 취소된다
+        await asyncio.sleep(args.deadline * 3)
+        return [SearchResult("늦은 결과", "", "https://example.com/slow", "slow")]
+
+    async def demo() -> None:
+        from src.chat import aclose_http
+
+        service = default_service()
+        service.k, service.deadline_s = args.k, args.deadline
+        service.engines["slow"] = slow_engine
+        for label in ("첫 조회", "캐시 조회"):
+            start = time.perf_counter()
+            results = await service.ground(args.query, args.budget)
+            print(f"{label}: {len(results)}건, {(time.perf_counter() - start) * 1000:.1f}ms")
+        # 같은 새 쿼리 8개를 동시에 보내도 검색은 한 번만 한다
+        before = service.misses
+        await asyncio.gather(*(service.search(args.query + " 동시") for _ in range(8)))
+        print(f"동시 8건 -> 실제 검색 {service.misses - before}회, 캐시 hit {service.hits}회")
+        prompt = build_grounding_prompt(args.query, results or select_snippets(args.query, _mock_fetch(args.query), args.budget))
+        print(f"프롬프트 {count_tokens(prompt)} 토큰 (예산 {args.budget})")
+        print(prompt)
+        await aclose_http()
+
+    asyncio.run(demo())
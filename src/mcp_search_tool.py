@@ -6,6 +6,12 @@ fastmcp가 설치돼 있으면 실제 FastMCP 서버에 @app.tool()로 search/ad
 여러 DB(문서 저장소·코드 저장소·이슈트래커)를 MultiRepository 하나로 묶어
 LLM 에이전트 입장에서는 "도구 하나"만 보이게 감춘다.
 
+저장소마다 문자 n-gram 역색인과 정렬된 id 색인(접두사 구간 탐색용)을 두고, MultiRepository는
+저장소별 타임아웃을 건 채 스레드 풀로 동시에 조회한 뒤 전역 top-k로 합친다.
+MCP 도구는 async 핸들러로 등록하고, source 필터는 조회 전에 저장소를 골라내는 데 쓴다.
+같은 질의가 동시에 들어오면 한 번만 조회해 결과를 나눠 갖고(coalescing), 결과는
+저장소 내용 버전을 키에 포함한 TTL+LRU 캐시에 담아 문서가 바뀌면 자동으로 무효화된다.
+
 독립 실행:
     python3 mcp_search_tool.py
 """
@@ -13,9 +19,15 @@ LLM 에이전트 입장에서는 "도구 하나"만 보이게 감춘다.
 from __future__ import annotations
 
 import asyncio
+import bisect
+import heapq
 import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dataclasses import dataclass, field
-from typing import Callable
+from typing import Awaitable, Callable, Hashable
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger("mcp_search_tool")
@@ -28,44 +40,223 @@ except ImportError:
     HAS_FASTMCP = False
 
 
+def _bigrams(text: str) -> set[str]:
+    return {text[i : i + 2] for i in range(len(text) - 1) if not text[i : i + 2].isspace()}
+
+
+def _ngrams(text: str) -> set[str]:
+    """부분일치 검색용 문자 1-gram·2-gram 집합."""
+    return {ch for ch in text if not ch.isspace()} | _bigrams(text)
+
+
+def _query_grams(query: str) -> set[str]:
+    """후보 문서 필터링에 쓸 질의 n-gram. 두 글자 이상이면 2-gram만으로 충분하다."""
+    return _bigrams(query) or {ch for ch in query if not ch.isspace()}
+
+
+def _id_prefix(doc_id: str) -> str:
+    # 데모: id가 이 접두사로 시작하는 문서를 "관련 문서"로 취급한다.
+    return doc_id.split("-")[0]
+
+
 @dataclass
 class Repository:
-    """단일 소스(DB)를 흉내내는 최소 저장소. 실제로는 sqlite/FTS·벡터 인덱스 등이 들어간다."""
+    """단일 소스(DB)를 흉내내는 최소 저장소. 실제로는 sqlite/FTS·벡터 인덱스 등이 들어간다.
+
+    문서를 넣을 때 소문자 텍스트의 문자 n-gram 역색인을 만들어 두고, 검색은 질의 n-gram
+    posting의 교집합으로 후보를 좁힌 뒤 실제 부분일치만 확인한다. 결과는 질의 등장 횟수로 점수를 매긴다.
+    MultiRepository가 검색을 스레드 풀에서 돌리므로 색인 갱신과 posting 순회는 같은 락 아래에서 한다.
+    """
 
     name: str
     documents: list[dict] = field(default_factory=list)
+    timeout_s: float = 1.0
+    version: int = field(default=0, init=False)
+    _postings: dict[str, set[int]] = field(default_factory=lambda: defaultdict(set), init=False, repr=False)
+    _lowered: list[str] = field(default_factory=list, init=False, repr=False)
+    _sorted_ids: list[tuple[str, int]] = field(default_factory=list, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        docs, self.documents = self.documents, []
+        for doc in docs:
+            self.add(doc)
+
+    def add(self, doc: dict) -> None:
+        """문서를 추가하고 역색인·정렬된 id 색인을 함께 갱신한다."""
+        lowered = doc["text"].lower()
+        grams = _ngrams(lowered)
+        with self._lock:
+            idx = len(self.documents)
+            self.documents.append(doc)
+            self._lowered.append(lowered)
+            for gram in grams:
+                self._postings[gram].add(idx)
+            bisect.insort(self._sorted_ids, (doc["id"], idx))
+            self.version += 1
+
+    def _candidates(self, query: str) -> set[int]:
+        with self._lock:
+            postings = sorted((self._postings.get(g, set()) for g in _query_grams(query)), key=len)
+            if not postings:
+                return set(range(len(self.documents)))
+            result = set(postings[0])
+            for p in postings[1:]:
+                result &= p
+                if not result:
+                    break
+            return result
 
     def search(self, query: str, k: int = 5) -> list[dict]:
-        hits = [d for d in self.documents if query.lower() in d["text"].lower()]
-        return [{**d, "source": self.name} for d in hits[:k]]
+        # documents·_lowered는 덧붙이기만 하므로 후보 idx는 락 밖에서 읽어도 유효하다.
+        q = query.lower()
+        scored = []
+        for idx in self._candidates(q):
+            count = self._lowered[idx].count(q)
+            if count:
+                scored.append((count, -idx))
+        top = heapq.nlargest(k, scored)
+        return [{**self.documents[-neg_idx], "source": self.name, "score": float(count)} for count, neg_idx in top]
+
+    def related(self, doc_id: str) -> list[dict]:
+        """정렬된 id 색인에서 id가 doc_id의 접두사로 시작하는 문서 구간만 이분 탐색으로 꺼낸다."""
+        prefix = _id_prefix(doc_id)
+        with self._lock:
+            pos = bisect.bisect_left(self._sorted_ids, (prefix,))
+            hits = []
+            while pos < len(self._sorted_ids) and self._sorted_ids[pos][0].startswith(prefix):
+                other_id, i = self._sorted_ids[pos]
+                if other_id != doc_id:
+                    hits.append(i)
+                pos += 1
+        return [{**self.documents[i], "source": self.name} for i in sorted(hits)]
 
 
 class MultiRepository:
     """여러 Repository를 federation해 하나의 인터페이스 뒤에 감춘다.
 
     DB가 몇 개든, 어떤 종류든 상위 계층(MCP 도구)은 이 클래스 하나만 호출한다.
+    저장소 조회는 스레드 풀로 동시에 내보내고, 저장소별 timeout_s를 넘긴 응답은 버린다.
     """
 
-    def __init__(self, repos: list[Repository]) -> None:
+    def __init__(self, repos: list[Repository], max_workers: int | None = None) -> None:
         self._repos = repos
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(1, len(repos)), thread_name_prefix="repo"
+        )
+
+    @property
+    def version(self) -> tuple[int, ...]:
+        """저장소별 내용 버전. 문서가 하나라도 추가되면 값이 바뀐다."""
+        return tuple(repo.version for repo in self._repos)
+
+    def repository(self, name: str) -> Repository:
+        return next(repo for repo in self._repos if repo.name == name)
 
-    def search(self, query: str, k_per_repo: int = 3) -> list[dict]:
+    def _select(self, sources: set[str] | None) -> list[Repository]:
+        return [repo for repo in self._repos if sources is None or repo.name in sources]
+
+    def _fan_out(self, call: Callable[[Repository], list[dict]], sources: set[str] | None = None) -> list[dict]:
+        start = time.monotonic()
+        futures = [(repo, self._executor.submit(call, repo)) for repo in self._select(sources)]
         merged: list[dict] = []
-        for repo in self._repos:
-            merged.extend(repo.search(query, k=k_per_repo))
+        for repo, fut in futures:
+            remaining = max(0.0, start + repo.timeout_s - time.monotonic())
+            try:
+                merged.extend(fut.result(timeout=remaining))
+            except FutureTimeoutError:
+                logger.warning("저장소 %s 응답 시간 초과(%.2fs) — 결과에서 제외", repo.name, repo.timeout_s)
+            except Exception as e:
+                logger.warning("저장소 %s 조회 실패: %s", repo.name, e)
         return merged
 
+    async def _afan_out(self, call: Callable[[Repository], list[dict]], sources: set[str] | None = None) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        repos = self._select(sources)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(loop.run_in_executor(self._executor, call, repo), repo.timeout_s) for repo in repos),
+            return_exceptions=True,
+        )
+        merged: list[dict] = []
+        for repo, result in zip(repos, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning("저장소 %s 응답 시간 초과(%.2fs) — 결과에서 제외", repo.name, repo.timeout_s)
+            elif isinstance(result, Exception):
+                logger.warning("저장소 %s 조회 실패: %s", repo.name, result)
+            else:
+                merged.extend(result)
+        return merged
+
+    def search(self, query: str, k: int = 5, sources: set[str] | None = None) -> list[dict]:
+        """sources에 해당하는 저장소(없으면 전체)를 동시에 조회해 점수 기준 전역 top-k만 돌려준다."""
+        merged = self._fan_out(lambda repo: repo.search(query, k=k), sources)
+        return heapq.nlargest(k, merged, key=lambda d: d["score"])
+
+    async def asearch(self, query: str, k: int = 5, sources: set[str] | None = None) -> list[dict]:
+        merged = await self._afan_out(lambda repo: repo.search(query, k=k), sources)
+        return heapq.nlargest(k, merged, key=lambda d: d["score"])
+
     def get_related(self, doc_id: str) -> list[dict]:
-        # 데모: id 접두사가 같은 문서를 "관련 문서"로 취급한다.
-        prefix = doc_id.split("-")[0]
-        related = []
-        for repo in self._repos:
-            related.extend(
-                {**d, "source": repo.name}
-                for d in repo.documents
-                if d["id"] != doc_id and d["id"].startswith(prefix)
-            )
-        return related
+        return self._fan_out(lambda repo: repo.related(doc_id))
+
+    async def aget_related(self, doc_id: str) -> list[dict]:
+        return await self._afan_out(lambda repo: repo.related(doc_id))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ResultCache:
+    """TTL+LRU 결과 캐시 + 동일 질의 coalescing.
+
+    키가 같은 요청이 진행 중이면 새로 조회하지 않고 그 Task 결과를 함께 기다린다.
+    실패한 결과는 캐시에 남기지 않는다.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl_s: float = 30.0) -> None:
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _get(self, key: Hashable) -> tuple[bool, object]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _put(self, key: Hashable, value: object) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[object]]) -> object:
+        found, value = self._get(key)
+        if found:
+            self.stats["hits"] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        self.stats["misses"] += 1
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            self._inflight.pop(key, None)
+        self._put(key, value)
+        return value
 
 
 def _demo_repos() -> MultiRepository:
@@ -104,56 +295,72 @@ class FallbackToolRegistry:
 
         return decorator
 
-    def call(self, name: str, **kwargs) -> object:
-        return self._tools[name](**kwargs)
+    async def call(self, name: str, **kwargs) -> object:
+        return await self._tools[name](**kwargs)
 
 
-def build_app(repo: MultiRepository):
+def build_app(repo: MultiRepository, cache: ResultCache | None = None):
     """search/advanced_search/get_related 세 도구를 등록한 app(또는 fallback registry)을 반환한다."""
 
     app = FastMCP("search-infra") if HAS_FASTMCP else FallbackToolRegistry()
+    cache = cache or ResultCache()
 
     @app.tool()
-    def search(query: str, k: int = 5) -> list[dict]:
+    async def search(query: str, k: int = 5) -> list[dict]:
         """소스 전체에서 query와 관련된 문서를 찾는다."""
-        return repo.search(query, k_per_repo=k)
+        key = ("search", query, k, repo.version)
+        return await cache.get_or_compute(key, lambda: repo.asearch(query, k=k))
 
     @app.tool()
-    def advanced_search(query: str, source: str | None = None, k: int = 5) -> list[dict]:
+    async def advanced_search(query: str, source: str | None = None, k: int = 5) -> list[dict]:
         """source를 지정하면 특정 저장소로 검색을 좁힌다."""
-        results = repo.search(query, k_per_repo=k)
-        if source:
-            results = [r for r in results if r["source"] == source]
-        return results
+        sources = {source} if source else None
+        key = ("advanced_search", query, source, k, repo.version)
+        return await cache.get_or_compute(key, lambda: repo.asearch(query, k=k, sources=sources))
 
     @app.tool()
-    def get_related(doc_id: str) -> list[dict]:
+    async def get_related(doc_id: str) -> list[dict]:
         """주어진 문서와 관련된 문서를 반환한다."""
-        return repo.get_related(doc_id)
+        key = ("get_related", doc_id, repo.version)
+        return await cache.get_or_compute(key, lambda: repo.aget_related(doc_id))
 
     return app
 
 
-async def _call_search(app, query: str, k: int) -> list[dict]:
+async def _call_tool(app, name: str, **kwargs) -> list[dict]:
     """실제 FastMCP는 MCP 프로토콜(call_tool)을 통해서만 도구를 호출한다."""
-    result = await app.call_tool("search", {"query": query, "k": k})
+    if not HAS_FASTMCP:
+        return await app.call(name, **kwargs)  # type: ignore[return-value]
+    result = await app.call_tool(name, kwargs)
     return result.structured_content["result"]  # type: ignore[attr-defined]
 
 
-def main() -> None:
-    logger.info("fastmcp 설치 여부: %s", HAS_FASTMCP)
-    repo = _demo_repos()
-    app = build_app(repo)
-
-    if HAS_FASTMCP:
-        result = asyncio.run(_call_search(app, query="검색", k=3))
-    else:
-        result = app.call("search", query="검색", k=3)
-
+async def _demo(app, repo: MultiRepository, cache: ResultCache) -> None:
+    # 같은 질의 5개를 동시에 보내면 실제 조회는 한 번만 일어난다.
+    results = await asyncio.gather(*(_call_tool(app, "search", query="검색", k=3) for _ in range(5)))
+    result = results[0]
     logger.info("search('검색') 결과 %d건", len(result))
     for r in result:
         logger.info("  [%s] %s", r["source"], r["text"])
 
+    issues = await _call_tool(app, "advanced_search", query="검색", source="issues", k=3)
+    logger.info("advanced_search(source='issues') 결과 %d건", len(issues))
+
+    await _call_tool(app, "search", query="검색", k=3)
+    repo.repository("docs").add({"id": "doc-5", "text": "검색 캐시 무효화 메모"})
+    refreshed = await _call_tool(app, "search", query="검색", k=5)
+    logger.info("문서 추가 후 search('검색') 결과 %d건 (캐시 무효화)", len(refreshed))
+    logger.info("캐시 통계: %s", cache.stats)
+
+
+def main() -> None:
+    logger.info("fastmcp 설치 여부: %s", HAS_FASTMCP)
+    repo = _demo_repos()
+    cache = ResultCache()
+    app = build_app(repo, cache)
+    asyncio.run(_demo(app, repo, cache))
+    repo.close()
+
 
 if __name__ == "__main__":
     main()
@@ -1,15 +1,8 @@
 # ollama.py
 import os
-import yaml
-import requests
-from pathlib import Path
-from src.chat import BaseChatAPI
+from src.chat import BaseChatAPI, config_value
 
-# 설정 로드
-with open(Path(__file__).parent.parent / ".config.yaml") as f:
-    config = yaml.safe_load(f)
-
-BASE = config.get("api", {}).get("ollama", {}).get("base_url", "http://localhost:11434")
+DEFAULT_BASE = "http://localhost:11434"
 
 class Ollama(BaseChatAPI):
     _MODEL_INFO = {
@@ -35,7 +28,8 @@ class Ollama(BaseChatAPI):
         # 추가 모델은 https://ollama.com/library 참고
     }
 
-    def __init__(self, base_url=BASE):
+    def __init__(self, base_url=None):
+        base_url = base_url or config_value("api", "ollama", "base_url") or DEFAULT_BASE
         self.base_url = base_url.rstrip("/")
 
     @property
@@ -46,14 +40,12 @@ class Ollama(BaseChatAPI):
     def models(self):
         url = f"{self.base_url}/api/tags"
         try:
-            r = requests.get(url).json()
+            r = self._get_json(url)
             return [m["name"] for m in r.get("models", [])]
         except Exception as e:
             return []
 
-    # 표준 형식의 메시지로 채팅 수행
-    def chat(self, model: str, messages: list | str, temperature: float = 0.7):
-        """Ollama API를 사용한 채팅"""
+    def _chat_request(self, model: str, messages: list | str, temperature: float):
         url = f"{self.base_url}/api/chat"
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
@@ -66,9 +58,24 @@ class Ollama(BaseChatAPI):
                 "temperature": temperature,
             }
         }
+        return url, payload, None
+
+    def _parse_chat(self, r: dict) -> str:
+        return r["message"]["content"]
+
+    # 표준 형식의 메시지로 채팅 수행
+    def chat(self, model: str, messages: list | str, temperature: float = 0.7):
+        """Ollama API를 사용한 채팅"""
+        try:
+            url, payload, headers = self._chat_request(model, messages, temperature)
+            return self._parse_chat(self._post_json(url, payload, headers))
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    async def achat(self, model: str, messages: list | str, temperature: float = 0.7):
+        """Ollama API를 사용한 비동기 채팅"""
         try:
-            r = requests.post(url, json=payload).json()
-            return r["message"]["content"]
+            return await super().achat(model, messages, temperature)
         except Exception as e:
             return f"Error: {str(e)}"
 
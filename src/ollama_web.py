@@ -1,18 +1,11 @@
-import yaml
 import requests
-from pathlib import Path
 from src import ollama as ollama_local
-
-# 설정 로드
-with open(Path(__file__).parent.parent / ".config.yaml") as f:
-    config = yaml.safe_load(f)
-
-# Ollama web을 사용하기 위해 api key 필요
-API_KEY = config["api"]["ollama"]["key"]
-BASE = config.get("api", {}).get("ollama", {}).get("base_url", "http://localhost:11434")
+from src.chat import HTTP_SETTINGS, config_value
 
 class OllamaWeb(ollama_local.Ollama):
-    def __init__(self, base_url=BASE, api_key=API_KEY):
+    def __init__(self, base_url=None, api_key=None):
+        # Ollama web을 사용하기 위해 api key 필요
+        api_key = api_key or config_value("api", "ollama", "key")
         if not api_key:
             raise ValueError("Ollama API 키가 설정되지 않았습니다. .config.yaml에 설정하세요.")
         super().__init__(base_url=base_url)
@@ -59,7 +52,7 @@ class OllamaWeb(ollama_local.Ollama):
         }
 
         try:
-            response = requests.post(api_url, json=payload, headers=headers)
+            response = self.session.post(api_url, json=payload, headers=headers, timeout=HTTP_SETTINGS["timeout"])
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -92,7 +85,7 @@ class OllamaWeb(ollama_local.Ollama):
         payload = {"url": url}
 
         try:
-            response = requests.post(api_url, json=payload, headers=headers)
+            response = self.session.post(api_url, json=payload, headers=headers, timeout=HTTP_SETTINGS["timeout"])
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -101,7 +94,7 @@ class OllamaWeb(ollama_local.Ollama):
 
 # ============ 사용 예시 ============
 if __name__ == "__main__":
-    ollama_web = OllamaWeb(api_key=API_KEY, base_url=BASE)
+    ollama_web = OllamaWeb()
 
     print("사용 가능 모델:", ollama_web.models())
 
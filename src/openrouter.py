@@ -1,16 +1,7 @@
 # openrouter.py
 import os
-import yaml
-import base64
-import requests
-from pathlib import Path
-from src.chat import BaseChatAPI
+from src.chat import BaseChatAPI, config_value
 
-# 설정 로드
-with open(Path(__file__).parent.parent / ".config.yaml") as f:
-    config = yaml.safe_load(f)
-
-API_KEY = config["api"]["openrouter"]["key"]
 BASE = "https://openrouter.ai/api/v1"
 
 class OpenRouter(BaseChatAPI):
@@ -34,10 +25,12 @@ class OpenRouter(BaseChatAPI):
         # 추가 모델은 https://openrouter.ai/models 또는 rankings 확인
     }
 
-    def __init__(self, api_key=API_KEY):
+    def __init__(self, api_key=None, base_url=BASE):
+        api_key = api_key or config_value("api", "openrouter", "key")
         if not api_key:
             raise ValueError("OpenRouter API 키가 설정되지 않았습니다. .config.yaml에 설정하세요.")
         self.key = api_key
+        self.base_url = base_url.rstrip("/")
         self.headers = {
             "Authorization": f"Bearer {self.key}",
             # "HTTP-Referer": "https://your-site.com",
@@ -50,14 +43,16 @@ class OpenRouter(BaseChatAPI):
 
     # 사용 가능한 모든 모델 목록 가져오기 (OpenRouter 전용 엔드포인트)
     def models(self):
-        url = f"{BASE}/models"
-        r = requests.get(url, headers=self.headers).json()
-        return [m["id"] for m in r.get("data", [])]
+        return self.models_if_changed()[0]
 
-    # 표준 형식의 메시지로 채팅 수행 (OpenAI 호환)
-    def chat(self, model: str, messages: list | str, temperature: float = 0.7):
-        """표준 OpenAI 호환 형식의 메시지로 채팅 수행"""
-        url = f"{BASE}/chat/completions"
+    def models_if_changed(self, etag=None):
+        r, new_etag = self._get_json_if_changed(f"{self.base_url}/models", etag, headers=self.headers)
+        if r is None:
+            return None, etag
+        return [m["id"] for m in r.get("data", [])], new_etag
+
+    def _chat_request(self, model: str, messages: list | str, temperature: float):
+        url = f"{self.base_url}/chat/completions"
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
 
@@ -66,12 +61,46 @@ class OpenRouter(BaseChatAPI):
             "messages": messages,
             "temperature": temperature,
         }
-        r = requests.post(url, json=payload, headers=self.headers).json()
+        return url, payload, self.headers
+
+    def _parse_chat(self, r: dict) -> str:
+        usage = (r.get("usage") or {}) if isinstance(r, dict) else {}
+        details = usage.get("prompt_tokens_details") or {}
+        self._record_usage(usage.get("prompt_tokens"), details.get("cached_tokens"))
         try:
             return r["choices"][0]["message"]["content"]
         except Exception as e:
             return str(r)
 
+    def _stream_request(self, model: str, messages: list | str, temperature: float):
+        url, payload, headers = self._chat_request(model, messages, temperature)
+        return url, {**payload, "stream": True}, headers
+
+    def _parse_stream_event(self, event: dict) -> tuple[str, int | None]:
+        choices = event.get("choices") or [{}]
+        delta = choices[0].get("delta", {}).get("content") or ""
+        return delta, (event.get("usage") or {}).get("completion_tokens")
+
+    def _prefixed(self, prefix: str, messages: list | str) -> list:
+        """prefix를 cache_control이 달린 system 블록으로 보낸다. chat_with_prefix와 스트리밍 버전이 함께 쓴다.
+
+        Anthropic·Gemini 계열은 이 표시 지점까지를 캐시하고, OpenAI·DeepSeek 계열은
+        표시와 무관하게 같은 앞부분을 자동으로 캐시한다. 절감량은 usage.prompt_tokens_details에 온다.
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        system = {
+            "role": "system",
+            "content": [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}],
+        }
+        return [system, *messages]
+
+    # 표준 형식의 메시지로 채팅 수행 (OpenAI 호환)
+    def chat(self, model: str, messages: list | str, temperature: float = 0.7):
+        """표준 OpenAI 호환 형식의 메시지로 채팅 수행"""
+        url, payload, headers = self._chat_request(model, messages, temperature)
+        return self._parse_chat(self._post_json(url, payload, headers))
+
 
 # ============ 사용 예시 ============
 if __name__ == "__main__":
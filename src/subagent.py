@@ -1,49 +1,132 @@
 # subagent.py
+import asyncio
 import datetime
-from typing import Dict, List
-from src.chat import get_client
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+from src.chat import StreamStats, aclose_http, get_client
+from src.llm_context_compress import count_tokens
+from src.llm_conversation_history import ConversationHistory
+from src.llm_response_cache import CachedChatAPI, ResponseCache
 
 
 class SubAgent:
     """
     서브 에이전트 클래스: 독립 메시지 히스토리 유지.
     provider와 model을 함께 받아 클라이언트를 결정.
+    히스토리는 토큰 예산을 넘으면 오래된 턴을 백그라운드에서 요약해 요청 크기를 일정하게 유지한다.
     """
-    def __init__(self, name: str, system_prompt: str, provider: str, model: str):
+    def __init__(self, name: str, system_prompt: str, provider: str, model: str, cache: ResponseCache = None,
+                 history: ConversationHistory = None):
         self.name = name
         self.system_prompt = system_prompt
         self.provider = provider
         self.model = model
         self.client = get_client(provider, model)  # provider와 model로 클라이언트 결정
-        self.messages: List[Dict] = [{"role": "system", "content": system_prompt}]
+        if cache is not None:
+            self.client = CachedChatAPI(self.client, cache, provider=provider)
+        self.history = history or ConversationHistory(system_prompt)
+        self.last_usage = None  # 마지막 chat() 호출의 입력/캐시 토큰 수
+
+    @property
+    def messages(self) -> List[Dict]:
+        """프로바이더에 보낼 전체 메시지: 요약이 붙은 시스템 프롬프트 + 최근 턴"""
+        return self.history.full_messages()
 
     def chat(self, prompt: str) -> str:
-        self.messages.append({"role": "user", "content": prompt})
-        response = self.client.chat(model=self.model, messages=self.messages)
-        self.messages.append({"role": "assistant", "content": response})
+        self.history.append("user", prompt)
+        turns = self.history.messages()
+        # 시스템 프롬프트 + 이전 대화 요약은 요약이 갱신될 때까지 같으므로 프로바이더 prefix 캐시 경로로 보낸다
+        response = self.client.chat_with_prefix(self.model, self.history.prefix(), turns)
+        self.last_usage = getattr(self.client, "last_usage", None)
+        self.history.append("assistant", response)
+        self.history.compact()
         return response
 
+    def stream_chat(self, prompt: str) -> Iterator[str]:
+        """응답 델타를 도착하는 대로 내보낸다. 스트림이 끝나면 전체 응답을 히스토리에 남긴다.
+
+        도중에 실패하거나 호출자가 제너레이터를 닫으면 이번 user 메시지를 히스토리에서 되돌린다.
+        """
+        self.history.append("user", prompt)
+        self.last_stream_stats = StreamStats()
+        deltas = []
+        try:
+            # chat()과 같이 prefix 캐시 경로로 보낸다. messages()가 끝난 요약을 반영하므로 prefix()보다 먼저 부른다
+            turns = self.history.messages()
+            stream = self.client.stream_chat_with_prefix(
+                self.model, self.history.prefix(), turns, stats=self.last_stream_stats
+            )
+            for delta in stream:
+                deltas.append(delta)
+                yield delta
+        except BaseException:
+            self.history.pop()
+            raise
+        self.history.append("assistant", "".join(deltas))
+        self.history.compact()
+
+    async def astream_chat(self, prompt: str, stats: StreamStats = None) -> AsyncIterator[str]:
+        """stream_chat()의 async 버전. 도중에 취소되거나 실패하면 이번 user 메시지를 히스토리에서 되돌린다."""
+        self.history.append("user", prompt)
+        self.last_stream_stats = stats or StreamStats()
+        deltas = []
+        try:
+            # 요약 대기(hard limit 초과 시)가 이벤트 루프를 막지 않게 스레드에서 꺼낸다
+            turns = await asyncio.to_thread(self.history.messages)
+            stream = self.client.astream_chat_with_prefix(
+                self.model, self.history.prefix(), turns, stats=self.last_stream_stats
+            )
+            async for delta in stream:
+                deltas.append(delta)
+                yield delta
+        except BaseException:
+            self.history.pop()
+            raise
+        self.history.append("assistant", "".join(deltas))
+        self.history.compact()
+
     def reset(self):
-        self.messages = [{"role": "system", "content": self.system_prompt}]
+        self.history.reset()
         print(f"[{self.name}] 세션 초기화 완료")
 
+@dataclass
+class AgentResult:
+    """call_many()에서 서브 에이전트 하나의 결과와 사용량"""
+    name: str
+    status: str = "ok"  # ok | timeout | error | cancelled
+    response: str = ""  # 실패·취소돼도 그때까지 받은 부분 응답이 남는다
+    error: Optional[str] = None
+    latency_s: float = 0.0
+    ttft_s: Optional[float] = None
+    input_tokens: int = 0  # 보낸 히스토리 + 프롬프트 (추정)
+    output_tokens: int = 0  # 프로바이더 usage가 없으면 추정
+
+
 class SessionManager:
     """
     메인 세션 매니저: provider와 model을 함께 설정.
     서브 에이전트 관리 및 채팅.
     """
-    def __init__(self, provider: str = "gemini", default_model: str = "gemini-1.5-flash"):
+    def __init__(self, provider: str = "gemini", default_model: str = "gemini-1.5-flash", cache: ResponseCache = None):
         """
         Args:
             provider: 프로바이더명 ('gemini' 또는 'openrouter')
             default_model: 기본 모델명 (예: 'gemini-1.5-flash', 'xiaomi/mimo-v2-flash:free')
+            cache: 응답 캐시. 주면 메인/서브 에이전트 호출 모두 같은 대화는 캐시에서 돌려준다
         """
         self.provider = provider
         self.default_model = default_model
+        self.cache = cache
         self.client = get_client(provider, default_model)  # provider와 model로 클라이언트 결정
+        if cache is not None:
+            self.client = CachedChatAPI(self.client, cache, provider=provider)
         
         self.sub_agents: Dict[str, SubAgent] = {}
         self.main_messages: List[Dict] = []
+        self._running: Dict[str, asyncio.Task] = {}  # call_many 중인 에이전트 -> 태스크
+        self._cancelled: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         print(f"[{datetime.datetime.now()}] SessionManager 초기화 완료. provider={provider}, 모델={default_model}")
 
     def create_subagent(self, name: str, description: str, system_prompt: str, provider: str = None, model: str = None) -> SubAgent:
@@ -63,25 +146,152 @@ class SessionManager:
         full_prompt = f"You are an expert sub-agent specializing in '{description}'.\n{system_prompt}"
         selected_provider = provider or self.provider
         selected_model = model or self.default_model
-        agent = SubAgent(name=name, system_prompt=full_prompt, provider=selected_provider, model=selected_model)
+        agent = SubAgent(name=name, system_prompt=full_prompt, provider=selected_provider, model=selected_model, cache=self.cache)
         self.sub_agents[name] = agent
         print(f"[{datetime.datetime.now()}] 서브 에이전트 '{name}' 생성 완료 ({description}, provider={selected_provider}, 모델={selected_model})")
         return agent
 
-    def call_subagent(self, name: str, prompt: str) -> str:
+    @staticmethod
+    def _print_stream(deltas: Iterator[str]) -> str:
+        """델타를 받는 즉시 출력하고 전체 응답을 돌려준다."""
+        chunks = []
+        for delta in deltas:
+            print(delta, end="", flush=True)
+            chunks.append(delta)
+        print("\n")
+        return "".join(chunks)
+
+    def call_subagent(self, name: str, prompt: str, stream: bool = False) -> str:
         if name not in self.sub_agents:
             raise ValueError(f"서브 에이전트 '{name}'가 존재하지 않습니다.")
         print(f"[{datetime.datetime.now()}] [{name}] 호출 시작: {prompt[:100]}...")
-        response = self.sub_agents[name].chat(prompt)
+        agent = self.sub_agents[name]
+        if stream:
+            print(f"[{datetime.datetime.now()}] [{name}] 응답 스트리밍:")
+            response = self._print_stream(agent.stream_chat(prompt))
+            print(f"[{datetime.datetime.now()}] [{name}] 응답 완료: {agent.last_stream_stats}\n")
+            return response
+        response = agent.chat(prompt)
         print(f"[{datetime.datetime.now()}] [{name}] 응답 완료:\n{response}\n")
+        if agent.last_usage:
+            print(f"[{datetime.datetime.now()}] [{name}] 입력 토큰 사용량: {agent.last_usage}")
         return response
 
-    def main_chat(self, prompt: str) -> str:
+    async def acall_many(
+        self,
+        prompts: Dict[str, str],
+        timeout_s: Union[float, Dict[str, float], None] = None,
+        on_delta: Callable[[str, str], None] = None,
+        on_result: Callable[[AgentResult], None] = None,
+    ) -> Dict[str, AgentResult]:
+        """여러 서브 에이전트를 동시에 호출한다.
+
+        Args:
+            prompts: {에이전트 이름: 프롬프트}
+            timeout_s: 에이전트별 제한 시간(초). 숫자면 모두에, dict면 이름별로 적용한다
+            on_delta: (이름, 델타)를 도착하는 대로 받는 콜백 (부분 결과 스트리밍)
+            on_result: 에이전트 하나가 끝날 때마다 AgentResult를 받는 콜백
+
+        Returns:
+            {이름: AgentResult}. 한 에이전트의 시간 초과·오류·취소는 그 결과에만 기록되고 나머지는 계속 진행한다.
+            이 코루틴 자체가 취소되면 진행 중인 호출을 모두 취소한다.
+        """
+        unknown = [name for name in prompts if name not in self.sub_agents]
+        if unknown:
+            raise ValueError(f"서브 에이전트 {unknown}가 존재하지 않습니다.")
+        self._loop = asyncio.get_running_loop()
+
+        async def run(name: str, prompt: str) -> AgentResult:
+            agent = self.sub_agents[name]
+            result = AgentResult(name=name, input_tokens=agent.history.tokens + count_tokens(prompt))
+            stats = StreamStats()
+            chunks = []
+
+            async def consume():
+                async for delta in agent.astream_chat(prompt, stats):
+                    chunks.append(delta)
+                    if on_delta:
+                        on_delta(name, delta)
+
+            limit = timeout_s.get(name) if isinstance(timeout_s, dict) else timeout_s
+            task = asyncio.ensure_future(consume())
+            self._running[name] = task
+            try:
+                await asyncio.wait_for(task, limit)
+            except asyncio.TimeoutError:
+                result.status, result.error = "timeout", f"{limit}s 초과"
+            except asyncio.CancelledError:
+                if name not in self._cancelled:
+                    raise
+                result.status, result.error = "cancelled", "cancel_subagent()로 취소"
+            except Exception as e:
+                result.status, result.error = "error", f"{type(e).__name__}: {e}"
+            finally:
+                self._running.pop(name, None)
+                self._cancelled.discard(name)
+            result.response = "".join(chunks)
+            result.latency_s = time.perf_counter() - stats.started
+            result.ttft_s = stats.ttft
+            result.output_tokens = stats.completion_tokens or count_tokens(result.response)
+            if on_result:
+                on_result(result)
+            return result
+
+        results = await asyncio.gather(*(run(name, prompt) for name, prompt in prompts.items()))
+        return {result.name: result for result in results}
+
+    def cancel_subagent(self, name: str) -> bool:
+        """call_many 중인 에이전트 하나를 취소한다. 다른 스레드나 on_delta 콜백에서 불러도 된다."""
+        task = self._running.get(name)
+        if task is None or self._loop is None:
+            return False
+        self._cancelled.add(name)
+        self._loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def call_many(self, prompts: Dict[str, str], timeout_s: Union[float, Dict[str, float], None] = None,
+                  stream: bool = False) -> Dict[str, AgentResult]:
+        """acall_many()의 동기 버전. stream=True면 델타를 [에이전트] 접두어와 함께 도착하는 대로 출력한다."""
+        print(f"[{datetime.datetime.now()}] 병렬 호출 시작: {', '.join(prompts)}")
+
+        def print_delta(name: str, delta: str) -> None:
+            print(f"[{name}] {delta}", flush=True)
+
+        def print_result(result: AgentResult) -> None:
+            print(f"[{datetime.datetime.now()}] [{result.name}] {result.status} ({result.latency_s:.2f}s)"
+                  + (f": {result.error}" if result.error else ""))
+
+        async def run():
+            try:
+                return await self.acall_many(prompts, timeout_s, print_delta if stream else None, print_result)
+            finally:
+                await aclose_http()
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        wall = time.perf_counter() - start
+        print(f"{'agent':<16} {'status':<9} {'latency':>8} {'ttft':>7} {'in_tok':>7} {'out_tok':>7}")
+        for r in results.values():
+            ttft = f"{r.ttft_s:.2f}s" if r.ttft_s is not None else "-"
+            print(f"{r.name:<16} {r.status:<9} {r.latency_s:>7.2f}s {ttft:>7} {r.input_tokens:>7} {r.output_tokens:>7}")
+        serial = sum(r.latency_s for r in results.values())
+        print(f"[{datetime.datetime.now()}] 병렬 호출 완료: 벽시계 {wall:.2f}s (순차였다면 약 {serial:.2f}s)\n")
+        return results
+
+    def main_chat(self, prompt: str, stream: bool = False) -> str:
         self.main_messages.append({"role": "user", "content": prompt})
         print(f"[{datetime.datetime.now()}] 메인 채팅 호출: {prompt[:100]}...")
-        response = self.client.chat(model=self.default_model, messages=self.main_messages)
+        if stream:
+            stats = StreamStats()
+            print(f"[{datetime.datetime.now()}] 메인 응답 스트리밍:")
+            response = self._print_stream(
+                self.client.stream_chat(model=self.default_model, messages=self.main_messages, stats=stats)
+            )
+            print(f"[{datetime.datetime.now()}] 메인 응답 완료: {stats}\n")
+        else:
+            response = self.client.chat(model=self.default_model, messages=self.main_messages)
+            print(f"[{datetime.datetime.now()}] 메인 응답:\n{response}\n")
         self.main_messages.append({"role": "assistant", "content": response})
-        print(f"[{datetime.datetime.now()}] 메인 응답:\n{response}\n")
         return response
 
 # 사용 예시
@@ -121,12 +331,19 @@ Check for bugs, style, performance and suggest improvements.
 답변은 한글로 해주세요."""
         )
 
-        manager.call_subagent("python_coder", "FastAPI로 간단한 TODO 리스트 API를 만들어주세요. (GET /todos, POST /todos)")
+        manager.call_subagent("python_coder", "FastAPI로 간단한 TODO 리스트 API를 만들어주세요. (GET /todos, POST /todos)", stream=True)
 
         manager.call_subagent("test_runner", "위에서 생성된 FastAPI TODO 코드에 대해 pytest 테스트를 작성해주세요.")
 
         manager.call_subagent("code_reviewer", "위 FastAPI TODO 코드 전체를 리뷰해주세요.")
 
+        # 서로 독립적인 질문은 동시에 보낸다
+        manager.call_many({
+            "python_coder": "방금 만든 API에 DELETE /todos/{id}를 추가해주세요.",
+            "test_runner": "pytest fixture로 테스트 클라이언트를 만드는 방법을 짧게 알려주세요.",
+            "code_reviewer": "FastAPI에서 흔한 성능 실수 3가지를 알려주세요.",
+        }, timeout_s=120, stream=True)
+
         print("테스트 완료!")
 
     except Exception as e:
@@ -1,6 +1,30 @@
+import sys
+import functools
+
 import requests
 
-from gemini import Gemini
+from src.gemini import Gemini
+from src.llm_response_cache import CachedChatAPI, default_cache
+
+
+@functools.lru_cache(maxsize=1)
+def gemini_client():
+    """문서마다 같은 클라이언트를 써야 컨텍스트 캐시(cachedContents)를 재사용한다."""
+    return CachedChatAPI(Gemini(), default_cache(), provider="gemini")
+
+
+def report_usage(client):
+    """이 스레드에서 한 마지막 호출의 입력 토큰과 캐시로 절감한 토큰을 출력한다."""
+    usage = getattr(client, "last_usage", None)
+    if not usage:
+        return
+    if usage.get("response_cache_hit"):
+        print("  - 응답 캐시 적중: API 호출 없음", file=sys.stderr)
+        return
+    print(
+        f"  - 입력 토큰 {usage['input_tokens']} 중 캐시 {usage['cached_tokens']} 절감",
+        file=sys.stderr,
+    )
 
 
 def extract_term(text_content):
@@ -42,11 +66,10 @@ def extract_term(text_content):
 
 """
     try:
-        g = Gemini()
-        prompt = prompt_template + text_content
-        resp = g.chat(
-          "gemini-2.5-flash-lite", [{"role": "user", "parts": [{"text": prompt}]}]
-        )
+        g = gemini_client()
+        # 지시문은 매 문서 똑같으므로 프로바이더 컨텍스트 캐시에 한 번만 올린다
+        resp = g.chat_with_prefix("gemini-2.5-flash-lite", prompt_template, text_content)
+        report_usage(g)
         return resp
 
     except requests.exceptions.RequestException as e:
@@ -8,18 +8,47 @@
 벡터는 실제 임베딩 모델 대신, 문서마다 사람이 미리 정해둔 "의미 좌표"를
 고정 벡터로 부여해 코사인 유사도 계산 구조만 흉내낸다.
 
+키워드 검색(부분일치)은 질의마다 문서를 전부 훑지 않도록 문자 2-gram 역색인을
+한 번 만들어 두고, 질의의 2-gram 중 가장 드문 것의 posting만 문서 순서대로 읽으며
+실제 부분일치를 확인해 k개가 차면 멈춘다. 결과는 선형 스캔과 똑같다.
+단어 단위로 순위를 매기고 싶으면 bm25_search()를 쓴다. BM25 역색인(impact 내림차순
+posting)을 만들어 두고 상위 k개가 확정되면 남은 posting을 읽지 않고 멈춘다(WAND 계열
+조기 종료). 다만 단어가 정확히 겹쳐야 하므로 '제주'로 '제주도'를 찾지 못한다.
+벡터 검색도 문서 벡터를 미리 정규화해 두고 numpy가 있으면 행렬곱 한 번으로 끝낸다.
+
+색인은 documents 리스트별로 최근 몇 개만 캐시한다. 리스트를 제자리에서 고쳤다면
+invalidate_index(documents)를 불러야 한다.
+
 독립 실행:
     python3 text_search_types_demo.py
+    python3 text_search_types_demo.py --bench 200000    # 합성 코퍼스로 스캔 vs 2-gram·BM25 색인 비교
 """
 
 from __future__ import annotations
 
+import argparse
+import heapq
 import logging
 import math
+import random
+import re
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from itertools import accumulate
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger("text_search_types_demo")
 
+try:
+    import numpy as np  # type: ignore
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+TOKEN_RE = re.compile(r"[\w가-힣]+")
+
 # 토이 문서 5개. 벡터는 (여행지, 음식, 기술) 3축 의미 좌표를 사람이 직접 부여했다.
 DOCUMENTS = [
     {"id": "d1", "text": "제주도 여행 코스 추천", "vector": (0.95, 0.10, 0.05)},
@@ -44,28 +73,262 @@ QUERIES = [
 ]
 
 
+def _tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """문서 리스트 하나에 대한 BM25 역색인.
+
+    용어마다 문서별 BM25 기여도(impact)를 색인 시점에 미리 계산하고, posting은
+    impact 내림차순으로 정렬해 둔다. 검색은 각 posting을 위에서부터 한 칸씩 읽으며
+    "아직 못 본 문서가 받을 수 있는 최대 점수"(현재 커서 impact 합)가 top-k 최저점
+    아래로 떨어지는 순간 멈춘다.
+    """
+
+    def __init__(self, documents: list[dict], k1: float = 1.2, b: float = 0.75) -> None:
+        self.doc_ids = [doc["id"] for doc in documents]
+        self.doc_lengths = array("I")
+        term_freqs: dict[str, dict[int, int]] = defaultdict(dict)
+        for idx, doc in enumerate(documents):
+            tokens = _tokenize(doc["text"])
+            self.doc_lengths.append(len(tokens))
+            for token in tokens:
+                posting = term_freqs[token]
+                posting[idx] = posting.get(idx, 0) + 1
+
+        n_docs = len(documents)
+        avg_len = (sum(self.doc_lengths) / n_docs) if n_docs else 1.0
+        self.impacts: dict[str, dict[int, float]] = {}
+        self.postings: dict[str, list[int]] = {}
+        for term, posting in term_freqs.items():
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            impacts = {
+                idx: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * self.doc_lengths[idx] / avg_len))
+                for idx, tf in posting.items()
+            }
+            self.impacts[term] = impacts
+            self.postings[term] = sorted(impacts, key=impacts.__getitem__, reverse=True)
+
+    def search(self, query: str, top_k: int = 3) -> list[tuple[str, float]]:
+        terms = [t for t in dict.fromkeys(_tokenize(query)) if t in self.impacts]
+        if not terms or top_k <= 0:
+            return []
+
+        cursors = dict.fromkeys(terms, 0)
+        seen: set[int] = set()
+        heap: list[tuple[float, int]] = []  # (점수, -문서번호) 최소 힙
+        while True:
+            threshold = 0.0
+            advanced = False
+            for term in terms:
+                posting = self.postings[term]
+                pos = cursors[term]
+                if pos >= len(posting):
+                    continue
+                idx = posting[pos]
+                cursors[term] = pos + 1
+                advanced = True
+                threshold += self.impacts[term][idx]
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                score = sum(self.impacts[t].get(idx, 0.0) for t in terms)
+                item = (score, -idx)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            if not advanced or (len(heap) == top_k and heap[0][0] >= threshold):
+                break
+
+        ranked = sorted(heap, reverse=True)
+        return [(self.doc_ids[-neg_idx], score) for score, neg_idx in ranked]
+
+
+class VectorIndex:
+    """미리 정규화한 문서 벡터. 질의마다 문서 노름을 다시 계산하지 않는다."""
+
+    def __init__(self, documents: list[dict]) -> None:
+        self.doc_ids = [doc["id"] for doc in documents]
+        vectors = [_normalize(doc["vector"]) for doc in documents]
+        self.matrix = np.asarray(vectors, dtype=np.float32) if HAS_NUMPY else vectors
+
+    def search(self, query_vector: tuple[float, ...], top_k: int = 3) -> list[tuple[str, float]]:
+        q = _normalize(query_vector)
+        if HAS_NUMPY:
+            scores = self.matrix @ np.asarray(q, dtype=np.float32)
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k else []
+            ranked = sorted(top, key=lambda i: (-scores[i], i))
+            return [(self.doc_ids[i], float(scores[i])) for i in ranked]
+        scored = ((sum(x * y for x, y in zip(q, vec)), -i) for i, vec in enumerate(self.matrix))
+        return [(self.doc_ids[-neg_i], score) for score, neg_i in heapq.nlargest(top_k, scored)]
+
+
+def _normalize(vector: tuple[float, ...]) -> tuple[float, ...]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return tuple(x / norm for x in vector) if norm else tuple(0.0 for _ in vector)
+
+
+class SubstringIndex:
+    """문자 2-gram -> 그 2-gram을 가진 문서 번호(오름차순) 역색인. `query in text` 부분일치를 빠르게 찾는다."""
+
+    N = 2
+
+    def __init__(self, documents: list[dict]) -> None:
+        self.doc_ids = [doc["id"] for doc in documents]
+        self.texts = [doc["text"] for doc in documents]
+        postings: dict[str, array] = {}
+        for idx, text in enumerate(self.texts):
+            for gram in {text[i : i + self.N] for i in range(len(text) - self.N + 1)}:
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array("I")
+                posting.append(idx)
+        self.postings = postings
+
+    def search(self, query: str, top_k: int = 3) -> list[str]:
+        if top_k <= 0:
+            return []
+        if len(query) < self.N:
+            candidates = range(len(self.texts))  # 1글자 질의는 2-gram으로 거를 수 없다
+        else:
+            grams = {query[i : i + self.N] for i in range(len(query) - self.N + 1)}
+            if any(gram not in self.postings for gram in grams):
+                return []
+            candidates = min((self.postings[gram] for gram in grams), key=len)
+        hits = []
+        for idx in candidates:
+            if query in self.texts[idx]:
+                hits.append(self.doc_ids[idx])
+                if len(hits) == top_k:
+                    break
+        return hits
+
+
+# (종류, documents 리스트) -> 색인. 최근 _INDEX_CACHE_SIZE개만 남긴다.
+# 리스트는 약한 참조가 안 되므로 항목이 리스트를 붙잡아 두어 id가 재사용되지 않게 하고,
+# 길이와 invalidate_index()가 올리는 버전이 달라지면 다시 만든다.
+_INDEX_CACHE_SIZE = 8
+_INDEX_CACHE: OrderedDict[tuple[str, int], tuple[list[dict], tuple[int, int], object]] = OrderedDict()
+_INDEX_VERSIONS: dict[int, int] = {}
+
+
+def invalidate_index(documents: list[dict]) -> None:
+    """documents를 제자리에서 고친 뒤 부른다. 다음 검색에서 색인을 다시 만든다."""
+    _INDEX_VERSIONS[id(documents)] = _INDEX_VERSIONS.get(id(documents), 0) + 1
+
+
+def _cached_index(kind: str, documents: list[dict], factory):
+    key = (kind, id(documents))
+    version = (len(documents), _INDEX_VERSIONS.get(id(documents), 0))
+    cached = _INDEX_CACHE.get(key)
+    if cached is None or cached[0] is not documents or cached[1] != version:
+        cached = (documents, version, factory(documents))
+        _INDEX_CACHE[key] = cached
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    _INDEX_CACHE.move_to_end(key)
+    return cached[2]
+
+
 def keyword_search(query: str, documents: list[dict], top_k: int = 3) -> list[str]:
-    """가장 단순한 키워드 부분일치 검색. 질의 단어가 문서 텍스트에 포함되는지만 본다."""
-    hits = [doc["id"] for doc in documents if query in doc["text"]]
-    return hits[:top_k]
+    """가장 단순한 키워드 부분일치 검색. 질의가 문서 텍스트에 포함되는지만 보고, 문서 순서대로 top_k개."""
+    index: SubstringIndex = _cached_index("substring", documents, SubstringIndex)
+    return index.search(query, top_k)
 
 
-def _cosine(a: tuple[float, float, float], b: tuple[float, float, float]) -> float:
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(x * x for x in b))
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot / (norm_a * norm_b)
+def bm25_search(query: str, documents: list[dict], top_k: int = 3) -> list[tuple[str, float]]:
+    """BM25 역색인 기반 단어 검색. 질의 단어와 문서 단어가 정확히 겹쳐야 점수를 받는다."""
+    index: BM25Index = _cached_index("bm25", documents, BM25Index)
+    return index.search(query, top_k)
 
 
 def vector_search(
     query_vector: tuple[float, float, float], documents: list[dict], top_k: int = 3
 ) -> list[tuple[str, float]]:
     """목 코사인 유사도 기반 벡터 검색. 문서마다 미리 정해둔 의미 좌표와 질의 좌표를 비교한다."""
-    scored = [(doc["id"], _cosine(query_vector, doc["vector"])) for doc in documents]
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return scored[:top_k]
+    index: VectorIndex = _cached_index("vector", documents, VectorIndex)
+    return index.search(query_vector, top_k)
+
+
+def _scan_keyword_search(query: str, documents: list[dict], top_k: int = 3) -> list[str]:
+    """색인 없이 문서를 전부 훑는 기존 방식. 벤치마크 비교용."""
+    hits = [doc["id"] for doc in documents if query in doc["text"]]
+    return hits[:top_k]
+
+
+def _scan_bm25_search(index: BM25Index, query: str, top_k: int = 3) -> list[tuple[str, float]]:
+    """조기 종료 없이 모든 문서의 BM25 점수를 계산해 top_k를 고른다. 벤치마크 비교용."""
+    terms = [t for t in dict.fromkeys(_tokenize(query)) if t in index.impacts]
+    scored = []
+    for idx in range(len(index.doc_ids)):
+        score = sum(index.impacts[t].get(idx, 0.0) for t in terms)
+        if score > 0:
+            scored.append((score, -idx))
+    return [(index.doc_ids[-neg_idx], score) for score, neg_idx in heapq.nlargest(top_k, scored)]
+
+
+def generate_corpus(n_docs: int, vocab_size: int = 50_000, seed: int = 42) -> list[dict]:
+    """벤치마크용 합성 코퍼스. 단어 빈도는 Zipf 분포(1/순위)를 따르고 문서 길이는 5~30단어."""
+    rng = random.Random(seed)
+    vocab = [f"t{i}" for i in range(vocab_size)]
+    cum_weights = list(accumulate(1.0 / (r + 1) for r in range(vocab_size)))
+    docs = []
+    for i in range(n_docs):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(5, 30))
+        docs.append({"id": f"d{i}", "text": " ".join(words)})
+    return docs
+
+
+def bench(n_docs: int, n_queries: int = 200, top_k: int = 10) -> None:
+    """같은 질의를 선형 스캔 vs 2-gram 색인, 전수 BM25 채점 vs BM25 색인으로 돌려 지연과 결과 일치를 비교한다."""
+    start = time.perf_counter()
+    docs = generate_corpus(n_docs)
+    logger.info("코퍼스 생성: %d문서, %.1fs", n_docs, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    index = _cached_index("substring", docs, SubstringIndex)
+    logger.info("2-gram 색인 구축: %.1fs (2-gram %d개)", time.perf_counter() - start, len(index.postings))
+
+    start = time.perf_counter()
+    bm25 = _cached_index("bm25", docs, BM25Index)
+    logger.info("BM25 색인 구축 : %.1fs (용어 %d개)", time.perf_counter() - start, len(bm25.postings))
+
+    rng = random.Random(7)
+    # 흔한 단어(앞 순위)와 드문 단어를 섞은 1~2단어 질의. 단어 일부만 쓴 질의도 섞는다
+    queries = []
+    for _ in range(n_queries):
+        query = " ".join(f"t{int(rng.paretovariate(0.8)) % 50_000}" for _ in range(rng.randint(1, 2)))
+        queries.append(query[: rng.randint(2, len(query))] if rng.random() < 0.3 else query)
+
+    scan_queries = queries[: max(1, n_queries // 20)]
+    start = time.perf_counter()
+    expected = [_scan_keyword_search(q, docs, top_k) for q in scan_queries]
+    scan_ms = (time.perf_counter() - start) * 1000 / len(scan_queries)
+
+    start = time.perf_counter()
+    results = [keyword_search(q, docs, top_k) for q in queries]
+    index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    mismatches = sum(got != want for got, want in zip(results, expected))
+    logger.info("선형 스캔  : 질의당 %.3fms (%d개 질의)", scan_ms, len(scan_queries))
+    logger.info("2-gram 색인: 질의당 %.3fms (%d개 질의, %.0f배)", index_ms, len(queries), scan_ms / max(index_ms, 1e-9))
+    logger.info("결과 일치  : %d/%d", len(scan_queries) - mismatches, len(scan_queries))
+
+    start = time.perf_counter()
+    expected = [_scan_bm25_search(bm25, q, top_k) for q in scan_queries]
+    bm25_scan_ms = (time.perf_counter() - start) * 1000 / len(scan_queries)
+
+    start = time.perf_counter()
+    results = [bm25_search(q, docs, top_k) for q in queries]
+    bm25_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    mismatches = sum(got != want for got, want in zip(results, expected))
+    logger.info("BM25 전수 채점: 질의당 %.3fms (%d개 질의)", bm25_scan_ms, len(scan_queries))
+    logger.info("BM25 색인     : 질의당 %.3fms (%d개 질의, %.0f배)", bm25_ms, len(queries), bm25_scan_ms / max(bm25_ms, 1e-9))
+    logger.info("결과 일치     : %d/%d", len(scan_queries) - mismatches, len(scan_queries))
 
 
 def main() -> None:
@@ -82,4 +345,10 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="키워드 vs 벡터 검색 비교 데모")
+    parser.add_argument("--bench", type=int, metavar="N_DOCS", help="N개 합성 문서로 선형 스캔 vs 2-gram 색인, 전수 채점 vs BM25 색인 벤치마크")
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.bench)
+    else:
+        main()
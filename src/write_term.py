@@ -2,13 +2,48 @@ import sys
 import json
 import re
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 
-from gemini import Gemini
+from src.chat import call_with_limits
+from src.llm_context_compress import count_tokens
+from src.term import gemini_client, report_usage
 
+# Per-call budget for one chunk of post body (template excluded), counted with
+# llm_context_compress.count_tokens so set_tokenizer() applies here too
+CHUNK_TOKENS = 1500
+HEADING_RE = re.compile(r"#{1,6}\s")
 
-def analyze_text(text_content):
+MODEL = "gemini-2.5-flash-lite"
+# Limits shared by every thread: files run in parallel and each splits into parallel
+# chunks, so these two values, not the pool sizes, bound what reaches the API.
+# call_with_limits keys its RPM bucket by (provider, model), the same one chat_many uses,
+# so a process running both draws from a single budget
+RPM_LIMIT = 15
+MAX_CONCURRENT_CALLS = 4
+MAX_RETRIES = 5
+_CALL_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_CALLS)
+
+
+def call_model(prefix, text_content):
+    """Send one chunk through the shared RPM bucket and concurrency cap, retrying 429/5xx with backoff."""
+
+    def call():
+        with _CALL_SLOTS:
+            g = gemini_client()
+            resp = g.chat_with_prefix(MODEL, prefix, text_content)
+            report_usage(g)
+            return resp
+
+    return call_with_limits(
+        "gemini", MODEL, call, rpm=RPM_LIMIT, max_retries=MAX_RETRIES, label="write_term"
+    )
+
+
+def analyze_chunk(text_content, raise_errors=False):
     prompt_template = """
 당신은 20년차 IT 강사이자 베테랑 개발자이며, 동시에 대학 신입생에게도 설명할 수 있을 만큼 쉽게 풀어내는 전문가입니다.
 사용자가 입력하는 모든 문장 속 개발·IT·비즈니스·실무 전문 용어를 100% 찾아 다음 규칙만 정확히 지켜서 정리해주세요.
@@ -44,13 +79,11 @@ def analyze_text(text_content):
 ---
 
 """
+    # The template is identical for every chunk of every post, so pass it as the cached prefix
+    if raise_errors:
+        return call_model(prompt_template, text_content)
     try:
-        g = Gemini()
-        prompt = prompt_template + text_content
-        resp = g.chat(
-            "gemini-2.5-flash-lite", [{"role": "user", "parts": [{"text": prompt}]}]
-        )
-        return resp
+        return call_model(prompt_template, text_content)
 
     except requests.exceptions.RequestException as e:
         return f"Error calling Gemini API: {e}"
@@ -58,6 +91,83 @@ def analyze_text(text_content):
         return f"An unexpected error occurred: {e}"
 
 
+def split_sections(text):
+    """Split Markdown into sections starting at each heading, ignoring '#' lines inside ``` fences."""
+    sections, current, in_fence = [], [], False
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence and HEADING_RE.match(line) and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def _pack(pieces, max_tokens):
+    # Greedily join consecutive pieces while they fit the budget
+    chunks, current, used = [], [], 0
+    for piece in pieces:
+        n = count_tokens(piece)
+        if current and used + n > max_tokens:
+            chunks.append("".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += n
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def chunk_markdown(text, max_tokens=CHUNK_TOKENS):
+    """Cut a post into chunks of at most max_tokens along heading boundaries.
+
+    Small neighbouring sections are packed together; a section over budget is
+    split by paragraphs, then by lines.
+    """
+    pieces = []
+    for section in split_sections(text):
+        if count_tokens(section) <= max_tokens:
+            pieces.append(section)
+            continue
+        paragraphs = [p + "\n\n" for p in section.split("\n\n")]
+        for paragraph in _pack(paragraphs, max_tokens):
+            if count_tokens(paragraph) <= max_tokens:
+                pieces.append(paragraph)
+            else:
+                pieces.extend(_pack(paragraph.splitlines(keepends=True), max_tokens))
+    return _pack(pieces, max_tokens)
+
+
+def analyze_text(text_content, max_tokens=CHUNK_TOKENS, max_workers=4, raise_errors=False):
+    """Return the model's term JSON for text_content.
+
+    By default failures come back as an error string, as before. With raise_errors the
+    exception (e.g. a ChatHTTPError left after call_model's retries) propagates instead,
+    so a caller that records progress cannot mistake a failed call for a result.
+    """
+    chunks = chunk_markdown(text_content, max_tokens)
+    if len(chunks) <= 1:
+        return analyze_chunk(text_content, raise_errors)
+
+    # Chunks run in parallel so latency follows the largest chunk, not the whole post;
+    # call_model caps how many of them (across all posts) are actually in flight
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        responses = list(pool.map(lambda chunk: analyze_chunk(chunk, raise_errors), chunks))
+    terms, index = {}, {}
+    try:
+        for response in responses:
+            merge_terms(terms, parse_terms(response), index)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return f"An unexpected error occurred: {e}"
+    print(f"  - Merged {len(chunks)} chunks into {len(terms)} terms", file=sys.stderr)
+    return json.dumps(terms, ensure_ascii=False, indent=2)
+
+
 def analyze_file(file_path):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
@@ -72,70 +182,190 @@ def analyze_file(file_path):
     return analyze_text(file_content)
 
 
-def analyze_directory(base_path, json_path, excluded_dirs=None):
-    excluded_dirs = [d or '.' for d in excluded_dirs or []]
+def normalize_path(file_path):
+    # term.json written on Windows stores "..\\_posts\\..." paths; key everything by one form
+    return os.path.normpath(file_path.replace("\\", "/")).replace(os.sep, "/")
 
-    # Load existing data if JSON file exists
-    result_data = {
-        "complete": [],
-        "term": {}
-    }
-    print(f"Starting analysis in directory: {os.path.abspath(base_path)}\n")
+
+def file_digest(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def parse_terms(analysis_result):
+    cleaned_result = re.sub(
+        r'^```(?:json)?\s*|\s*```$', '', analysis_result.strip(), flags=re.MULTILINE
+    )
+    parsed_result = json.loads(cleaned_result)
+    return parsed_result if isinstance(parsed_result, dict) else {}
+
+
+def term_key(key, value):
+    # "Large Language Model", "largeLanguageModel", "large_language_model" -> one key
+    name = value.get("english_full") if isinstance(value, dict) else None
+    return re.sub(r"[\s_\-]", "", name or key).lower()
+
+
+def merge_terms(terms, new_terms, index):
+    """Merge new_terms into terms, deduplicating by english_full.
+
+    index maps term_key() -> key already stored in terms. The first definition
+    wins; related_keywords of later duplicates are unioned into it.
+    """
+    added = 0
+    for key, value in new_terms.items():
+        if not isinstance(value, dict):
+            continue
+        norm = term_key(key, value)
+        existing = index.get(norm)
+        if existing is None:
+            terms[key] = value
+            index[norm] = key
+            added += 1
+            continue
+        keywords = terms[existing].setdefault("related_keywords", [])
+        for keyword in value.get("related_keywords") or []:
+            if keyword not in keywords:
+                keywords.append(keyword)
+    return added
+
+
+def journal_path_for(json_path):
+    return os.path.splitext(json_path)[0] + ".journal.jsonl"
+
+
+def load_state(json_path, journal_path):
+    """Load term.json and replay the journal written by an interrupted run.
+
+    Returns (hashes, terms, index). hashes maps normalized path -> sha256; files listed
+    in the legacy "complete" list have no hash yet (None).
+    """
+    result_data = {}
     if os.path.exists(json_path):
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
                 result_data = json.load(f)
             print(f"✓ Loaded existing data from {json_path}")
-            print(f"  - Already processed files: {len(result_data.get('complete', []))}")
-            print(f"  - Existing terms: {len(result_data.get('term', {}))}\n")
         except Exception as ex:
             print(f"⚠ Warning: Could not load existing JSON: {ex}\n", file=sys.stderr)
 
-    processed_files = result_data.get("complete", [])
-    new_files_count = 0
+    hashes = {normalize_path(p): h for p, h in result_data.get("hashes", {}).items()}
+    for path in result_data.get("complete", []):
+        hashes.setdefault(normalize_path(path), None)
+    terms = {}
+    index = {}
+    merge_terms(terms, result_data.get("term", {}), index)
 
-    for root, dirs, files in os.walk(base_path):
-        if os.path.relpath(root, base_path) not in excluded_dirs:
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
+    replayed = 0
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn last line from a crash
+                hashes[entry["path"]] = entry["sha256"]
+                merge_terms(terms, entry["terms"], index)
+                replayed += 1
+        print(f"✓ Replayed {replayed} journal entries from {journal_path}")
 
-                if file_path in processed_files:
-                    continue
+    print(f"  - Already processed files: {len(hashes)}")
+    print(f"  - Existing terms: {len(terms)}\n")
+    return hashes, terms, index
 
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        file_content = file.read()
 
-                    file_split = file_content.split('---')
-                    if len(file_split) > 3:
-                        file_content = '---'.join(file_split[2:]).strip()
+def save_state(json_path, journal_path, hashes, terms):
+    # Write term.json atomically, then drop the journal it now contains
+    os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+    result_data = {
+        "complete": sorted(hashes),
+        "hashes": dict(sorted(hashes.items())),
+        "term": terms,
+    }
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(result_data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, json_path)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+
+def analyze_post(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        file_content = file.read()
 
-                    analysis_result = analyze_text(file_content)
-                    cleaned_result = re.sub(
-                        r'^```(?:json)?\s*|\s*```$', '', analysis_result.strip(), flags=re.MULTILINE
-                    )
+    # Strip Jekyll front matter
+    file_split = file_content.split('---')
+    if len(file_split) > 3:
+        file_content = '---'.join(file_split[2:]).strip()
 
-                    parsed_result = json.loads(cleaned_result)
+    return parse_terms(analyze_text(file_content, raise_errors=True))
+
+
+def scan_changed_files(base_path, excluded_dirs, hashes):
+    """Yield (path, sha256) for files whose content differs from the last run."""
+    for root, dirs, files in os.walk(base_path):
+        if os.path.relpath(root, base_path) in excluded_dirs:
+            continue
+        for file_name in files:
+            file_path = normalize_path(os.path.join(root, file_name))
+            digest = file_digest(file_path)
+            if file_path in hashes and hashes[file_path] is None:
+                # Processed by an older run that did not record hashes
+                hashes[file_path] = digest
+            elif hashes.get(file_path) != digest:
+                yield file_path, digest
 
-                    if isinstance(parsed_result, dict):
-                        result_data["term"].update(parsed_result)
 
-                    result_data["complete"].append(file_path)
-                    new_files_count += 1
-                    print(f"✓ Completed: {file_path}")
+def analyze_directory(base_path, json_path, excluded_dirs=None, max_workers=4):
+    """Extract terms from new or changed files under base_path into json_path.
+
+    Files are processed max_workers at a time; every model call still goes through
+    call_model's shared RPM bucket and concurrency cap. Each finished file is appended
+    to an fsync'd journal next to json_path, so a crash loses at most the files in
+    flight; the next run replays the journal and skips files whose sha256 is
+    unchanged. A file whose call failed (rate limit after retries, bad JSON) is not
+    journaled, so the next run retries it.
+    """
+    excluded_dirs = {d or '.' for d in excluded_dirs or []}
+    journal_path = journal_path_for(json_path)
+
+    print(f"Starting analysis in directory: {os.path.abspath(base_path)}\n")
+    hashes, terms, index = load_state(json_path, journal_path)
+    pending = list(scan_changed_files(base_path, excluded_dirs, hashes))
+    print(f"Changed or new files: {len(pending)}\n")
+
+    new_files_count = 0
+    new_terms_count = 0
+    os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+    with open(journal_path, 'a', encoding='utf-8') as journal, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(analyze_post, path): (path, digest) for path, digest in pending}
+        for future in as_completed(futures):
+            file_path, digest = futures[future]
+            try:
+                new_terms = future.result()
+            except Exception as ex:
+                print(f"✗ Error processing file {file_path}: {ex}", file=sys.stderr)
+                continue
+
+            entry = {"path": file_path, "sha256": digest, "terms": new_terms}
+            journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
 
-                except Exception as ex:
-                    print(f"✗ Error processing file {file_path}: {ex}", file=sys.stderr)
+            hashes[file_path] = digest
+            new_terms_count += merge_terms(terms, new_terms, index)
+            new_files_count += 1
+            print(f"✓ Completed: {file_path}")
 
-    # Save result to JSON file
     try:
-        os.makedirs(os.path.dirname(json_path), exist_ok=True)
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
+        save_state(json_path, journal_path, hashes, terms)
         print(f"\n✓ Results saved to {json_path}")
         print(f"  - New files processed: {new_files_count}")
-        print(f"  - Total processed files: {len(result_data['complete'])}")
-        print(f"  - Total terms: {len(result_data['term'])}")
+        print(f"  - New terms: {new_terms_count}")
+        print(f"  - Total processed files: {len(hashes)}")
+        print(f"  - Total terms: {len(terms)}")
     except Exception as ex:
         print(f"Error saving JSON file {json_path}: {ex}", file=sys.stderr)
 